@@ -108,8 +108,8 @@ class ExploitativeProbabilisticInterleave(AbstractInterleavedComparison):
     def _get_source_probability_of_list(self, l, a, query):
         p_l = 1.0
         (_, r1, r2) = a
-        r1.init_ranking(query)
-        r2.init_ranking(query)
+        r1.reset_ranking(query)
+        r2.reset_ranking(query)
         for _, doc in enumerate(l):
             p_r1 = r1.get_document_probability(doc)
             p_r2 = r2.get_document_probability(doc)
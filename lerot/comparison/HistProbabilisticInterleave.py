@@ -105,15 +105,15 @@ class HistProbabilisticInterleave(AbstractHistInterleavedComparison):
             query)
         if orig_p == 0:
             return .0
-        r2.init_ranking(query)
+        r2.reset_ranking(query)
 
         return outcome * target_p / orig_p
 
     def _get_probability_of_list_and_assignment(self, l, a, r1, r2, query):
         # P(l) = \prod_{doc in result_list} 1/2 P_1(doc) + 1/2 P_2(doc)
         p_l_a = 1.0
-        r1.init_ranking(query)
-        r2.init_ranking(query)
+        r1.reset_ranking(query)
+        r2.reset_ranking(query)
         for i, doc in enumerate(l):
             if a[i] == -1:
                 p_d = r1.get_document_probability(doc)
@@ -17,9 +17,12 @@ import random
 import argparse
 import numpy as np
 import math
-from utils import split_arg_str
-from OptimizedInterleave import OptimizedInterleave
-import gurobipy
+from ..utils import split_arg_str
+from .OptimizedInterleave import OptimizedInterleave
+try:
+    import gurobipy
+except ImportError:
+    gurobipy = None
 import os
 
 
@@ -38,6 +41,8 @@ class OptimizedMultileave(OptimizedInterleave):
     """
 
     def __init__(self, arg_str=""):
+        if gurobipy is None:
+            raise ImportError("OptimizedMultileave requires gurobipy")
         OptimizedInterleave.__init__(self, arg_str)
         parser = argparse.ArgumentParser(description=self.__doc__,
                                          prog=self.__class__.__name__)
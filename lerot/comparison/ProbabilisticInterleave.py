@@ -96,8 +96,9 @@ class ProbabilisticInterleave(AbstractInterleavedComparison):
         if not len(click_ids[0]):  # no clicks, will be a tie
             return 0, 0
 
-        r1.init_ranking(query)
-        r2.init_ranking(query)
+        # undo the removals of interleave, without ranking again
+        r1.reset_ranking(query)
+        r2.reset_ranking(query)
 
         # enumerate all possible assignments that go with l, add their
         # outcomes weighted by probabilities
@@ -186,8 +187,8 @@ class ProbabilisticInterleave(AbstractInterleavedComparison):
         # P(l) = \prod_{doc in result_list} 1/2 P_1(doc) + 1/2 P_2(doc)
         p_l = 1.0
         (_, r1, r2) = context
-        r1.init_ranking(query)
-        r2.init_ranking(query)
+        r1.reset_ranking(query)
+        r2.reset_ranking(query)
         for _, doc in enumerate(result_list):
             p_r1 = r1.get_document_probability(doc)
             p_r2 = r2.get_document_probability(doc)
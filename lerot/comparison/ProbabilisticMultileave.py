@@ -125,7 +125,7 @@ class ProbabilisticMultileave(AbstractInterleavedComparison):
             return [1] * len(rankers)
 
         for r in rankers:
-            r.init_ranking(query)
+            r.reset_ranking(query)
         p = self.probability_of_list(l, rankers, click_ids)
 
         creds = self.credits_of_list(p)
@@ -146,13 +146,7 @@ class ProbabilisticMultileave(AbstractInterleavedComparison):
         RETURN:
         - a list containing the rank in the ranker for each of the documents
         '''
-        ranks = [None] * len(documents)
-        docsInRanker = ranker.docids
-
-        for i, d in enumerate(documents):
-            if d in docsInRanker:
-                ranks[i] = docsInRanker.index(d) + 1
-        return ranks
+        return [ranker.get_document_rank(d) for d in documents]
 
     def probability_of_list(self, result_list, rankers, clickedDocs):
         '''
@@ -166,7 +160,7 @@ class ProbabilisticMultileave(AbstractInterleavedComparison):
          that the list comes from each ranker
         '''
         tau = 0.3
-        n = len(rankers[0].docids)
+        n = rankers[0].document_count()
         sigmoid_total = np.sum(float(n) / (np.arange(n) + 1) ** tau)
         sigmas = np.zeros([len(clickedDocs), len(rankers)])
         for i, r in enumerate(rankers):
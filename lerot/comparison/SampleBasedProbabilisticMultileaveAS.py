@@ -122,7 +122,7 @@ class SampleBasedProbabilisticMultileaveAS(AbstractInterleavedComparison):
             return np.ones((len(rankers),len(rankers)))/2.0
 
         for r in rankers:
-            r.init_ranking(query)
+            r.reset_ranking(query)
 
         root = SimpleTree(None, 0.0, [0]*len(rankers))  # root
         nextLevel = [root]
@@ -178,13 +178,7 @@ class SampleBasedProbabilisticMultileaveAS(AbstractInterleavedComparison):
         RETURN:
         - a list containing the rank in the ranker for each of the documents
         '''
-        ranks = [None] * len(documents)
-        docsInRanker = ranker.docids
-
-        for i, d in enumerate(documents):
-            if d in docsInRanker:
-                ranks[i] = docsInRanker.index(d) + 1
-        return ranks
+        return [ranker.get_document_rank(d) for d in documents]
 
     def probability_of_list(self, result_list, rankers, clickedDocs):
         '''
@@ -198,7 +192,7 @@ class SampleBasedProbabilisticMultileaveAS(AbstractInterleavedComparison):
          that the list comes from each ranker
         '''
         tau = 0.3
-        n = len(rankers[0].docids)
+        n = rankers[0].document_count()
         sigmoid_total = np.sum(float(n) / (np.arange(n) + 1) ** tau)
         sigmas = np.zeros([len(clickedDocs), len(rankers)])
         for i, r in enumerate(rankers):
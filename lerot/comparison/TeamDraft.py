@@ -38,8 +38,8 @@ class TeamDraft(AbstractInterleavedComparison):
         l, a = [], []
         # get ranked list for each ranker
 
-        l1 = r1.docids[:length]
-        l2 = r2.docids[:length]
+        l1 = r1.getDocs(length)
+        l2 = r2.getDocs(length)
         i1, i2 = 0, 0
 #        for i in range(length):
 #            l1.append(r1.next())
@@ -17,57 +17,46 @@
 
 
 from .AbstractUserModel import AbstractUserModel
+from ..livinglabs import LivingLabsClient
 
-import requests
 import json
+import logging
 import time
+# the first strptime call imports _strptime, which fails when it happens in
+# several threads at once
+import _strptime
 from numpy import asarray
-from time import strftime, strptime, localtime, sleep
-import sys
+from time import strftime, strptime, localtime
 
 
 class LivingLabsRealUser(AbstractUserModel):
-            
+    """Clicks of real users of a living-labs site: rankings are uploaded as
+    runs and clicks are taken from the feedback on those runs. Runs for many
+    queries can be uploaded and polled for feedback concurrently with
+    upload_runs and wait_for_clicks (see LivingLabsClient for
+    max_connections and rate_limit)."""
+
     runs = {}
     __doc_ids__ = {}
     __reversed_docids__ = {}
-    __HOST__ = "http://living-labs.net:5000/api"
     KEY = "" #3061C7A142E10020-SNHXGT52ORZRQ3SC
-    
-    __QUERYENDPOINT__ = "participant/query"
-    __DOCENDPOINT__ = "participant/doc"
-    __DOCLISTENDPOINT__ = "participant/doclist"
-    __RUNENDPOINT__ = "participant/run"
-    __FEEDBACKENDPOINT__ = "participant/feedback"
-    
-    __HEADERS__ = {'content-type': 'application/json'}
-
-    
-    
-    def __init__(self, key, doc_ids):
+    TIME_FORMAT = "%a, %d %b %Y %H:%M:%S -0000"
+
+    def __init__(self, key, doc_ids, host=None, max_connections=8,
+                 rate_limit=None, client=None):
         self.KEY = key
         self.__doc_ids__ = doc_ids
         self.__reversed_docids__ = self.__get_Inverse_docids__(self.__doc_ids__)
-    
-    
-    
+        self.__client__ = client or LivingLabsClient(key, host=host,
+            max_connections=max_connections, rate_limit=rate_limit)
+
     def __get_feedback__(self, qid, runid):
         """
         Returns the feedback for a given query
         """
-        sleep(0.1)
-        while True:
-            try:
-                r = requests.get("/".join([self.__HOST__, self.__FEEDBACKENDPOINT__, self.KEY, qid, runid]), headers=self.__HEADERS__, timeout=180)
-                break
-            except (requests.exceptions.RequestException, requests.exceptions.ConnectionError) as e:
-                print e, 'Retrying....'
-                r = self.__get_feedback__(qid, runid)
-        if r.status_code != requests.codes.ok:
-            print r.text
-            r.raise_for_status()
-        return r.json()
-    
+        args = [qid] if runid is None else [qid, str(runid)]
+        url = self.__client__.get_url(self.__client__.FEEDBACK_ENDPOINT, *args)
+        return self.__client__.request("GET", url).json()
 
     def __get_Inverse_docids__(self, input_dict):
         """
@@ -78,98 +67,117 @@ class LivingLabsRealUser(AbstractUserModel):
         for qid in input_dict:
             return_dict[qid] = {v: k for k, v in input_dict[qid].items()}
         return return_dict
-    
-    
+
     def __lerot2LL_docids__(self, query, lerot_list):
         """
         Returns: List of living-labs doc ids coinciding with the lerot list entered
         """
-        return_list = []
-        for doc in lerot_list:
-            return_list.append({'docid' : self.__doc_ids__[query.get_qid()][doc.get_id()]})
-        return return_list
-    
-    
-    
+        doc_ids = self.__doc_ids__[query.get_qid()]
+        return [{'docid': doc_ids[doc.get_id()]} for doc in lerot_list]
+
     def __LL2lerot_docids__(self, query, LL_feedbacklist, lerot_list):
         """
         Returns list of clicks in lerot coinciding to lerot uploaded list e.g [0 0 0 1 0 0 0 0 0 0] 
         """
-        return_list = []
-        for doc2 in lerot_list:
-            common_doc = False#keep track if common document has been found
-            for doc1 in LL_feedbacklist['doclist']:
-                if doc2['docid'] == doc1['docid']:#If document ID is the same in both lists
-                    if doc1['clicked'] ==True and doc1['team'] == 'participant':#if the document was clicked, append 1 and break to next document in feedback
-                        return_list.append(1)
-                        common_doc = True
-                        break
-                    if doc1['clicked'] == False and doc1['team'] == 'participant':#if not clicked, append 0 and break to next document in feedback
-                        common_doc = True
-                        return_list.append(0)
-                        break
-            if common_doc == False:#if current docid is not within uploaded list, append 0 regardless
-                return_list.append(0)
-        return asarray(return_list)
-
+        # the first participant entry of a document in the feedback counts,
+        # documents that are not in the feedback are not clicked
+        clicked = {}
+        for doc in LL_feedbacklist['doclist']:
+            if doc['team'] == 'participant':
+                clicked.setdefault(doc['docid'], doc['clicked'] == True)
+        return asarray([1 if clicked.get(doc['docid']) else 0
+                        for doc in lerot_list])
 
     def get_win(self, query, feedback_list, lerot_ranked_list):
         """
         Used for seznam site which interleaves ranked list with it's own list
         Returns 'ranked list winner' with number of clicks of each ranker e.g. [0 2] where [lerot_list_score seznam_list_score]
         """
+        uploaded = set(doc['docid'] for doc in lerot_ranked_list['doclist'])
         ranker_winner = [0, 0]
-        for doc1 in feedback_list['doclist']:
-            for doc2 in lerot_ranked_list['doclist']:
-                if doc2['docid'] == doc1['docid']:#If document ID is the same in both lists
-                    if doc1['clicked'] == True and doc1['team'] == 'participant':#if the document was clicked, append
-                        ranker_winner[0] += 1
-                        break
-                    if doc1['clicked'] == False and doc1['team'] == 'participant':
-                        break
-            if doc1['clicked'] == True and doc1['team'] == 'site':
+        for doc in feedback_list['doclist']:
+            if doc['clicked'] == True and doc['team'] == 'participant' and \
+                    doc['docid'] in uploaded:
+                ranker_winner[0] += 1
+            if doc['clicked'] == True and doc['team'] == 'site':
                 ranker_winner[1] += 1
         return ranker_winner
 
-
-
     def upload_run(self, query, upload_list, runid):
         """
         Uploads a run to living-labs api. 
         """
         doc_list = self.__lerot2LL_docids__(query, upload_list)
         payload = {"runid": runid, "doclist": doc_list}
-        while True:
-            sleep(0.1)
-            try:
-                r = requests.put("/".join([self.__HOST__, self.__RUNENDPOINT__, self.KEY, query.get_qid()]), data=json.dumps(payload), headers=self.__HEADERS__)
-                break
-            except (requests.exceptions.RequestException, requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
-                print e, 'Retrying....'
-                r = self.upload_run(query, upload_list, runid)
-        if r.status_code != requests.codes.ok:
-            print r.text
-            r.raise_for_status()
-        the_time = strftime("%a, %d %b %Y %H:%M:%S -0000", localtime())
-        
-        return payload, the_time    
-        
-    
+        url = self.__client__.get_url(self.__client__.RUN_ENDPOINT,
+                                      query.get_qid())
+        self.__client__.request("PUT", url, data=json.dumps(payload))
+        the_time = strftime(self.TIME_FORMAT, localtime())
+        return payload, the_time
+
+    def upload_runs(self, uploads, runid):
+        """
+        Uploads runs for many queries concurrently. uploads is a list of
+        (query, upload_list) pairs, returns the (payload, upload time) of each
+        in the same order.
+        """
+        return self.__client__.map(
+            lambda (query, upload_list): self.upload_run(query, upload_list,
+                                                         runid), uploads)
+
     def get_clicks(self, result_list, labels, **kwargs):
-        time.sleep(0.1)
         """
         Returns the list of clicked documents from an uploaded lerot ranking list, and the feedback
         """
         query = kwargs['query']
-        upload_time = kwargs['upload_time']
+        upload_time = strptime(kwargs['upload_time'], self.TIME_FORMAT)
         lerot_ranked_list = kwargs['ranker_list']['doclist']
-        runid = kwargs['run_id']
-        qid = query.__qid__
+        runid = kwargs.get('run_id')
+        qid = query.get_qid()
         feedbacks = self.__get_feedback__(qid, runid)
         for feedback in feedbacks['feedback']:
-            if strptime(feedback['modified_time'], "%a, %d %b %Y %H:%M:%S -0000") >= strptime(upload_time, "%a, %d %b %Y %H:%M:%S -0000"):
-                print feedback
-                return feedback, self.__LL2lerot_docids__(query, feedback, lerot_ranked_list)
+            if strptime(feedback['modified_time'], self.TIME_FORMAT) >= \
+                    upload_time:
+                logging.debug("Feedback for %s: %s" % (qid, feedback))
+                return feedback, self.__LL2lerot_docids__(query, feedback,
+                                                          lerot_ranked_list)
         return None, None
-                        
-                    
\ No newline at end of file
+
+    def poll_clicks(self, uploads):
+        """
+        Checks for feedback on many uploaded runs concurrently. uploads maps
+        qid to the keyword arguments of get_clicks (query, ranker_list,
+        upload_time and run_id). Returns a dictionary qid -> (feedback,
+        clicks) for the queries that have feedback.
+        """
+        qids = list(uploads)
+        results = self.__client__.map(
+            lambda qid: self.get_clicks(None, None, **uploads[qid]), qids)
+        return dict((qid, result) for qid, result in zip(qids, results)
+                    if result[0] is not None)
+
+    def wait_for_clicks(self, uploads, min_results=1, interval=1.0,
+                        max_interval=60.0, timeout=None):
+        """
+        Polls for feedback (see poll_clicks) until at least min_results
+        queries have feedback, waiting interval seconds between rounds and
+        doubling that up to max_interval. Queries that got feedback are not
+        polled again. Returns whatever was found when timeout seconds have
+        passed.
+        """
+        pending = dict(uploads)
+        results = {}
+        start = time.time()
+        while True:
+            found = self.poll_clicks(pending)
+            results.update(found)
+            for qid in found:
+                del pending[qid]
+            if not pending or len(results) >= min_results:
+                break
+            if timeout is not None and time.time() - start + interval > \
+                    timeout:
+                break
+            time.sleep(interval)
+            interval = min(interval * 2, max_interval)
+        return results
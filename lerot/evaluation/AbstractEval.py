@@ -15,14 +15,24 @@
 
 # KH, 2012/06/20
 
-from random import sample
-from numpy import mean
+from itertools import izip
+from numpy import asarray, dot, mean, ndarray, power
+
+from ..query import DCG_DISCOUNTS
+from ..utils import rank_order
 
 
 class AbstractEval:
     """Abstract base class for computing evaluation metrics for given relevance
     labels."""
 
+    # name of the rank discount in query.DCG_DISCOUNTS that get_dcg uses, this
+    # allows evaluate_ranking to look up the ideal DCG in the per-query tables
+    # that are built when queries are loaded. Metrics that leave this at None
+    # compute the ideal DCG with get_dcg
+    discount = None
+    __discounts__ = None
+
     def __init__(self):
         self.prev_solution_w = None
         self.prev_score = None
@@ -31,9 +41,20 @@ class AbstractEval:
         if self.prev_solution_w != None and (self.prev_solution_w ==
                                              solution.w).all():
             return self.prev_score
+        if hasattr(queries, "keeps_feature_matrix") and \
+                queries.keeps_feature_matrix() and hasattr(solution,
+                                                           "score_batch"):
+            # score all queries with one call to the ranking model; lazily
+            # loaded queries without a binary cache are scored one by one,
+            # so that each query is only loaded once
+            features, offsets = queries.get_feature_matrix()
+            all_scores = solution.score_batch(features, offsets)
+        else:
+            all_scores = (solution.score(query.get_feature_vectors())
+                          for query in queries)
         outcomes = []
-        for query in queries:
-            outcomes.append(self.evaluate_one(solution, query, cutoff, ties))
+        for query, scores in izip(queries, all_scores):
+            outcomes.append(self.evaluate_scores(scores, query, cutoff, ties))
         score = mean(outcomes)
 
         self.prev_solution_w = solution.w
@@ -42,9 +63,14 @@ class AbstractEval:
         return score
 
     def evaluate_one(self, solution, query, cutoff=-1, ties="random"):
-        scores = solution.score(query.get_feature_vectors())
-        sorted_docs = self._sort_docids_by_score(query.get_docids(), scores,
-            ties=ties)
+        return self.evaluate_scores(solution.score(
+            query.get_feature_vectors()), query, cutoff, ties)
+
+    def evaluate_scores(self, scores, query, cutoff=-1, ties="random"):
+        """Evaluate the ranking of the documents of query by scores."""
+        # rank docids as integers, no Document objects are needed here
+        sorted_docs = self._sort_docids_by_score(query.get_docid_array(),
+            scores, ties=ties)
         return self.evaluate_ranking(sorted_docs, query, cutoff)
 
     def evaluate_ranking(self, ranking, query, cutoff=-1):
@@ -53,12 +79,12 @@ class AbstractEval:
         if cutoff == -1 or cutoff > len(ranking):
             cutoff = len(ranking)
 
-        if query.has_ideal():
-            ideal_dcg = query.get_ideal()
+        label_index = query.get_label_index()
+        if self.discount is None:
+            ideal_dcg = self.get_dcg(
+                label_index.sorted_labels[:cutoff].tolist(), cutoff)
         else:
-            ideal_labels = list(reversed(sorted(query.get_labels())))[:cutoff]
-            ideal_dcg = self.get_dcg(ideal_labels, cutoff)
-            query.set_ideal(ideal_dcg)
+            ideal_dcg = label_index.get_ideal_dcg(cutoff, self.discount)
 
         if ideal_dcg == .0:
             # return 0 when there are no relevant documents. This is consistent
@@ -67,22 +93,27 @@ class AbstractEval:
             return 0.0
 
         # get labels for the sorted docids
-        sorted_labels = [0] * cutoff
-        for i in range(cutoff):
-            sorted_labels[i] = query.get_label(ranking[i])
-        dcg = self.get_dcg(sorted_labels, cutoff)
+        if isinstance(ranking, ndarray):
+            rows = ranking[:cutoff]
+        else:
+            rows = [getattr(docid, "docid", docid)
+                    for docid in ranking[:cutoff]]
+        sorted_labels = asarray(query.get_labels())[rows]
+        if self.discount is None:
+            dcg = self.get_dcg(sorted_labels.tolist(), cutoff)
+        else:
+            dcg = dot(power(2.0, sorted_labels) - 1,
+                      self._get_discounts(cutoff))
 
         return dcg / ideal_dcg
 
+    def _get_discounts(self, cutoff):
+        if self.__discounts__ is None or len(self.__discounts__) < cutoff:
+            self.__discounts__ = DCG_DISCOUNTS[self.discount](cutoff)
+        return self.__discounts__[:cutoff]
+
     def _sort_docids_by_score(self, docids, scores, ties="random"):
-        n = len(docids)
-        if ties == "first":
-            scored_docids = zip(scores, reversed(range(n)), docids)
-        elif ties == "last":
-            scored_docids = zip(scores, range(n), docids)
-        elif ties == "random":
-            scored_docids = zip(scores, sample(range(n), n), docids)
-        else:
-            raise Exception("Unknown method for breaking ties: \"%s\"" % ties)
-        scored_docids.sort(reverse=True)
-        return [docid for _, _, docid in scored_docids]
+        order = rank_order(scores, ties)
+        if isinstance(docids, ndarray):
+            return docids[order]
+        return [docids[i] for i in order]
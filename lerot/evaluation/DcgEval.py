@@ -21,6 +21,8 @@ from .AbstractEval import AbstractEval
 class DcgEval(AbstractEval):
     """Compute DCG (with gain = 2**rel-1 and log2 discount)."""
 
+    discount = "log2"
+
     def get_dcg(self, ranked_labels, cutoff=-1):
         if (cutoff == -1):
             cutoff = len(ranked_labels)
@@ -23,6 +23,8 @@ from .AbstractEval import AbstractEval
 class LetorNdcgEval(AbstractEval):
     """Compute NDCG as implemented in the Letor toolkit."""
 
+    discount = "letor"
+
     def get_dcg(self, labels, cutoff=-1):
         if (cutoff == -1):
             cutoff = len(labels)
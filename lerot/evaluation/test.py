@@ -17,9 +17,13 @@ import unittest
 import sys
 import os
 import cStringIO
+import shutil
+import tempfile
 import numpy as np
 
-from lerot.query import Queries
+from lerot.query import LazyQueries, Queries
+from lerot.ranker.DeterministicRankingFunction import \
+    DeterministicRankingFunction
 from lerot.evaluation.LetorNdcgEval import LetorNdcgEval
 from lerot.evaluation.NdcgEval import NdcgEval
 
@@ -147,6 +151,73 @@ class TestEvaluation(unittest.TestCase):
         self.assertAlmostEquals(0.5081831, ev.evaluate_one(self.zero_weights,
             self.query, ties="last"))
 
+    def testEvaluateRankingCutoffs(self):
+        # the ideal dcg depends on the cutoff, evaluating at one cutoff must
+        # not affect later evaluations at another
+        for ev in [NdcgEval(), LetorNdcgEval()]:
+            ranking = [2, 1, 0, 3]
+            for cutoff in [1, 2, 4, 2, 1]:
+                ideal = ev.get_dcg([4, 1, 0, 0][:cutoff], cutoff)
+                expected = ev.get_dcg([0, 1, 4, 0][:cutoff], cutoff) / ideal
+                self.assertAlmostEqual(expected, ev.evaluate_ranking(ranking,
+                    self.query, cutoff=cutoff))
+
+    def testLabelIndex(self):
+        # the index is built on first use
+        self.assertIsNone(self.query.__label_index__)
+        label_index = self.query.get_label_index()
+        self.assertEqual([4, 1, 0, 0], label_index.sorted_labels.tolist())
+        self.assertEqual({0: 2, 1: 1, 4: 1}, label_index.get_histogram())
+        ev = LetorNdcgEval()
+        for cutoff in range(1, 5):
+            self.assertAlmostEqual(ev.get_dcg([4, 1, 0, 0], cutoff),
+                label_index.get_ideal_dcg(cutoff, "letor"))
+        # and rebuilt when labels are set
+        self.query.set_labels(np.array([0, 2, 0, 0]))
+        self.assertEqual([2, 0, 0, 0],
+            self.query.get_label_index().sorted_labels.tolist())
+
+    def testEvaluateAllBatch(self):
+        queries = Queries(cStringIO.StringIO("""
+        4 qid:1 1:2.6 2:1 3:2.1 4:0 5:2 6:1.4
+        1 qid:1 1:1.2 2:1 3:2.9 4:0 5:2 6:1.9
+        0 qid:1 1:0.5 2:1 3:2.3 4:0 5:2 6:5.6
+        2 qid:2 1:0.1 2:3 3:0.3 4:1 5:0 6:0.2
+        0 qid:2 1:0.9 2:0 3:1.3 4:1 5:1 6:0.7
+        """), self.test_num_features)
+        ranker = DeterministicRankingFunction(["ranker.model.Linear"],
+            "first", self.test_num_features, init="1,0,-1,0,0,0.5")
+        ev = NdcgEval()
+        expected = np.mean([ev.evaluate_one(ranker, query, ties="first")
+                            for query in queries])
+        self.assertAlmostEqual(expected, ev.evaluate_all(ranker, queries,
+                                                         ties="first"))
+
+    def testEvaluateAllLazy(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, "queries.txt")
+            with open(filename, "w") as fh:
+                fh.write("4 qid:1 1:2.6 2:1 3:2.1 4:0 5:2 6:1.4\n"
+                         "0 qid:1 1:0.5 2:1 3:2.3 4:0 5:2 6:5.6\n"
+                         "2 qid:2 1:0.1 2:3 3:0.3 4:1 5:0 6:0.2\n"
+                         "0 qid:2 1:0.9 2:0 3:1.3 4:1 5:1 6:0.7\n")
+            queries = LazyQueries(filename, self.test_num_features,
+                                  max_queries=1)
+            self.assertFalse(queries.keeps_feature_matrix())
+            # without a binary cache, queries are scored one by one instead
+            # of loading all of them for one matrix
+            queries.get_feature_matrix = None
+            ranker = DeterministicRankingFunction(["ranker.model.Linear"],
+                "first", self.test_num_features, init="1,0,-1,0,0,0.5")
+            ev = NdcgEval()
+            expected = np.mean([ev.evaluate_one(ranker, query, ties="first")
+                                for query in queries])
+            self.assertAlmostEqual(expected, ev.evaluate_all(ranker, queries,
+                                                             ties="first"))
+        finally:
+            shutil.rmtree(tmp_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
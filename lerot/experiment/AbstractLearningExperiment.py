@@ -13,12 +13,15 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
-import random
+from ..querysampler import QUERY_SAMPLING_METHODS
 from ..utils import get_class
 
 
 class AbstractLearningExperiment:
 
+    query_sampler = None
+    query_sampling_args = ""
+
     def __init__(self, training_queries, test_queries, feature_count, log_fh,
             args):
         """Initialize an experiment using the provided arguments."""
@@ -29,6 +32,8 @@ class AbstractLearningExperiment:
         # construct system according to provided arguments
         self.num_queries = args["num_queries"]
         self.query_sampling_method = args["query_sampling_method"]
+        if "query_sampling_args" in args:
+            self.query_sampling_args = args["query_sampling_args"]
         self.um_class = get_class(args["user_model"])
         self.um_args = args["user_model_args"]
         self.um = self.um_class(self.um_args)
@@ -41,17 +46,19 @@ class AbstractLearningExperiment:
         for evaluation in args["evaluation"]:
             self.evaluation_class = get_class(evaluation)
             self.evaluations[evaluation] = self.evaluation_class()
-        self.queryid = None
-
-    def _sample_qid(self, query_keys, query_count, query_length):
-            if self.query_sampling_method == "random":
-                return query_keys[random.randint(0, query_length - 1)]
-            elif self.query_sampling_method == "fixed":
-                return query_keys[query_count % query_length]
-            elif self.query_sampling_method == "one":
-                if self.queryid == None:
-                    self.queryid = random.randrange(query_length)
-                return query_keys[self.queryid]
+
+    def _get_query_sampler(self):
+        """Create the query sampler selected by query_sampling_method (see
+        querysampler.QUERY_SAMPLING_METHODS)."""
+        method = QUERY_SAMPLING_METHODS.get(self.query_sampling_method,
+                                            self.query_sampling_method)
+        return get_class(method)(self.training_queries,
+                                 self.query_sampling_args)
+
+    def _sample_qid(self):
+        if self.query_sampler is None:
+            self.query_sampler = self._get_query_sampler()
+        return self.query_sampler.next()
 
     def run(self):
         raise NotImplementedError("Derived class needs to implement run.")
@@ -24,6 +24,11 @@ from ..query import load_queries
 from ..utils import get_class
 
 
+def _run_experiment(experiment, run_id):
+    # bound methods cannot be pickled and sent to worker processes
+    return experiment._run(run_id)
+
+
 class GenericExperiment:
     def __init__(self, args_str=None):
         # parse arguments
@@ -114,6 +119,8 @@ class GenericExperiment:
         # set default values for optional arguments
         if not "query_sampling_method" in self.experiment_args:
             self.experiment_args["query_sampling_method"] = "random"
+        if not "query_sampling_args" in self.experiment_args:
+            self.experiment_args["query_sampling_args"] = ""
         if not "output_dir_overwrite" in self.experiment_args:
             self.experiment_args["output_dir_overwrite"] = False
         if not "experimenter" in self.experiment_args:
@@ -122,6 +129,24 @@ class GenericExperiment:
             self.experiment_args["evaluation"] = "evaluation.NdcgEval"
         if not "processes" in self.experiment_args:
             self.experiment_args["processes"] = 0
+        if not "cache_queries" in self.experiment_args:
+            # the cache is written next to the query files, so only when
+            # asked for
+            self.experiment_args["cache_queries"] = False
+        if not "mmap_queries" in self.experiment_args:
+            # share one copy of the (cached) data between worker processes
+            self.experiment_args["mmap_queries"] = \
+                self.experiment_args["cache_queries"] and \
+                self.experiment_args["processes"] > 1
+        if not "lazy_queries" in self.experiment_args:
+            self.experiment_args["lazy_queries"] = False
+        if not "loader_processes" in self.experiment_args:
+            self.experiment_args["loader_processes"] = 1
+        if not "normalize_queries" in self.experiment_args:
+            self.experiment_args["normalize_queries"] = "none"
+        if not "query_dtype" in self.experiment_args:
+            # float32 halves the memory needed for feature matrices
+            self.experiment_args["query_dtype"] = "float64"
 
         # locate or create directory for the current fold
         if not os.path.exists(self.experiment_args["output_dir"]):
@@ -153,12 +178,30 @@ class GenericExperiment:
         training_file = self.experiment_args["training_queries"]
         test_file = self.experiment_args["test_queries"]
         self.feature_count = self.experiment_args["feature_count"]
+        cache_queries = self.experiment_args["cache_queries"]
+        mmap_queries = self.experiment_args["mmap_queries"]
+        lazy_queries = self.experiment_args["lazy_queries"]
+        loader_processes = self.experiment_args["loader_processes"]
+        normalize_queries = self.experiment_args["normalize_queries"]
+        query_dtype = self.experiment_args["query_dtype"]
         logging.info("Loading training data: %s " % training_file)
-        self.training_queries = load_queries(training_file, self.feature_count)
+        self.training_queries = load_queries(training_file, self.feature_count,
+                                             cache=cache_queries,
+                                             mmap=mmap_queries,
+                                             lazy=lazy_queries,
+                                             processes=loader_processes,
+                                             normalize=normalize_queries,
+                                             dtype=query_dtype)
         logging.info("... found %d queries." %
             self.training_queries.get_size())
         logging.info("Loading test data: %s " % test_file)
-        self.test_queries = load_queries(test_file, self.feature_count)
+        self.test_queries = load_queries(test_file, self.feature_count,
+                                         cache=cache_queries,
+                                         mmap=mmap_queries,
+                                         lazy=lazy_queries,
+                                         processes=loader_processes,
+                                         normalize=normalize_queries,
+                                         dtype=query_dtype)
         logging.info("... found %d queries." % self.test_queries.get_size())
 
         # initialize and run the experiment num_run times
@@ -172,7 +215,7 @@ class GenericExperiment:
             from multiprocessing import Pool
             pool = Pool(processes=self.experiment_args["processes"])
             for run_count in range(self.num_runs):
-                pool.apply_async(self._run, (run_count,))
+                pool.apply_async(_run_experiment, (self, run_count))
             pool.close()
             pool.join()
         else:
@@ -26,6 +26,7 @@ from numpy import log, mean, zeros
 from scipy.stats import kendalltau
 
 from .. import evaluation
+from ..querysampler import QUERY_SAMPLING_METHODS
 from ..utils import get_class
 
 
@@ -44,6 +45,9 @@ class HistoricalComparisonExperiment():
         self.result_length = args["result_length"]
         self.num_queries = args["num_queries"]
         self.query_sampling_method = args["query_sampling_method"]
+        self.query_sampler = get_class(QUERY_SAMPLING_METHODS.get(
+            self.query_sampling_method, self.query_sampling_method))(
+            self.queries, args.get("query_sampling_args", ""))
         self.um_class = get_class(args["user_model"])
         self.um_args = args["user_model_args"]
         self.um = self.um_class(self.um_args)
@@ -124,11 +128,8 @@ class HistoricalComparisonExperiment():
                     self._get_ranker_pair(ranker, ranker_args,
                     self.target_pair, self.feature_count, self.ties)
 
-    def _sample_qid(self, query_keys, query_count, query_length):
-            if self.query_sampling_method == "random":
-                return query_keys[random.randint(0, query_length - 1)]
-            elif self.query_sampling_method == "fixed":
-                return query_keys[query_count % query_length]
+    def _sample_qid(self):
+        return self.query_sampler.next()
 
     def _sample_ranker_without_replacement(self, num_features, exclude):
         while True:
@@ -180,8 +181,6 @@ class HistoricalComparisonExperiment():
 
     def run(self):
         """Run the experiment for num_queries queries."""
-        query_keys = sorted(self.queries.keys())
-        query_length = len(query_keys)
         # for bookkeeping
         query_ids = []
         ndcg_diffs = []
@@ -209,7 +208,7 @@ class HistoricalComparisonExperiment():
             hist_click_counts[method_id] = []
         # process num_queries queries
         for query_count in range(self.num_queries):
-            qid = self._sample_qid(query_keys, query_count, query_length)
+            qid = self._sample_qid()
             query_ids.append(qid)
             query = self.queries[qid]
             o1 = self.ndcg.evaluate_one(prob_tar_rankers[0].w, query, -1,
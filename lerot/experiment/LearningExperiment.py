@@ -35,9 +35,6 @@ class LearningExperiment(AbstractLearningExperiment):
 
     def run(self):
         """Run the experiment num_runs times."""
-        query_keys = sorted(self.training_queries.keys())
-        query_length = len(query_keys)
-
         online_evaluation = {}
         offline_test_evaluation = {}
         offline_train_evaluation = {}
@@ -50,7 +47,7 @@ class LearningExperiment(AbstractLearningExperiment):
         # process num_queries queries
         for query_count in range(self.num_queries):
             previous_solution_w = self.system.get_solution().w
-            qid = self._sample_qid(query_keys, query_count, query_length)
+            qid = self._sample_qid()
             query = self.training_queries[qid]
             # get result list for the current query from the system
             result_list = self.system.get_ranked_list(query)
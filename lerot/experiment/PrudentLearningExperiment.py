@@ -43,15 +43,13 @@ class PrudentLearningExperiment(AbstractLearningExperiment):
     
     def run(self):
         """Run the experiment num_runs times."""
-        query_keys = sorted(self.training_queries.keys())
-        query_length = len(query_keys)
         summary = {}
         self.system.alpha = self.system.delta
         
         # process num_queries queries
         for query_count in range(self.num_queries):
             #previous_solution_w = self.system.get_solution().w
-            qid = self._sample_qid(query_keys, query_count, query_length)
+            qid = self._sample_qid()
             query = self.training_queries[qid]
             num_comparisons = 101
             outcomes = zeros(num_comparisons)
@@ -33,12 +33,10 @@ class SamplingExperiment(AbstractLearningExperiment):
 
     def run(self):
         """Run the experiment num_runs times."""
-        query_keys = sorted(self.training_queries.keys())
-        query_length = len(query_keys)
         out_str = ""
         # process num_queries queries
         for query_count in range(self.num_queries):
-            qid = self._sample_qid(query_keys, query_count, query_length)
+            qid = self._sample_qid()
             query = self.training_queries[qid]
             # get result list for the current query from the system
             result_list, i1s, i2s = self.system.get_ranked_list(query)
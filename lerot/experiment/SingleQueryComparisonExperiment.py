@@ -26,16 +26,28 @@ class SingleQueryComparisonExperiment():
         self.query_dir = query_dir
         self.feature_count = feature_count
         self.ties = "first"
-        # randomly select a query file, and load a single query from that file
+        # randomly select a query file, and load a single query from that
+        # file. query_dir can also be a single (gzipped) file with all
+        # queries, a random query is then read using the query index
+        if os.path.isdir(query_dir):
+            query_files = [name for name in os.listdir(query_dir)
+                           if ".lerot-" not in name]
+        else:
+            queries = load_queries(query_dir, feature_count, lazy=True)
         count_attempts = 0
         while not hasattr(self, "query"):
             count_attempts += 1
             if count_attempts > 100:
                 raise ValueError("Did not find a query with more than one "
                     "relevance levels after 100 attempts.")
-            query_file = os.path.join(query_dir, choice(os.listdir(query_dir)))
-            logging.info("Loading query %s." % query_file)
-            query = load_queries(query_file, feature_count).values()[0]
+            if os.path.isdir(query_dir):
+                query_file = os.path.join(query_dir, choice(query_files))
+                logging.info("Loading query %s." % query_file)
+                query = load_queries(query_file, feature_count).values()[0]
+            else:
+                qid = choice(queries.keys())
+                logging.info("Loading query %s from %s." % (qid, query_dir))
+                query = queries[qid]
             if "check_queries" in args and args["check_queries"]:
                 # make sure that there's at least two different relevance
                 # grades
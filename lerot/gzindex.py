@@ -0,0 +1,309 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Random access into gzip files, following examples/zran.c from the zlib
+distribution. One pass over the file records access points at deflate block
+boundaries (about every span bytes of uncompressed data): the compressed and
+uncompressed offsets, the bit offset and the 32K of uncompressed data before
+the point. Reading from an offset then only inflates from the closest
+preceding access point.
+
+The python zlib module cannot resume inflation at a bit offset, so libz is
+used through ctypes. If it cannot be loaded, is_available() returns False.
+"""
+
+import ctypes
+import ctypes.util
+import zlib
+
+import numpy as np
+
+__all__ = ['GzipIndex', 'GzipIndexBuilder', 'build_gzip_index',
+           'is_available']
+
+WINDOW_SIZE = 32768
+CHUNK_SIZE = 1 << 16
+
+Z_OK = 0
+Z_STREAM_END = 1
+Z_BUF_ERROR = -5
+Z_NO_FLUSH = 0
+Z_BLOCK = 5
+# window bits for raw deflate data, and for automatic gzip/zlib header
+# detection
+RAW_WINDOW_BITS = -15
+AUTO_WINDOW_BITS = 47
+
+
+class _ZStream(ctypes.Structure):
+    _fields_ = [("next_in", ctypes.POINTER(ctypes.c_ubyte)),
+                ("avail_in", ctypes.c_uint),
+                ("total_in", ctypes.c_ulong),
+                ("next_out", ctypes.POINTER(ctypes.c_ubyte)),
+                ("avail_out", ctypes.c_uint),
+                ("total_out", ctypes.c_ulong),
+                ("msg", ctypes.c_char_p),
+                ("state", ctypes.c_void_p),
+                ("zalloc", ctypes.c_void_p),
+                ("zfree", ctypes.c_void_p),
+                ("opaque", ctypes.c_void_p),
+                ("data_type", ctypes.c_int),
+                ("adler", ctypes.c_ulong),
+                ("reserved", ctypes.c_ulong)]
+
+
+def _load_libz():
+    try:
+        libz = ctypes.CDLL(ctypes.util.find_library("z") or "libz.so.1")
+        stream = ctypes.POINTER(_ZStream)
+        libz.zlibVersion.restype = ctypes.c_char_p
+        libz.inflateInit2_.argtypes = [stream, ctypes.c_int, ctypes.c_char_p,
+                                       ctypes.c_int]
+        libz.inflate.argtypes = [stream, ctypes.c_int]
+        libz.inflateEnd.argtypes = [stream]
+        libz.inflateReset.argtypes = [stream]
+        libz.inflatePrime.argtypes = [stream, ctypes.c_int, ctypes.c_int]
+        libz.inflateSetDictionary.argtypes = [stream, ctypes.c_char_p,
+                                              ctypes.c_uint]
+        libz.zlibVersion()
+        return libz
+    except (OSError, AttributeError):
+        return None
+
+_libz = _load_libz()
+
+
+def is_available():
+    """Whether libz could be loaded, without it no index can be used."""
+    return _libz is not None
+
+
+class _Inflater:
+    """A libz inflate stream with its own input and output buffers."""
+
+    def __init__(self, window_bits):
+        self.strm = _ZStream()
+        self.__check__(_libz.inflateInit2_(ctypes.byref(self.strm),
+            window_bits, _libz.zlibVersion(), ctypes.sizeof(_ZStream)))
+        self.in_buf = ctypes.create_string_buffer(CHUNK_SIZE)
+        self.out_buf = ctypes.create_string_buffer(CHUNK_SIZE)
+
+    def __check__(self, ret):
+        if ret not in (Z_OK, Z_STREAM_END, Z_BUF_ERROR):
+            raise IOError("Could not inflate gzip data (zlib error %d: %s)" %
+                          (ret, self.strm.msg))
+        return ret
+
+    def feed(self, data):
+        """Provide the next input, only when all input has been used."""
+        ctypes.memmove(self.in_buf, data, len(data))
+        self.strm.next_in = ctypes.cast(self.in_buf,
+                                        ctypes.POINTER(ctypes.c_ubyte))
+        self.strm.avail_in = len(data)
+
+    def unused_input(self):
+        return ctypes.string_at(self.strm.next_in, self.strm.avail_in)
+
+    def inflate(self, flush=Z_NO_FLUSH):
+        """Inflate as much as fits in the output buffer, returns the zlib
+        return code and the uncompressed data."""
+        self.strm.next_out = ctypes.cast(self.out_buf,
+                                         ctypes.POINTER(ctypes.c_ubyte))
+        self.strm.avail_out = CHUNK_SIZE
+        ret = self.__check__(_libz.inflate(ctypes.byref(self.strm), flush))
+        return ret, ctypes.string_at(self.out_buf,
+                                     CHUNK_SIZE - self.strm.avail_out)
+
+    def prime(self, bits, value):
+        self.__check__(_libz.inflatePrime(ctypes.byref(self.strm), bits,
+                                          value))
+
+    def set_dictionary(self, window):
+        self.__check__(_libz.inflateSetDictionary(ctypes.byref(self.strm),
+                                                  window, len(window)))
+
+    def reset(self):
+        self.__check__(_libz.inflateReset(ctypes.byref(self.strm)))
+
+    def close(self):
+        _libz.inflateEnd(ctypes.byref(self.strm))
+
+
+def _next_member(inflater, fh):
+    """After the end of a gzip member was reached by an inflater that parses
+    gzip headers, prepare it for the next member. Returns False at the end of
+    the file."""
+    rest = inflater.unused_input() or fh.read(CHUNK_SIZE)
+    if not rest:
+        return False
+    inflater.reset()
+    inflater.feed(rest)
+    return True
+
+
+class GzipIndex:
+    """Access points into a gzip file, see build_gzip_index."""
+
+    def __init__(self, in_offsets, out_offsets, bits, windows,
+                 window_offsets):
+        self.in_offsets = np.asarray(in_offsets, dtype=np.int64)
+        self.out_offsets = np.asarray(out_offsets, dtype=np.int64)
+        self.bits = np.asarray(bits, dtype=np.int64)
+        # zlib compressed windows, concatenated
+        self.windows = np.asarray(windows, dtype=np.uint8)
+        self.window_offsets = np.asarray(window_offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.in_offsets)
+
+    def to_arrays(self):
+        return {"in_offsets": self.in_offsets,
+                "out_offsets": self.out_offsets, "bits": self.bits,
+                "windows": self.windows,
+                "window_offsets": self.window_offsets}
+
+    def get_window(self, point):
+        start, end = self.window_offsets[point:point + 2]
+        return zlib.decompress(self.windows[start:end].tostring())
+
+    def read(self, fh, offset, length):
+        """Read length bytes of uncompressed data, starting at offset, from
+        the (binary) file handle of the indexed gzip file."""
+        if length <= 0:
+            return ""
+        point = max(np.searchsorted(self.out_offsets, offset, "right") - 1,
+                    0)
+        bits = int(self.bits[point])
+        inflater = _Inflater(RAW_WINDOW_BITS)
+        try:
+            fh.seek(self.in_offsets[point] - (1 if bits else 0))
+            if bits:
+                inflater.prime(bits, ord(fh.read(1)) >> (8 - bits))
+            window = self.get_window(point)
+            if window:
+                inflater.set_dictionary(window)
+            skip = offset - self.out_offsets[point]
+            parts = []
+            while length > 0:
+                if inflater.strm.avail_in == 0:
+                    data = fh.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    inflater.feed(data)
+                ret, out = inflater.inflate()
+                if skip >= len(out):
+                    skip -= len(out)
+                else:
+                    out = out[skip:skip + length]
+                    skip = 0
+                    parts.append(out)
+                    length -= len(out)
+                if ret == Z_STREAM_END:
+                    # skip the trailer of this member, continue with the
+                    # next one (parsing its header)
+                    rest = inflater.unused_input()
+                    while len(rest) < 8:
+                        data = fh.read(CHUNK_SIZE)
+                        if not data:
+                            break
+                        rest += data
+                    inflater.close()
+                    inflater = _Inflater(AUTO_WINDOW_BITS)
+                    if not rest[8:] and not _next_member(inflater, fh):
+                        break
+                    if rest[8:]:
+                        inflater.feed(rest[8:])
+            return "".join(parts)
+        finally:
+            inflater.close()
+
+
+def _inflate_with_access_points(fh, span, points):
+    """Yield the uncompressed data of the gzip file fh, and append an access
+    point (in offset, out offset, bits, window) to points at the first block
+    boundary after each span bytes of uncompressed data."""
+    inflater = _Inflater(AUTO_WINDOW_BITS)
+    total_in = total_out = 0
+    last = None
+    window = ""
+    try:
+        while True:
+            if inflater.strm.avail_in == 0:
+                data = fh.read(CHUNK_SIZE)
+                if not data:
+                    raise IOError("Unexpected end of gzip data")
+                inflater.feed(data)
+            avail_in = inflater.strm.avail_in
+            ret, out = inflater.inflate(Z_BLOCK)
+            total_in += avail_in - inflater.strm.avail_in
+            if out:
+                total_out += len(out)
+                window = (window + out)[-WINDOW_SIZE:]
+                yield out
+            if ret == Z_STREAM_END:
+                if not _next_member(inflater, fh):
+                    break
+                continue
+            data_type = inflater.strm.data_type
+            # at the end of a block that is not the last one
+            if data_type & 128 and not data_type & 64 and (last is None or
+                    total_out - last > span):
+                points.append((total_in, total_out, data_type & 7, window))
+                last = total_out
+    finally:
+        inflater.close()
+
+
+class GzipIndexBuilder:
+    """Iterate over the uncompressed data of a gzip file (binary handle fh)
+    in chunks while building its index, with an access point about every
+    span bytes of uncompressed data. The index is available from get_index
+    after iterating over all data."""
+
+    def __init__(self, fh, span=1 << 20):
+        if not is_available():
+            raise IOError("libz could not be loaded")
+        self.__points__ = []
+        self.__chunks__ = _inflate_with_access_points(fh, span,
+                                                      self.__points__)
+        self.__done__ = False
+
+    def __iter__(self):
+        for data in self.__chunks__:
+            yield data
+        self.__done__ = True
+
+    def get_index(self):
+        if not self.__done__:
+            raise ValueError("The index is complete after all data has "
+                             "been read.")
+        points = self.__points__
+        windows = [zlib.compress(window) for _, _, _, window in points]
+        window_offsets = np.zeros(len(points) + 1, dtype=np.int64)
+        window_offsets[1:] = np.cumsum([len(window) for window in windows])
+        return GzipIndex([point[0] for point in points],
+                         [point[1] for point in points],
+                         [point[2] for point in points],
+                         np.frombuffer("".join(windows), dtype=np.uint8),
+                         window_offsets)
+
+
+def build_gzip_index(fh, span=1 << 20):
+    """Build the index of the gzip file with (binary) handle fh."""
+    builder = GzipIndexBuilder(fh, span)
+    for _ in builder:
+        pass
+    return builder.get_index()
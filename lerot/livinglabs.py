@@ -0,0 +1,187 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Client for the living-labs API (http://living-labs.net), used by
+LivingLabsQueries and LivingLabsRealUser.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import urllib
+from multiprocessing.pool import ThreadPool
+
+import requests
+import requests.adapters
+
+__all__ = ['LivingLabsClient', 'DoclistCache', 'RateLimiter',
+           'RetriesExhausted']
+
+
+class RetriesExhausted(requests.exceptions.RequestException):
+    """A request still failed after the maximum number of retries.
+    (requests.exceptions.RetryError needs requests >= 2.6.)"""
+
+
+class RateLimiter:
+    """Allow at most rate calls to wait() per second, over all threads.
+    A rate of None means no limit."""
+
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.__next_time__ = 0.0
+        self.__lock__ = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.__lock__:
+            now = time.time()
+            start = max(now, self.__next_time__)
+            self.__next_time__ = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class LivingLabsClient:
+    """Pooled HTTP client for the living-labs participant API. At most
+    max_connections requests run at the same time (see map), and at most
+    rate_limit requests are sent per second. Failed requests (connection
+    errors, and responses with status 429 or 5xx) are retried up to
+    max_retries times, waiting backoff * 2 ** attempt seconds in between."""
+
+    HOST = "http://living-labs.net:5000/api"
+    QUERY_ENDPOINT = "participant/query"
+    DOC_ENDPOINT = "participant/doc"
+    DOCLIST_ENDPOINT = "participant/doclist"
+    RUN_ENDPOINT = "participant/run"
+    FEEDBACK_ENDPOINT = "participant/feedback"
+    HEADERS = {'content-type': 'application/json'}
+
+    def __init__(self, key, host=None, max_connections=8, rate_limit=None,
+                 timeout=60, max_retries=5, backoff=1.0):
+        self.key = key
+        self.host = host or self.HOST
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=max_connections, pool_maxsize=max_connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get_url(self, endpoint, *args):
+        return "/".join([self.host, endpoint, self.key] +
+                        [urllib.quote(arg, safe="") for arg in args])
+
+    def request(self, method, url, ok_codes=(requests.codes.ok,), **kwargs):
+        """Send a request, retrying on failure. Returns the response if its
+        status is in ok_codes, raises an exception otherwise."""
+        headers = dict(self.HEADERS)
+        headers.update(kwargs.pop("headers", {}))
+        attempt = 0
+        while True:
+            self.rate_limiter.wait()
+            try:
+                r = self.session.request(method, url, headers=headers,
+                                         timeout=self.timeout, **kwargs)
+                if r.status_code in ok_codes:
+                    return r
+                if r.status_code != 429 and r.status_code < 500:
+                    logging.warn("%s %s failed: %s" % (method, url, r.text))
+                    r.raise_for_status()
+                    raise requests.exceptions.HTTPError(
+                        "Unexpected status %d" % r.status_code, response=r)
+                error = "status %d" % r.status_code
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as e:
+                error = e
+            if attempt >= self.max_retries:
+                raise RetriesExhausted("%s %s failed after %d "
+                    "attempts: %s" % (method, url, attempt + 1, error))
+            delay = self.backoff * 2 ** attempt
+            logging.warn("%s %s failed (%s), retrying in %.1fs" % (method,
+                url, error, delay))
+            time.sleep(delay)
+            attempt += 1
+
+    def map(self, function, items):
+        """Apply function to all items, with at most max_connections calls
+        running at the same time. Returns the results in order."""
+        items = list(items)
+        if len(items) < 2 or self.max_connections < 2:
+            return map(function, items)
+        pool = ThreadPool(min(self.max_connections, len(items)))
+        try:
+            # map_async + get with a timeout keeps the main thread
+            # interruptible
+            return pool.map_async(function, items).get(1 << 31)
+        finally:
+            pool.close()
+            pool.join()
+
+    def get_queries(self):
+        """Returns the json response listing all queries."""
+        return self.request("GET", self.get_url(self.QUERY_ENDPOINT)).json()
+
+    def get_doclist(self, qid, etag=None):
+        """Returns the ETag and json doclist for a query. If etag is given and
+        the doclist did not change, the ETag and None are returned."""
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        r = self.request("GET", self.get_url(self.DOCLIST_ENDPOINT, qid),
+                         ok_codes=(requests.codes.ok,
+                                   requests.codes.not_modified),
+                         headers=headers)
+        if r.status_code == requests.codes.not_modified:
+            return etag, None
+        return r.headers.get("ETag"), r.json()
+
+
+class DoclistCache:
+    """On-disk cache of living-labs doclists, one json file per qid that
+    holds the doclist and the ETag it was served with."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def __get_file__(self, qid):
+        return os.path.join(self.cache_dir,
+                            "doclist-%s.json" % urllib.quote(qid, safe=""))
+
+    def get(self, qid):
+        """Returns the ETag and doclist stored for qid, or None, None."""
+        try:
+            with open(self.__get_file__(qid)) as fh:
+                entry = json.load(fh)
+            return entry["etag"], entry["doclist"]
+        except (IOError, ValueError, KeyError):
+            return None, None
+
+    def put(self, qid, etag, doclist):
+        tmp_fd, tmp_file = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(tmp_fd, "w") as fh:
+            json.dump({"qid": qid, "etag": etag, "doclist": doclist}, fh)
+        os.rename(tmp_file, self.__get_file__(qid))
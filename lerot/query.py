@@ -20,14 +20,30 @@ format, both sequentially and in batch mode.
 """
 
 import sys
+import cStringIO
 import gc
 import gzip
+import json
+import logging
 import numpy as np
 import os.path
-import requests
+import shutil
+import tempfile
+from collections import OrderedDict
 from .document import Document
-import time
-__all__ = ['Query', 'Queries', 'QueryStream', 'load_queries', 'write_queries']
+from . import gzindex
+from .livinglabs import LivingLabsClient, DoclistCache
+__all__ = ['Query', 'LabelIndex', 'Queries', 'QueryStream',
+           'BlockQueryStream', 'CachedQueries', 'LazyQueries',
+           'ParallelQueries', 'load_queries', 'QueryWriter', 'write_queries',
+           'write_query_cache', 'normalize_features', 'normalize_queries',
+           'load_query_index', 'concatenate_features']
+
+# bump whenever the layout of the binary query cache changes
+QUERY_CACHE_VERSION = 1
+QUERY_INDEX_VERSION = 1
+# per-query feature normalization methods supported by normalize_features
+QUERY_NORMALIZATIONS = ("none", "minmax", "zscore")
 
 
 
@@ -59,71 +75,148 @@ class SimpleBufferedLineReader:
             self.__prev__ = None
 
 
+def _dcg_discounts(n):
+    return 1.0 / np.log2(2 + np.arange(n))
+
+
+def _letor_discounts(n):
+    # rank 1 is not discounted, rank r > 1 is discounted by log2(r), as in the
+    # letor 4 evaluation tools
+    discounts = np.ones(n)
+    discounts[1:] = 1.0 / np.log2(np.arange(2, n + 1))
+    return discounts
+
+
+# rank discounts used for (ideal) DCG, by name
+DCG_DISCOUNTS = {"log2": _dcg_discounts, "letor": _letor_discounts}
+
+
+class LabelIndex:
+    """Relevance label statistics of a single query: the labels sorted by
+    decreasing relevance, a label histogram, and the ideal DCG at every
+    cutoff for each of the DCG_DISCOUNTS."""
+
+    def __init__(self, labels):
+        labels = np.asarray(labels)
+        self.sorted_labels = np.sort(labels)[::-1]
+        # np.unique only counts with numpy >= 1.9
+        self.label_values, inverse = np.unique(labels, return_inverse=True)
+        self.label_counts = np.bincount(inverse,
+                                        minlength=len(self.label_values))
+        self.ideal_gains = np.power(2.0, self.sorted_labels) - 1
+        self.__ideal_dcg__ = {}
+        for discount in DCG_DISCOUNTS:
+            self.get_ideal_dcg_table(discount)
+
+    def get_histogram(self):
+        """Returns a dict mapping each label to its number of documents."""
+        return dict(zip(self.label_values.tolist(),
+                        self.label_counts.tolist()))
+
+    def get_ideal_dcg_table(self, discount="log2"):
+        """Array of ideal DCG values, entry k - 1 holds the ideal DCG at
+        cutoff k."""
+        if discount not in self.__ideal_dcg__:
+            discounts = DCG_DISCOUNTS[discount](len(self.ideal_gains))
+            self.__ideal_dcg__[discount] = np.cumsum(self.ideal_gains *
+                                                     discounts)
+        return self.__ideal_dcg__[discount]
+
+    def get_ideal_dcg(self, cutoff=-1, discount="log2"):
+        """The ideal DCG at the given cutoff (-1 for the full list)."""
+        table = self.get_ideal_dcg_table(discount)
+        if cutoff == -1 or cutoff > len(table):
+            cutoff = len(table)
+        if cutoff == 0:
+            return 0.0
+        return table[cutoff - 1]
+
+
+def _doc_index(docid):
+    """Row of a document in its query, docid can be a Document or an int."""
+    return getattr(docid, "docid", docid)
+
+
 class Query:
     __qid__ = None
     __feature_vectors__ = None
     __labels__ = None
     __predictions__ = None
     __comments__ = None
-    # document ids will be initialized as zero-based, os they can be used to
-    # retrieve labels, predictions, and feature vectors
+    # document ids are zero-based, so they can be used to retrieve labels,
+    # predictions, and feature vectors. Document objects are only created
+    # when get_docids() is first called
     __docids__ = None
-    __ideal__ = None
-   
+    __docid_array__ = None
+    # sorted labels and ideal DCG tables, built on first use so that queries
+    # that are never evaluated do not pay for them
+    __label_index__ = None
 
     def __init__(self, qid, feature_vectors, labels=None, comments=None):
         self.__qid__ = qid
         self.__feature_vectors__ = feature_vectors
         self.__labels__ = labels
-        self.__docids__ = [Document(x) for x in range(len(labels))]
         self.__comments__ = comments
-        
-        
-    def has_ideal(self):
-        return not self.__ideal__ is None
-
-    def set_ideal(self, ideal):
-        self.__ideal__ = ideal
 
-    def get_ideal(self):
-        return self.__ideal__
+    def get_label_index(self):
+        if self.__label_index__ is None:
+            self.__label_index__ = LabelIndex(self.__labels__)
+        return self.__label_index__
 
     def get_qid(self):
         return self.__qid__
 
     def get_docids(self):
+        if self.__docids__ is None:
+            self.__docids__ = [Document(x) for x in
+                               xrange(self.get_document_count())]
         return self.__docids__
 
+    def get_docid_array(self):
+        """The document ids of this query as an integer array, without
+        creating Document objects."""
+        if self.__docid_array__ is None:
+            self.__docid_array__ = np.arange(self.get_document_count())
+        return self.__docid_array__
+
+    def get_document(self, docid):
+        return self.get_docids()[_doc_index(docid)]
+
     def get_document_count(self):
-        return len(self.__docids__)
+        return len(self.__labels__)
 
     def get_feature_vectors(self):
         return self.__feature_vectors__
 
     def set_feature_vector(self, docid, feature_vector):
-        self.__feature_vectors__[docid.get_id()] = feature_vector
+        self.__feature_vectors__[_doc_index(docid)] = feature_vector
 
     def get_feature_vector(self, docid):
-        return self.__feature_vectors__[docid.get_id()]
+        return self.__feature_vectors__[_doc_index(docid)]
 
     def get_labels(self):
+        """The labels of all documents. Use set_label or set_labels to change
+        them; changing the returned array in place leaves the label index
+        (and so the ideal DCG used in evaluation) stale."""
         return self.__labels__
 
     def set_label(self, docid, label):
-        self.__labels__[docid.get_id()] = label
+        self.__labels__[_doc_index(docid)] = label
+        self.__label_index__ = None
 
     def get_label(self, docid):
-        return self.__labels__[docid.get_id()]
+        return self.__labels__[_doc_index(docid)]
 
     def set_labels(self, labels):
         self.__labels__ = labels
+        self.__label_index__ = None
 
     def get_comments(self):
         return self.__comments__
 
     def get_comment(self, docid):
         if self.__comments__ is not None:
-            return self.__comments__[docid.get_id()]
+            return self.__comments__[_doc_index(docid)]
         return None
 
     def get_predictions(self):
@@ -131,25 +224,88 @@ class Query:
 
     def get_prediction(self, docid):
         if self.__predictions__:
-            return self.__predictions__[docid.get_id()]
+            return self.__predictions__[_doc_index(docid)]
         return None
 
     def set_predictions(self, predictions):
         self.__predictions__ = predictions
 
     def write_to(self, fh, sparse=False):
-        for doc in self.__docids__:
-            features = [':'.join((repr(pos + 1),
-                repr(value))) for pos, value in enumerate(
-                self.get_feature_vector(doc)) if not (value == 0 and sparse)]
-            print >> fh, self.get_label(doc), ':'.join(("qid",
-                self.get_qid())), ' '.join(features),
-            comment = self.get_comment(doc)
-            if comment:
-                print >> fh, comment
+        """Write the query in svmlight format. The lines for all documents
+        are formatted at once and written with a single call. With sparse,
+        features with value 0 are left out."""
+        fh.write("".join(self.format_lines(sparse)))
+
+    def format_lines(self, sparse=False):
+        features = np.asarray(self.__feature_vectors__)
+        qid = "qid:%s" % self.get_qid()
+        if features.dtype == np.float64:
+            values = lambda row: row.tolist()
+        else:
+            # numpy scalars, their repr is the shortest one that round-trips
+            # in the feature precision
+            values = list
+        if sparse:
+            rows = [" ".join(["%d:%r" % (pos + 1, value) for pos, value in
+                              zip(np.flatnonzero(row).tolist(),
+                                  values(row[row != 0]))])
+                    for row in features]
+        else:
+            # one format string for all features of a document
+            template = " ".join(["%d:%%r" % (pos + 1)
+                                 for pos in range(features.shape[1])])
+            rows = [template % tuple(values(row)) for row in features]
+        comments = self.__comments__
+        if comments is None:
+            comments = [""] * len(rows)
+        return ["%s %s %s %s\n" % (label, qid, row, comment or "")
+                for label, row, comment in zip(
+                    np.asarray(self.__labels__).tolist(), rows, comments)]
+
+
+class QueryWriter:
+    """Write queries in svmlight format to a file (gzipped if the name ends
+    with .gz) or an open file handle, one query at a time. Queries can be
+    streamed from a QueryStream without keeping them in memory."""
+
+    def __init__(self, target, sparse=False, overwrite=False):
+        self.__sparse__ = sparse
+        self.__query_count__ = 0
+        self.__owns_fh__ = isinstance(target, basestring)
+        if self.__owns_fh__:
+            if os.path.exists(target) and not overwrite:
+                raise ValueError("Target file already exists: %s" % target)
+            if target.endswith(".gz"):
+                self.__fh__ = gzip.open(target, "w")
             else:
-                print >> fh, ""
-    
+                self.__fh__ = open(target, "w")
+        else:
+            self.__fh__ = target
+
+    def write(self, query):
+        query.write_to(self.__fh__, self.__sparse__)
+        self.__query_count__ += 1
+
+    def write_all(self, queries):
+        """Write all queries (e.g., from a QueryStream), returns the number
+        of queries written."""
+        for query in queries:
+            self.write(query)
+        return self.__query_count__
+
+    def get_query_count(self):
+        return self.__query_count__
+
+    def close(self):
+        if self.__owns_fh__:
+            self.__fh__.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
 
 class QueryStream:
     """iterate over a stream of queries, only keeping one query at a time"""
@@ -239,6 +395,161 @@ class QueryStream:
         return queries
 
 
+class BlockQueryStream:
+    """iterate over a stream of queries like QueryStream, but read the input
+    in large blocks and parse the feature values of a whole query at once.
+    Produces the same Query objects as QueryStream; feature matrices have
+    the given floating point dtype."""
+    __num_features__ = 0
+    __block_size__ = 1 << 22
+
+    def __init__(self, fh, num_features, preserve_comments=False,
+                 block_size=None, dtype=np.float64):
+        self.__fh__ = fh
+        self.__num_features__ = num_features
+        self.__preserve_comments__ = preserve_comments
+        self.__dtype__ = _check_dtype(dtype)
+        if block_size:
+            self.__block_size__ = block_size
+        self.__queries__ = self.__parse__()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return self.__queries__.next()
+
+    def __lines__(self):
+        while True:
+            lines = self.__fh__.readlines(self.__block_size__)
+            if not lines:
+                break
+            for line in lines:
+                yield line
+
+    def __parse__(self):
+        prev = None
+        labels, rows, comments = [], [], []
+        for line in self.__lines__():
+            line = line.rstrip("\n")
+            # explicitly start a new query
+            if line.startswith("# qid "):
+                if labels:
+                    yield self.__make_query__(prev, labels, rows, comments)
+                    prev = None
+                    labels, rows, comments = [], [], []
+                continue
+            # remove comments
+            if line.startswith("#"):
+                continue
+            comment = ""
+            comment_index = line.find("#")
+            if comment_index >= 0:
+                comment = line[comment_index:]
+                line = line[:comment_index]
+            # split off target and qid, features are parsed per query
+            tokens = line.split(None, 2)
+            if not tokens:
+                continue
+            qid = tokens[1].split(':')[1]
+            if not qid:
+                print >> sys.stderr, "Invalid line - skipping '", line, "'"
+                continue
+            if prev is not None and qid != prev:
+                yield self.__make_query__(prev, labels, rows, comments)
+                labels, rows, comments = [], [], []
+            prev = qid
+            labels.append(int(tokens[0]))
+            rows.append(tokens[2] if len(tokens) > 2 else "")
+            comments.append(comment)
+        if labels:
+            yield self.__make_query__(prev, labels, rows, comments)
+
+    def __make_query__(self, qid, labels, rows, comments):
+        """Turn the raw feature strings of one query into a feature matrix
+        of shape (documents, features)."""
+        counts = np.fromiter((row.count(":") for row in rows), dtype=int,
+                             count=len(rows))
+        try:
+            pairs = np.array(" ".join(rows).replace(":", " ").split(),
+                             dtype=np.float64)
+        except ValueError:
+            pairs = None
+        if pairs is None or len(pairs) != 2 * counts.sum():
+            raise ValueError("Could not parse features for qid %s" % qid)
+        indexes = pairs[0::2].astype(int) - 1
+        num_features = self.__num_features__
+        if len(indexes):
+            num_features = max(num_features, indexes.max() + 1)
+        instances = np.zeros((len(rows), num_features), dtype=self.__dtype__)
+        instances[np.repeat(np.arange(len(rows)), counts), indexes] = \
+            pairs[1::2]
+        targets = np.array(labels)
+        if not self.__preserve_comments__:
+            comments = None
+        return Query(qid, instances, targets, comments)
+
+    # read all queries from a file at once, keeping them in file order
+    def read_all(self):
+        queries = OrderedDict()
+        for query in self:
+            queries[query.get_qid()] = query
+        return queries
+
+
+def _index_query_lines(lines):
+    """Find the byte range of each query in an iterable of lines, with the
+    same query boundaries as BlockQueryStream (a later block with the same
+    qid replaces an earlier one)."""
+    index = OrderedDict()
+    prev, start, end = None, 0, 0
+    offset = 0
+    for line in lines:
+        line_start = offset
+        offset += len(line)
+        if line.startswith("# qid ") and prev is not None:
+            index[prev] = (start, end)
+            prev = None
+            continue
+        qid = _get_line_qid(line)
+        if qid is None:
+            continue
+        if qid != prev:
+            if prev is not None:
+                index[prev] = (start, end)
+            prev, start = qid, line_start
+        end = offset
+    if prev is not None:
+        index[prev] = (start, end)
+    return index
+
+
+def _split_lines(chunks):
+    """Turn an iterable of data chunks into lines (with line endings)."""
+    rest = ""
+    for chunk in chunks:
+        lines = (rest + chunk).split("\n")
+        rest = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    if rest:
+        yield rest
+
+
+def _get_line_qid(line):
+    """Return the qid of a line in svmlight format, or None for comments,
+    empty lines and lines without a valid qid."""
+    if line.startswith("#"):
+        return None
+    tokens = line.split(None, 2)
+    if len(tokens) < 2 or tokens[0].startswith("#"):
+        return None
+    qid = tokens[1].split("#")[0].split(":")
+    if len(qid) < 2 or not qid[1]:
+        return None
+    return qid[1]
+
+
 class Queries:
     """a list of queries with some convenience functions"""
     __num_features__ = 0
@@ -248,10 +559,12 @@ class Queries:
     __qids__ = None
     __feature_vectors__ = None
     __labels__ = None
+    __feature_matrix__ = None
 
-    def __init__(self, fh, num_features, preserve_comments=False):
-        self.__queries__ = QueryStream(fh, num_features,
-            preserve_comments).read_all()
+    def __init__(self, fh, num_features, preserve_comments=False,
+                 dtype=np.float64):
+        self.__queries__ = BlockQueryStream(fh, num_features,
+            preserve_comments, dtype=dtype).read_all()
 
         self.__num_features__ = num_features
 
@@ -290,6 +603,27 @@ class Queries:
                 for query in self]
         return self.__featureVectors__
 
+    def get_feature_matrix(self):
+        """Returns the feature vectors of all queries as one matrix, and the
+        offsets of each query's rows in it: the rows of the i-th query (in
+        iteration order, see get_qids) are offsets[i]:offsets[i + 1]. The
+        matrix is built once, after which the feature vectors of each query
+        are views of it."""
+        if self.__feature_matrix__ is None:
+            queries = list(self)
+            features, offsets = concatenate_features(queries,
+                self.__num_features__)
+            for i, query in enumerate(queries):
+                query.__feature_vectors__ = features[offsets[i]:
+                                                     offsets[i + 1]]
+            self.__feature_matrix__ = features, offsets
+        return self.__feature_matrix__
+
+    def keeps_feature_matrix(self):
+        """Whether get_feature_matrix returns a matrix that is kept, rather
+        than one that is built from all queries on each call."""
+        return True
+
     def set_predictions(self):
         raise NotImplementedError("Not yet implemented")
 
@@ -302,149 +636,679 @@ class Queries:
         return self.__len__()
 
 
+class CachedQueries(Queries):
+    """Queries loaded from a binary columnar cache written by
+    write_query_cache. The feature vectors and labels of all queries are
+    slices of one contiguous matrix and label vector.
+
+    With mmap=True the matrix and labels are memory-mapped (copy-on-write)
+    instead of read into memory, so that all processes that load the same
+    cache share a single physical copy of the data. Pickling such queries
+    (e.g., to send them to worker processes) only transfers the cache
+    location."""
+
+    def __init__(self, cache_dir, mmap=False):
+        meta, features, labels, offsets, qids, comments = _open_query_cache(
+            cache_dir, mmap)
+        self.__num_features__ = meta["feature_count"]
+        self.__cache_dir__ = cache_dir
+        self.__mmap__ = isinstance(features, np.memmap)
+        self.__feature_matrix__ = features, offsets
+        self.__queries__ = OrderedDict()
+        for i, qid in enumerate(qids):
+            start, end = offsets[i], offsets[i + 1]
+            self.__queries__[qid] = Query(qid, features[start:end],
+                labels[start:end],
+                comments[start:end] if comments is not None else None)
+
+    def __getstate__(self):
+        if not self.__mmap__:
+            return self.__dict__
+        return {"__cache_dir__": self.__cache_dir__, "__mmap__": True}
+
+    def __setstate__(self, state):
+        if "__queries__" in state:
+            self.__dict__.update(state)
+        else:
+            self.__init__(state["__cache_dir__"], mmap=True)
+
+    def is_mmap(self):
+        return self.__mmap__
+
+    def get_cache_dir(self):
+        return self.__cache_dir__
+
+
+class LazyQueries(Queries):
+    """Queries that are only parsed when they are first accessed. On
+    initialization only the location of each query is indexed: the offsets
+    into the binary cache if a valid cache exists for the file, otherwise
+    the byte offsets of each query in the (uncompressed) text, see
+    load_query_index; the text index is only stored next to the file if
+    cache is True. For gzipped files the index includes access points
+    into the compressed data, so a query is read without decompressing the
+    file up to the query. At most
+    max_queries materialized queries are kept, the least recently used
+    query is discarded first. Features are normalized per query with
+    normalize (see normalize_features) when a query is materialized, and
+    stored with the given dtype."""
+
+    def __init__(self, filename, num_features, preserve_comments=False,
+                 max_queries=1000, normalize="none", dtype=np.float64,
+                 cache=False):
+        if max_queries < 1:
+            raise ValueError("max_queries should be positive, got %d" %
+                             max_queries)
+        self.__filename__ = filename
+        self.__num_features__ = num_features
+        self.__preserve_comments__ = preserve_comments
+        self.__max_queries__ = max_queries
+        self.__normalize__ = _check_normalization(normalize)
+        self.__dtype__ = _check_dtype(dtype)
+        self.__queries__ = OrderedDict()
+        self.__cache_dir__ = None
+        self.__cache_arrays__ = None
+        self.__gzip_index__ = None
+        cache_dir = get_query_cache_dir(filename, num_features, normalize,
+                                        dtype)
+        if is_query_cache_valid(cache_dir, filename, num_features,
+                                preserve_comments, normalize, dtype):
+            self.__cache_dir__ = cache_dir
+            self.__cache_arrays__ = _open_query_cache(cache_dir, mmap=True)
+            _, _, _, offsets, qids, _ = self.__cache_arrays__
+            self.__index__ = OrderedDict((qid, (offsets[i], offsets[i + 1]))
+                                         for i, qid in enumerate(qids))
+        else:
+            self.__index__, self.__gzip_index__ = load_query_index(filename,
+                                                                   cache)
+
+    def __getstate__(self):
+        # send the index, not the materialized queries or mapped arrays
+        state = self.__dict__.copy()
+        state["__queries__"] = OrderedDict()
+        state["__cache_arrays__"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.__cache_dir__ is not None:
+            self.__cache_arrays__ = _open_query_cache(self.__cache_dir__,
+                                                      mmap=True)
+
+    def __open_text__(self):
+        if self.__filename__.endswith(".gz"):
+            return gzip.open(self.__filename__, "rb")
+        return open(self.__filename__, "rb")
+
+    def __load_query__(self, qid):
+        start, end = self.__index__[qid]
+        if self.__cache_arrays__ is not None:
+            _, features, labels, _, _, comments = self.__cache_arrays__
+            if comments is not None and self.__preserve_comments__:
+                comments = comments[start:end]
+            else:
+                comments = None
+            return Query(qid, features[start:end], labels[start:end],
+                         comments)
+        if self.__gzip_index__ is not None:
+            with open(self.__filename__, "rb") as fh:
+                chunk = self.__gzip_index__.read(fh, start, end - start)
+        else:
+            fh = self.__open_text__()
+            fh.seek(start)
+            chunk = fh.read(end - start)
+            fh.close()
+        query = BlockQueryStream(cStringIO.StringIO(chunk),
+            self.__num_features__, self.__preserve_comments__,
+            dtype=self.__dtype__).next()
+        normalize_features(query.get_feature_vectors(), self.__normalize__)
+        return query
+
+    def __iter__(self):
+        for qid in self.__index__:
+            yield self.get_query(qid)
+
+    def __len__(self):
+        return len(self.__index__)
 
+    def __contains__(self, qid):
+        return qid in self.__index__
 
-class LivingLabsQueries(Queries):
-    __KEY__ = ''
-    __HOST__ = "http://living-labs.net:5000/api"
-    __QUERYENDPOINT__ = "participant/query"
-    __DOCENDPOINT__ = "participant/doc"
-    __DOCLISTENDPOINT__ = "participant/doclist"
-    __RUNENDPOINT__ = "participant/run"
-    __FEEDBACKENDPOINT__ = "participant/feedback"
-    __KEY__ = ''
-    __HEADERS__ = {'content-type': 'application/json'}
-    __doc_ids__ = {}#used for living-labs
-    __doc_counter__ = 0
-    __LL_queries__ = {}
-
-    
-    def __init__(self, KEY):
-        self.__KEY__ = KEY
-        self.__queries__ = {}
-        self.__LL_queries__  = self.__get_queries__()
-        self.__doc_ids__ = {}
-        time.sleep(1)
-	counter = 0
-        self.__num_features__ = self.__get_num_features__(self.__LL_queries__ )
-        for query in self.__LL_queries__ ['queries']:
-            qid = query['qid']
-	    counter += 1
-	    print counter, ' of ', len(self.__LL_queries__ ['queries'])
-            print 'Getting doclist for ', qid
-            doclist = self.__get_doclist__(qid)
-            time.sleep(1)
-            instances = self.__get_features__(qid, doclist, self.__num_features__)
-            self.__queries__[qid] = Query(qid, instances, [0]*len(instances), "")#instances = self.get_features(qid, HOST, KEY) # Should by numpy array
-            self.__set_doc_ids__(qid, doclist)
-            time.sleep(1)
-
-
-    def __set_doc_ids__(self, qid, doclist):
-        """
-        Updates global dictionary of document ids for a given query. 
-        Uses document ID as used in lerot and maps this to document ID on living-labs
-        dictionary[queryID][LerotDocID] = living-labs ID
-        """
-        self.__doc_ids__[qid] = {}
-        for doc in range(len(doclist['doclist'])): 
-            self.__doc_ids__[qid][doc] = doclist['doclist'][doc]['docid']
-            
-
-
-    def __get_queries__(self):
-        """Returns a Dictionary of all Queries."""
-        time.sleep(1)
-        r = requests.get("/".join([self.__HOST__, self.__QUERYENDPOINT__, self.__KEY__]), headers=self.__HEADERS__)
-        print 'Got Queries'
-        if r.status_code != requests.codes.ok:
-            print r.text
-            r.raise_for_status()
-        return r.json()
-    
-    
-    def __get_features__(self, qid, doclist, num_features):
-        """
-        Returns numpy array of numpy arrays (of features for each document)
-        """
-        feature_list = []
-        for doc in range(len(doclist['doclist'])):
-            if 'relevance_signals' in doclist['doclist'][doc] and len(doclist['doclist'][doc]['relevance_signals'])>0:# Some documents had empty feature lists, check to avoid crash
-                doc_feature_list = np.zeros(num_features)
-                for feature in xrange(len(doclist['doclist'][doc]['relevance_signals'])-1):
-                    doc_feature_list[feature] = doclist['doclist'][doc]['relevance_signals'][feature][1]
-                feature_list.append(doc_feature_list)
-        feature_list = np.asarray(feature_list)
-        return feature_list
-    
-    
-    def __get_num_features__(self, queries):
-        """
-        Returns (integer): the number of features in the documents. Only checks one document.
-        """
-        feature_num = 0
-        for query in queries['queries']:
-            qid = query['qid']
-            time.sleep(1)
-            doclist = self.__get_doclist__(qid)
-            for doc in range(len(doclist['doclist'])):
-                for feature in doclist['doclist'][doc]['relevance_signals']:
-                    feature_num += 1
-                return feature_num
+    def keys(self):
+        return self.__index__.keys()
 
-    def __get_doclist__(self, qid):
-        """
-        Return the document list for a given query.
-        """
-        time.sleep(1)
-        while True:
+    def values(self):
+        return list(self)
+
+    def get_query(self, index):
+        if index in self.__queries__:
+            # move to the most recently used end
+            query = self.__queries__.pop(index)
+        else:
+            query = self.__load_query__(index)
+            while len(self.__queries__) >= self.__max_queries__:
+                self.__queries__.popitem(last=False)
+        self.__queries__[index] = query
+        return query
+
+    def get_materialized_count(self):
+        return len(self.__queries__)
+
+    def get_feature_matrix(self):
+        """See Queries.get_feature_matrix. With a valid binary cache this is
+        the memory-mapped cache matrix, otherwise the matrix is built from
+        all queries on every call (it is not kept)."""
+        if self.__cache_arrays__ is not None:
+            _, features, _, offsets, _, _ = self.__cache_arrays__
+            return features, offsets
+        return concatenate_features(self, self.__num_features__)
+
+    def keeps_feature_matrix(self):
+        return self.__cache_arrays__ is not None
+
+
+class ParallelQueries(Queries):
+    """Queries parsed by a pool of processes. The file is split into byte
+    ranges at query boundaries, each range is parsed separately and the
+    results are combined in file order. Gzipped files are decompressed to a
+    temporary file once before splitting."""
+
+    def __init__(self, filename, num_features, preserve_comments=False,
+                 processes=None, dtype=np.float64):
+        from multiprocessing import Pool, cpu_count
+        if not processes:
+            processes = cpu_count()
+        self.__num_features__ = num_features
+        tmp_file = None
+        if filename.endswith(".gz"):
+            tmp_fd, tmp_file = tempfile.mkstemp(suffix=".txt")
+            with os.fdopen(tmp_fd, "wb") as out_fh:
+                in_fh = gzip.open(filename, "rb")
+                shutil.copyfileobj(in_fh, out_fh, 1 << 22)
+                in_fh.close()
+            filename = tmp_file
+        try:
+            # several chunks per process to even out differences in speed
+            boundaries = _find_query_boundaries(filename, processes * 4)
+            dtype = _check_dtype(dtype).str
+            chunks = [(filename, start, end, num_features, preserve_comments,
+                       dtype)
+                      for start, end in zip(boundaries[:-1], boundaries[1:])]
+            pool = Pool(processes=processes)
             try:
-                print "/".join([self.__HOST__, self.__DOCLISTENDPOINT__, self.__KEY__, qid]), self.__HEADERS__
-                r = requests.get("/".join([self.__HOST__, self.__DOCLISTENDPOINT__, self.__KEY__, qid]), headers=self.__HEADERS__, timeout=50)
-                print 'Worked'
+                parsed = pool.map(_parse_query_range, chunks)
+            finally:
+                pool.close()
+                pool.join()
+        finally:
+            if tmp_file is not None:
+                os.remove(tmp_file)
+        self.__queries__ = OrderedDict()
+        for chunk in parsed:
+            for qid, features, labels, comments in chunk:
+                self.__queries__[qid] = Query(qid, features, labels, comments)
+
+
+def _find_query_boundaries(filename, num_chunks):
+    """Split an uncompressed svmlight file into at most num_chunks byte
+    ranges that start at a query boundary. Returns the list of offsets at
+    which the ranges start, followed by the file size."""
+    size = os.path.getsize(filename)
+    boundaries = [0]
+    fh = open(filename, "rb")
+    for i in range(1, num_chunks):
+        target = size * i // num_chunks
+        if target <= boundaries[-1]:
+            continue
+        fh.seek(target)
+        # skip the (partial) line at the target position
+        fh.readline()
+        prev = None
+        while True:
+            pos = fh.tell()
+            line = fh.readline()
+            if not line or line.startswith("# qid "):
                 break
-            except (requests.exceptions.RequestException, requests.exceptions.ConnectionError) as e:
-                print e, 'Retrying....'
-                r = self.__get_doclist__(qid)
-        if r.status_code != requests.codes.ok:
-            print r.text
-            r.raise_for_status()
-        return r.json()
-    
+            qid = _get_line_qid(line)
+            if qid is None:
+                continue
+            if prev is not None and qid != prev:
+                break
+            prev = qid
+        if boundaries[-1] < pos < size:
+            boundaries.append(pos)
+    fh.close()
+    boundaries.append(size)
+    return boundaries
+
 
+def _parse_query_range(args):
+    """Parse the queries in a byte range of a file (run in worker processes,
+    returns plain arrays as they are cheaper to send back than Queries)."""
+    filename, start, end, num_features, preserve_comments, dtype = args
+    fh = open(filename, "rb")
+    fh.seek(start)
+    chunk = fh.read(end - start)
+    fh.close()
+    stream = BlockQueryStream(cStringIO.StringIO(chunk), num_features,
+                              preserve_comments, dtype=dtype)
+    return [(query.get_qid(), query.get_feature_vectors(),
+             query.get_labels(), query.get_comments()) for query in stream]
+
+
+class LivingLabsQueries(Queries):
+    """Queries and doclists of a living-labs (http://living-labs.net) site.
 
-def load_livinglabs_queries(key):
+    Doclists are fetched concurrently through a LivingLabsClient (see there
+    for max_connections and rate_limit). If cache_dir is given, doclists are
+    stored there with their ETag, and on the next start only doclists that
+    changed on the server are downloaded again.
+
+    Documents without relevance signals are left out. __doc_ids__ maps
+    qid -> lerot docid (row of the feature matrix) -> living-labs docid."""
+
+    def __init__(self, KEY, cache_dir=None, host=None, max_connections=8,
+                 rate_limit=None, client=None):
+        self.__client__ = client or LivingLabsClient(KEY, host=host,
+            max_connections=max_connections, rate_limit=rate_limit)
+        self.__cache__ = DoclistCache(cache_dir) if cache_dir else None
+        self.__queries__ = {}
+        self.__doc_ids__ = {}
+        self.__LL_queries__ = self.__client__.get_queries()
+        qids = [query['qid'] for query in self.__LL_queries__['queries']]
+        doclists = self.__client__.map(self.__get_doclist__, qids)
+        logging.info("Got %d doclists, %d downloaded" % (len(doclists),
+            sum(1 for _, downloaded in doclists if downloaded)))
+        self.__num_features__ = self.__get_num_features__(
+            [doclist for doclist, _ in doclists])
+        for qid, (doclist, _) in zip(qids, doclists):
+            docs = [doc for doc in doclist['doclist']
+                    if doc.get('relevance_signals')]
+            instances = self.__get_features__(docs, self.__num_features__)
+            self.__queries__[qid] = Query(qid, instances, [0] * len(docs), "")
+            self.__doc_ids__[qid] = dict((i, doc['docid'])
+                                         for i, doc in enumerate(docs))
+
+    def __get_doclist__(self, qid):
+        """Returns the doclist of a query and whether it was downloaded (as
+        opposed to taken from the cache)."""
+        etag, cached = (None, None)
+        if self.__cache__ is not None:
+            etag, cached = self.__cache__.get(qid)
+        etag, doclist = self.__client__.get_doclist(qid, etag)
+        if doclist is None:
+            return cached, False
+        if self.__cache__ is not None:
+            self.__cache__.put(qid, etag, doclist)
+        return doclist, True
+
+    def __get_features__(self, docs, num_features):
+        """Returns the feature matrix of the given documents. As before, the
+        last relevance signal of each document is not used."""
+        features = np.zeros((len(docs), num_features))
+        for i, doc in enumerate(docs):
+            signals = [value for _, value in doc['relevance_signals'][:-1]]
+            features[i, :len(signals)] = signals
+        return features
+
+    def __get_num_features__(self, doclists):
+        """Returns the number of relevance signals of the first document that
+        has any."""
+        for doclist in doclists:
+            for doc in doclist['doclist']:
+                if doc.get('relevance_signals'):
+                    return len(doc['relevance_signals'])
+        return 0
+
+
+def load_livinglabs_queries(key, cache_dir=None, host=None,
+                            max_connections=8, rate_limit=None):
     """Utility method for loading living-labs queries."""
-    queries = LivingLabsQueries(key)
+    return LivingLabsQueries(key, cache_dir=cache_dir, host=host,
+                             max_connections=max_connections,
+                             rate_limit=rate_limit)
+
+
+def concatenate_features(queries, num_features=0):
+    """Returns the feature vectors of the given queries stacked into one
+    matrix, and the offsets of each query's rows (see
+    Queries.get_feature_matrix). Without queries the matrix has shape
+    (0, num_features)."""
+    matrices = [query.get_feature_vectors() for query in queries]
+    offsets = np.zeros(len(matrices) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(matrix) for matrix in matrices])
+    if not matrices:
+        return np.zeros((0, num_features)), offsets
+    return np.vstack(matrices), offsets
+
+
+def normalize_features(features, method="minmax"):
+    """Normalize the feature matrix of a single query in place, per feature
+    (column). With "minmax" features are scaled to [0, 1], with "zscore" to
+    zero mean and unit variance, "none" leaves them unchanged. Features that
+    are constant within the query are set to 0. Returns the matrix."""
+    if _check_normalization(method) == "none" or len(features) == 0:
+        return features
+    if method == "minmax":
+        shift = features.min(axis=0)
+        scale = features.max(axis=0) - shift
+    else:
+        shift = features.mean(axis=0)
+        scale = features.std(axis=0)
+    constant = scale == 0
+    scale[constant] = 1.0
+    features -= shift
+    features /= scale
+    features[:, constant] = .0
+    return features
+
+
+def normalize_queries(queries, method="minmax"):
+    """Normalize the features of each query in queries (e.g., a QueryStream)
+    and yield it; a pipeline stage between reading and writing queries."""
+    _check_normalization(method)
+    for query in queries:
+        normalize_features(query.get_feature_vectors(), method)
+        yield query
+
+
+def _check_dtype(dtype):
+    dtype = np.dtype(dtype)
+    if not np.issubdtype(dtype, np.floating):
+        raise ValueError("Features need a floating point dtype, got %s" %
+                         dtype)
+    return dtype
+
+
+def _check_normalization(method):
+    if method not in QUERY_NORMALIZATIONS:
+        raise ValueError("Unknown normalization \"%s\", expected one of %s"
+                         % (method, ", ".join(QUERY_NORMALIZATIONS)))
+    return method
+
+
+def load_queries(filename, features, preserve_comments=False, cache=False,
+                 mmap=False, lazy=False, processes=1, normalize="none",
+                 dtype=np.float64):
+    """Utility method for loading queries from a file. If cache is True, a
+    binary copy of the data is stored next to the file on first use, and
+    loaded instead of the file while the file is unchanged. If mmap is True
+    (implies cache), the cached data is memory-mapped rather than read. If
+    lazy is True, queries are only parsed when they are first accessed (see
+    LazyQueries); an existing cache is used, but not built, and the query
+    index is only stored if cache is True. With processes
+    larger than 1, the file is parsed in parallel (see ParallelQueries).
+    Features are normalized per query with normalize (see
+    normalize_features) while loading; the cache stores normalized
+    features, separately for each normalization. Feature matrices have the
+    given dtype, float32 halves memory use and speeds up scoring."""
+    _check_normalization(normalize)
+    dtype = _check_dtype(dtype)
+    cache = cache or mmap
+    if lazy:
+        return LazyQueries(filename, features, preserve_comments,
+                           normalize=normalize, dtype=dtype, cache=cache)
+    if cache:
+        cache_dir = get_query_cache_dir(filename, features, normalize, dtype)
+        if is_query_cache_valid(cache_dir, filename, features,
+                                preserve_comments, normalize, dtype):
+            return CachedQueries(cache_dir, mmap)
+    if processes > 1:
+        queries = ParallelQueries(filename, features, preserve_comments,
+                                  processes, dtype)
+    else:
+        if filename.endswith(".gz"):
+            fh = gzip.open(filename)
+        else:
+            fh = open(filename)
+        gc.disable()
+        queries = Queries(fh, features, preserve_comments, dtype)
+        gc.enable()
+        fh.close()
+    for _ in normalize_queries(queries, normalize):
+        pass
+    if cache:
+        try:
+            write_query_cache(queries, cache_dir, filename, features,
+                              normalize, dtype)
+            return CachedQueries(cache_dir, mmap)
+        except (IOError, OSError, ValueError) as e:
+            logging.warn("Could not cache queries from %s: %s" % (filename,
+                                                                 e))
     return queries
 
 
-
-def load_queries(filename, features, preserve_comments=False):
-    """Utility method for loading queries from a file."""
+def get_query_cache_dir(filename, features, normalize="none",
+                        dtype=np.float64):
+    """The directory in which the cache for filename is stored."""
+    cache_dir = "%s.lerot-cache-%d" % (filename, features)
+    if normalize != "none":
+        cache_dir += "-%s" % normalize
+    if np.dtype(dtype) != np.float64:
+        cache_dir += "-%s" % np.dtype(dtype).name
+    return cache_dir
+
+
+def _read_cache_meta(cache_dir):
+    with open(os.path.join(cache_dir, "meta.json")) as fh:
+        return json.load(fh)
+
+
+def _open_query_cache(cache_dir, mmap=False):
+    """Return the meta data, feature matrix, labels, query offsets, qids and
+    comments (or None) stored in a query cache."""
+    meta = _read_cache_meta(cache_dir)
+    num_docs = meta["num_docs"]
+    shape = (num_docs, meta["feature_count"])
+    features_file = os.path.join(cache_dir, "features.bin")
+    labels_file = os.path.join(cache_dir, "labels.bin")
+    # empty files cannot be mapped
+    if mmap and num_docs > 0:
+        features = np.memmap(features_file, dtype=meta["dtype"], mode="c",
+                             shape=shape)
+        labels = np.memmap(labels_file, dtype=np.int64, mode="c",
+                           shape=(num_docs,))
+    else:
+        features = np.fromfile(features_file,
+                               dtype=meta["dtype"]).reshape(shape)
+        labels = np.fromfile(labels_file, dtype=np.int64)
+    offsets = np.fromfile(os.path.join(cache_dir, "offsets.bin"),
+                          dtype=np.int64)
+    qids = _read_cache_lines(cache_dir, "qids.txt", meta["num_queries"])
+    comments = None
+    if meta["comments"]:
+        comments = _read_cache_lines(cache_dir, "comments.txt", num_docs)
+    return meta, features, labels, offsets, qids, comments
+
+
+def _read_cache_lines(cache_dir, name, count):
+    with open(os.path.join(cache_dir, name)) as fh:
+        lines = fh.read().split("\n")
+    return lines[:count]
+
+
+def is_query_cache_valid(cache_dir, filename, features,
+                         preserve_comments=False, normalize="none",
+                         dtype=np.float64):
+    """Check whether the cache in cache_dir was built from the current
+    version of filename, with the given number of features, normalization
+    and feature dtype."""
+    try:
+        meta = _read_cache_meta(cache_dir)
+        stat = os.stat(filename)
+    except (IOError, OSError, ValueError):
+        return False
+    return (meta.get("version") == QUERY_CACHE_VERSION
+            and meta.get("source_mtime") == stat.st_mtime
+            and meta.get("source_size") == stat.st_size
+            and meta.get("feature_count") == features
+            and meta.get("normalize", "none") == normalize
+            and meta.get("dtype") == np.dtype(dtype).name
+            and (meta.get("comments") or not preserve_comments))
+
+
+def write_query_cache(queries, cache_dir, filename, features,
+                      normalize="none", dtype=np.float64):
+    """Store queries in binary columnar form in cache_dir: one feature
+    matrix (of the given dtype), one label vector and the offsets of each
+    query in both. The cache is keyed on the modification time of filename,
+    the feature count, the normalization that was applied to the queries and
+    the dtype."""
+    dtype = _check_dtype(dtype)
+    stat = os.stat(filename)
+    queries = list(queries)
+    for query in queries:
+        if query.get_feature_vectors().shape[1] != features:
+            raise ValueError("Query %s has %d features, expected %d" % (
+                query.get_qid(), query.get_feature_vectors().shape[1],
+                features))
+    offsets = np.zeros(len(queries) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([query.get_document_count()
+                             for query in queries])
+    has_comments = all(query.get_comments() is not None for query in queries)
+    meta = {"version": QUERY_CACHE_VERSION,
+            "source_mtime": stat.st_mtime,
+            "source_size": stat.st_size,
+            "feature_count": features,
+            "num_queries": len(queries),
+            "num_docs": int(offsets[-1]),
+            "dtype": dtype.name,
+            "normalize": normalize,
+            "comments": has_comments}
+
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    # write to a temporary directory first, so that concurrent experiments
+    # never see a partially written cache
+    tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(cache_dir) + ".",
+                               dir=os.path.dirname(os.path.abspath(cache_dir)))
+    try:
+        with open(os.path.join(tmp_dir, "features.bin"), "wb") as fh:
+            for query in queries:
+                np.ascontiguousarray(query.get_feature_vectors(),
+                                     dtype=dtype).tofile(fh)
+        with open(os.path.join(tmp_dir, "labels.bin"), "wb") as fh:
+            for query in queries:
+                np.asarray(query.get_labels(), dtype=np.int64).tofile(fh)
+        offsets.tofile(os.path.join(tmp_dir, "offsets.bin"))
+        with open(os.path.join(tmp_dir, "qids.txt"), "w") as fh:
+            fh.write("\n".join(query.get_qid() for query in queries))
+        if has_comments:
+            with open(os.path.join(tmp_dir, "comments.txt"), "w") as fh:
+                fh.write("\n".join(comment for query in queries
+                                   for comment in query.get_comments()))
+        # meta is written last, a cache without it is never used
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as fh:
+            json.dump(meta, fh)
+        os.rename(tmp_dir, cache_dir)
+    except OSError:
+        # another process was faster
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not is_query_cache_valid(cache_dir, filename, features,
+                                    normalize=normalize, dtype=dtype):
+            raise
+    except:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def get_query_index_file(filename):
+    """The file in which the query index for filename is stored."""
+    return "%s.lerot-index.npz" % filename
+
+
+def build_query_index(filename, gzip_span=1 << 20):
+    """Find the byte range of each query in the uncompressed data of
+    filename. For gzipped files, a gzindex.GzipIndex with an access point
+    about every gzip_span bytes is built in the same pass (None if libz is
+    not available, or for uncompressed files). Returns both."""
+    if filename.endswith(".gz") and gzindex.is_available():
+        with open(filename, "rb") as fh:
+            builder = gzindex.GzipIndexBuilder(fh, gzip_span)
+            index = _index_query_lines(_split_lines(builder))
+            return index, builder.get_index()
     if filename.endswith(".gz"):
-        fh = gzip.open(filename)
+        fh = gzip.open(filename, "rb")
     else:
-        fh = open(filename)
-    gc.disable()
-    queries = Queries(fh, features, preserve_comments)
-    gc.enable()
+        fh = open(filename, "rb")
+    index = _index_query_lines(fh)
     fh.close()
-    return queries
+    return index, None
+
+
+def write_query_index(filename, index, gzip_index=None):
+    """Store a query index (and gzip index) built for filename."""
+    stat = os.stat(filename)
+    arrays = {"version": QUERY_INDEX_VERSION,
+              "source_mtime": stat.st_mtime,
+              "source_size": stat.st_size,
+              "qids": np.array(index.keys(), dtype=str),
+              "ranges": np.array(index.values(),
+                                 dtype=np.int64).reshape((-1, 2)),
+              "gzip": gzip_index is not None}
+    if gzip_index is not None:
+        for name, array in gzip_index.to_arrays().iteritems():
+            arrays["gzip_" + name] = array
+    index_file = get_query_index_file(filename)
+    tmp_fd, tmp_file = tempfile.mkstemp(
+        prefix=os.path.basename(index_file) + ".",
+        dir=os.path.dirname(os.path.abspath(index_file)))
+    try:
+        with os.fdopen(tmp_fd, "wb") as fh:
+            np.savez(fh, **arrays)
+        os.rename(tmp_file, index_file)
+    except:
+        os.remove(tmp_file)
+        raise
+
+
+def read_query_index(filename):
+    """Load the stored query index (and gzip index) for filename, returns
+    None if there is none or filename changed since it was built."""
+    try:
+        stat = os.stat(filename)
+        with np.load(get_query_index_file(filename)) as arrays:
+            if (arrays["version"] != QUERY_INDEX_VERSION
+                    or arrays["source_mtime"] != stat.st_mtime
+                    or arrays["source_size"] != stat.st_size):
+                return None
+            index = OrderedDict(zip(arrays["qids"].tolist(),
+                                    map(tuple, arrays["ranges"].tolist())))
+            gzip_index = None
+            if arrays["gzip"]:
+                gzip_index = gzindex.GzipIndex(*[arrays["gzip_" + name]
+                    for name in ["in_offsets", "out_offsets", "bits",
+                                 "windows", "window_offsets"]])
+            return index, gzip_index
+    except (IOError, OSError, ValueError, KeyError):
+        return None
 
 
-def write_queries(filename, queries):
+def load_query_index(filename, cache=False):
+    """The byte range of each query in the (uncompressed) data of filename,
+    and for gzipped files a gzindex.GzipIndex (or None). A stored index is
+    used while filename is unchanged. If cache is True, a newly built index
+    is stored next to filename."""
+    stored = read_query_index(filename)
+    if stored is not None:
+        if stored[1] is not None or not filename.endswith(".gz") or \
+                not gzindex.is_available():
+            return stored
+    index, gzip_index = build_query_index(filename)
+    if not cache:
+        return index, gzip_index
+    try:
+        write_query_index(filename, index, gzip_index)
+    except (IOError, OSError) as e:
+        logging.warn("Could not store query index for %s: %s" % (filename,
+                                                                 e))
+    return index, gzip_index
+
+
+def write_queries(filename, queries, sparse=False):
     """Utility method for writing queries to a file. Returns the number of
         queries written"""
-    if os.path.exists(filename):
-        raise ValueError("Target file already exists: %s" % filename)
-    if filename.endswith(".gz"):
-        fh = gzip.open(filename, "w")
-    else:
-        fh = open(filename, "w")
-    query_count = 0
-    for query in queries:
-        query.write_to(fh)
-        query_count += 1
-    fh.close()
+    writer = QueryWriter(filename, sparse)
+    query_count = writer.write_all(queries)
+    writer.close()
     return query_count
@@ -0,0 +1,81 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import random
+
+import numpy as np
+
+from ..utils import split_arg_str
+
+
+class AbstractQuerySampler(object):
+    """Base class for query samplers, which decide which training query is
+    shown next in a learning experiment. Samplers generate batch_size query
+    indexes at once (vectorized), so that drawing a query is a list lookup.
+    Derived classes implement sample_indexes, drawing from random_state, and
+    can add arguments with add_arguments."""
+
+    def __init__(self, queries, arg_str=""):
+        parser = argparse.ArgumentParser(prog=self.__class__.__name__)
+        parser.add_argument("--batch_size", type=int, default=10000,
+            help="Number of query indexes to generate at once.")
+        parser.add_argument("--seed", type=int, default=None,
+            help="Seed of the random state of the sampler. By default it is "
+            "drawn from the random module, so that experiments seeded with "
+            "random.seed are reproducible.")
+        self.add_arguments(parser)
+        args, unknown = parser.parse_known_args(split_arg_str(arg_str or ""))
+        if unknown:
+            # e.g. a misspelled option would silently use the defaults
+            raise ValueError("Unknown arguments for %s: %s" %
+                             (self.__class__.__name__, " ".join(unknown)))
+        args = vars(args)
+        if args["batch_size"] < 1:
+            raise ValueError("batch_size needs to be positive, got %d" %
+                             args["batch_size"])
+        self.batch_size = args["batch_size"]
+        seed = args["seed"]
+        if seed is None:
+            seed = random.randint(0, 2 ** 32 - 1)
+        self.random_state = np.random.RandomState(seed)
+        self.query_keys = sorted(queries.keys())
+        if not self.query_keys:
+            raise ValueError("Cannot sample from an empty set of queries.")
+        self.sample_count = 0
+        self.__batch__ = []
+        self.__position__ = 0
+        self.init(queries, args)
+
+    def add_arguments(self, parser):
+        pass
+
+    def init(self, queries, args):
+        pass
+
+    def sample_indexes(self, size):
+        """Return an array of size indexes into query_keys."""
+        raise NotImplementedError("Derived class needs to implement "
+            "sample_indexes.")
+
+    def next(self):
+        """Return the qid of the next query."""
+        if self.__position__ >= len(self.__batch__):
+            self.__batch__ = self.sample_indexes(self.batch_size).tolist()
+            self.__position__ = 0
+        index = self.__batch__[self.__position__]
+        self.__position__ += 1
+        self.sample_count += 1
+        return self.query_keys[index]
@@ -0,0 +1,60 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+
+
+class AliasTable:
+    """Sample indexes 0..n-1 proportionally to a vector of non-negative
+    weights in constant time per sample, using Vose's alias method. The
+    table is built once in O(n)."""
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=float)
+        if weights.ndim != 1 or len(weights) == 0:
+            raise ValueError("Need a non-empty vector of weights.")
+        if (weights < 0).any() or not np.isfinite(weights).all():
+            raise ValueError("Weights need to be finite and non-negative.")
+        total = weights.sum()
+        if total <= 0:
+            raise ValueError("At least one weight needs to be positive.")
+        n = len(weights)
+        self.probabilities = weights / total
+        scaled = weights * n / total
+        # columns left over at the end keep probability 1 (their scaled
+        # weight is 1 up to rounding errors)
+        self.prob = np.ones(n)
+        self.alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+
+    def __len__(self):
+        return len(self.prob)
+
+    def sample(self, size=None, random_state=np.random):
+        """Draw one index, or an array of size indexes."""
+        columns = random_state.randint(len(self.prob), size=size)
+        keep = random_state.random_sample(size) < self.prob[columns]
+        return np.where(keep, columns, self.alias[columns])
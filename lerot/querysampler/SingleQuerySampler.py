@@ -0,0 +1,28 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from .AbstractQuerySampler import AbstractQuerySampler
+
+
+class SingleQuerySampler(AbstractQuerySampler):
+    """Pick one query at random, and show only that query."""
+
+    def init(self, queries, args):
+        self.index = self.random_state.randint(len(self.query_keys))
+
+    def sample_indexes(self, size):
+        return np.repeat(self.index, size)
@@ -0,0 +1,51 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from .AbstractQuerySampler import AbstractQuerySampler
+from .AliasTable import AliasTable
+
+
+class StratifiedQuerySampler(AbstractQuerySampler):
+    """Sample a stratum uniformly at random, and then a query uniformly from
+    that stratum. With stratify "length", queries are split into num_strata
+    quantiles of their number of documents; with "labels", queries are
+    grouped by the number of distinct relevance labels they have. All queries
+    are inspected once on initialization."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stratify", choices=["length", "labels"],
+                            default="length")
+        parser.add_argument("--num_strata", type=int, default=4)
+
+    def init(self, queries, args):
+        if args["stratify"] == "length":
+            lengths = np.array([queries[qid].get_document_count()
+                                for qid in self.query_keys])
+            edges = np.percentile(lengths, np.linspace(0, 100,
+                                  args["num_strata"] + 1)[1:-1])
+            self.strata = np.searchsorted(edges, lengths, side="right")
+        else:
+            self.strata = np.array([
+                len(queries[qid].get_label_index().label_values)
+                for qid in self.query_keys])
+        _, stratum_index = np.unique(self.strata, return_inverse=True)
+        stratum_sizes = np.bincount(stratum_index)
+        # every stratum gets the same total weight
+        self.table = AliasTable(1.0 / stratum_sizes[stratum_index])
+
+    def sample_indexes(self, size):
+        return self.table.sample(size, self.random_state)
@@ -0,0 +1,23 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+from .AbstractQuerySampler import AbstractQuerySampler
+
+
+class UniformQuerySampler(AbstractQuerySampler):
+    """Sample queries uniformly at random, with replacement."""
+
+    def sample_indexes(self, size):
+        return self.random_state.randint(len(self.query_keys), size=size)
@@ -0,0 +1,59 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import logging
+
+from .AbstractQuerySampler import AbstractQuerySampler
+from .AliasTable import AliasTable
+
+
+class WeightedQuerySampler(AbstractQuerySampler):
+    """Sample queries proportionally to a weight per query, e.g., query
+    frequencies observed in a production log. Weights are read from
+    weights_file (optionally gzipped), which has one "qid weight" pair per
+    line; queries that are not listed get default_weight. Each sample takes
+    constant time (see AliasTable)."""
+
+    def add_arguments(self, parser):
+        parser.add_argument("--weights_file", required=True)
+        parser.add_argument("--default_weight", type=float, default=0.0)
+
+    def init(self, queries, args):
+        weights = dict((qid, args["default_weight"])
+                       for qid in self.query_keys)
+        if args["weights_file"].endswith(".gz"):
+            fh = gzip.open(args["weights_file"])
+        else:
+            fh = open(args["weights_file"])
+        unknown = 0
+        for line in fh:
+            tokens = line.split()
+            if not tokens or tokens[0].startswith("#"):
+                continue
+            if len(tokens) != 2:
+                raise ValueError("Expected \"qid weight\", found: %s" % line)
+            if tokens[0] in weights:
+                weights[tokens[0]] = float(tokens[1])
+            else:
+                unknown += 1
+        fh.close()
+        if unknown:
+            logging.warn("%d qids in %s are not in the training queries" %
+                         (unknown, args["weights_file"]))
+        self.table = AliasTable([weights[qid] for qid in self.query_keys])
+
+    def sample_indexes(self, size):
+        return self.table.sample(size, self.random_state)
@@ -0,0 +1,35 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+from AliasTable import AliasTable
+from AbstractQuerySampler import AbstractQuerySampler
+from CyclicQuerySampler import CyclicQuerySampler
+from SingleQuerySampler import SingleQuerySampler
+from StratifiedQuerySampler import StratifiedQuerySampler
+from UniformQuerySampler import UniformQuerySampler
+from WeightedQuerySampler import WeightedQuerySampler
+
+# short names for query_sampling_method, other values are taken to be class
+# names (e.g., querysampler.WeightedQuerySampler)
+QUERY_SAMPLING_METHODS = {"random": "querysampler.UniformQuerySampler",
+                          "fixed": "querysampler.CyclicQuerySampler",
+                          "one": "querysampler.SingleQuerySampler",
+                          "weighted": "querysampler.WeightedQuerySampler",
+                          "stratified": "querysampler.StratifiedQuerySampler"}
+
+__all__ = ['AliasTable', 'AbstractQuerySampler', 'CyclicQuerySampler',
+           'SingleQuerySampler', 'StratifiedQuerySampler',
+           'UniformQuerySampler', 'WeightedQuerySampler',
+           'QUERY_SAMPLING_METHODS']
@@ -0,0 +1,114 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from lerot.query import Query
+from lerot.querysampler import (AliasTable, CyclicQuerySampler,
+    SingleQuerySampler, StratifiedQuerySampler, UniformQuerySampler,
+    WeightedQuerySampler)
+
+
+class TestQuerySamplers(unittest.TestCase):
+
+    def setUp(self):
+        self.queries = {}
+        for qid, labels in [("1", [0, 1]), ("2", [0, 0, 0, 0]),
+                            ("3", [2, 1, 0]), ("4", [0, 0, 1, 1, 0, 0])]:
+            self.queries[qid] = Query(qid, np.zeros((len(labels), 2)),
+                                      np.array(labels))
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _frequencies(self, sampler, n=20000):
+        qids = [sampler.next() for _ in range(n)]
+        return dict((qid, qids.count(qid) / float(n))
+                    for qid in sorted(self.queries))
+
+    def testAliasTable(self):
+        weights = [1, 0, 3, 6]
+        table = AliasTable(weights)
+        samples = table.sample(100000)
+        observed = np.bincount(samples, minlength=4) / 100000.
+        self.assertTrue(np.allclose([.1, 0, .3, .6], observed, atol=.01))
+        self.assertIn(table.sample(), [0, 2, 3])
+        self.assertRaises(ValueError, AliasTable, [0, 0])
+        self.assertRaises(ValueError, AliasTable, [1, -1])
+
+    def testCyclic(self):
+        sampler = CyclicQuerySampler(self.queries, "--batch_size 3")
+        self.assertEqual(["1", "2", "3", "4", "1", "2", "3"],
+                         [sampler.next() for _ in range(7)])
+
+    def testSingle(self):
+        sampler = SingleQuerySampler(self.queries, "--batch_size 2")
+        self.assertEqual(1, len(set(sampler.next() for _ in range(5))))
+
+    def testUnknownArguments(self):
+        self.assertRaises(ValueError, UniformQuerySampler, self.queries,
+                          "--batchsize 10")
+        self.assertRaises(ValueError, UniformQuerySampler, self.queries,
+                          "--batch_size 10 100")
+
+    def testSeed(self):
+        draw = lambda sampler: [sampler.next() for _ in range(20)]
+        self.assertEqual(
+            draw(UniformQuerySampler(self.queries, "--seed 3")),
+            draw(UniformQuerySampler(self.queries, "--seed 3")))
+        # without a seed, the random module seeds the sampler
+        random.seed(5)
+        expected = draw(UniformQuerySampler(self.queries))
+        random.seed(5)
+        self.assertEqual(expected, draw(UniformQuerySampler(self.queries)))
+
+    def testUniform(self):
+        sampler = UniformQuerySampler(self.queries)
+        for frequency in self._frequencies(sampler).values():
+            self.assertAlmostEqual(.25, frequency, delta=.02)
+
+    def testWeighted(self):
+        weights_file = os.path.join(self.tmp_dir, "weights.txt")
+        with open(weights_file, "w") as fh:
+            fh.write("# qid frequency\n1 3\n3 1\n99 5\n")
+        sampler = WeightedQuerySampler(self.queries,
+            "--weights_file %s --batch_size 100" % weights_file)
+        frequencies = self._frequencies(sampler)
+        self.assertAlmostEqual(.75, frequencies["1"], delta=.02)
+        self.assertAlmostEqual(.25, frequencies["3"], delta=.02)
+        self.assertEqual(0, frequencies["2"] + frequencies["4"])
+
+    def testStratified(self):
+        # strata by number of distinct labels: {2}, {1}, {3}, so that "1"
+        # and "4" share a stratum
+        sampler = StratifiedQuerySampler(self.queries, "--stratify labels")
+        frequencies = self._frequencies(sampler)
+        for qid, expected in [("1", 1 / 6.), ("2", 1 / 3.), ("3", 1 / 3.),
+                              ("4", 1 / 6.)]:
+            self.assertAlmostEqual(expected, frequencies[qid], delta=.02)
+        sampler = StratifiedQuerySampler(self.queries,
+                                         "--stratify length --num_strata 2")
+        self.assertEqual([0, 1, 0, 1], sampler.strata.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
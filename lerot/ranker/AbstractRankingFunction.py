@@ -13,46 +13,202 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
-from ..utils import get_class
+import copy
+from itertools import count
+
+import numpy as np
+
+from ..utils import get_class, rank_order, split_by_offsets
+from .DocumentIndex import DocumentIndex
+from .RankingCache import RankingCache
+
+# every weight vector a ranking function is given gets a new version, so
+# that cached rankings of different weights never share a key
+_weight_versions = count()
 
 
 class AbstractRankingFunction:
     """Abstract base class for ranking functions."""
 
+    # attributes that init_ranking sets for the current query, candidate
+    # rankers (see get_candidate_ranker) do not inherit them
+    QUERY_STATE = ("qid", "dirty", "doc_index", "sampler", "docs", "doc_idx",
+                   "initial_state")
+    # number of queries for which scores and rankings are cached, see
+    # rank_query
+    CACHE_SIZE = 64
+
     def __init__(self,
                  ranker_arg_str,
                  ties,
                  feature_count,
                  init="random",
-                 sample="sample_unit_sphere"):
+                 sample="sample_unit_sphere",
+                 depth=None):
 
         self.feature_count = feature_count
+        # only the depth highest ranked documents of a query are sorted in
+        # init_ranking, the others when they are needed (see index_documents)
+        self.depth = depth
         ranking_model_str = "ranker.model.Linear"
+        # arguments of the form name=value are passed to the ranking model,
+        # e.g. hidden_size=20 for ranker.model.OneHiddenLayer
+        model_args = {}
         for arg in ranker_arg_str:
             if type(arg) is str and arg.startswith("ranker.model"):
                 ranking_model_str = arg
+            elif type(arg) is str and "=" in arg:
+                name, value = arg.split("=", 1)
+                model_args[name.strip()] = self._parse_model_arg(value.strip())
             elif type(arg) is int or type(arg) is float:
                 self.ranker_type = float(arg)
-        self.ranking_model = get_class(ranking_model_str)(feature_count)
+        self.ranking_model = get_class(ranking_model_str)(feature_count,
+                                                          **model_args)
 
         if sample:
             self.sample = get_class("utils." + sample)
 
         self.ties = ties
-        self.w = self.ranking_model.initialize_weights(init)
+        self.ranking_cache = RankingCache(self.CACHE_SIZE)
+        self.update_weights(self.ranking_model.initialize_weights(init))
+
+    @staticmethod
+    def _parse_model_arg(value):
+        for parse in (int, float):
+            try:
+                return parse(value)
+            except ValueError:
+                pass
+        return value
 
     def score(self, features):
         return self.ranking_model.score(features, self.w.transpose())
 
+    def score_batch(self, features, offsets, weights=None):
+        """Score the documents of many queries at once. features holds the
+        feature vectors of all queries, those of query i are the rows
+        offsets[i]:offsets[i + 1] (see Queries.get_feature_matrix). Scores
+        for the current weights, or for each row of weights if that is a
+        2-d array. Returns a list with the scores of each query (with one
+        column per weight vector for 2-d weights)."""
+        if weights is None:
+            weights = self.w
+        return split_by_offsets(
+            self.ranking_model.score_batch(features, weights), offsets)
+
+    def rank_query(self, query, depth=None):
+        """Returns the scores of the documents of query and the positions of
+        the documents in rank order, or of only the depth highest ranked
+        ones. Both are cached per (weight version, qid), so that ranking the
+        same query again, e.g. for inferring the outcome of an interleaving,
+        does not score it again. With random tie breaking the documents are
+        sorted again on each call, so that ties are broken independently
+        each time."""
+        key = (self.weight_version, query.get_qid())
+        entry = self.ranking_cache.get(key)
+        if entry is None or entry[0] is not query:
+            scores = self.ranking_model.score(query.get_feature_vectors(),
+                                              self.w.transpose())
+            entry = (query, scores, None)
+            self.ranking_cache.put(key, entry)
+        query, scores, order = entry
+        if depth is not None and depth >= len(scores):
+            depth = None
+        if order is None or len(order) < (len(scores) if depth is None
+                                          else depth):
+            order = rank_order(scores, ties=self.ties, k=depth)
+            if self.ties != "random":
+                self.ranking_cache.put(key, (query, scores, order))
+        return scores, order[:depth]
+
+    def index_documents(self, query, depth=None):
+        """Returns a DocumentIndex of the documents of query in rank order.
+        With a depth (by default that of this ranking function), only the
+        depth highest ranked documents are sorted right away, and the others
+        only once one of them is needed."""
+        if depth is None:
+            depth = self.depth
+        scores, order = self.rank_query(query, depth)
+        docids = query.get_docids()
+        head = [docids[pos] for pos in order]
+        if len(head) == len(docids):
+            return DocumentIndex(head)
+        ties = self.ties
+
+        def get_tail():
+            rest = np.ones(len(docids), dtype=bool)
+            rest[order] = False
+            rest = np.flatnonzero(rest)
+            return [docids[pos] for pos in
+                    rest[rank_order(np.asarray(scores)[rest], ties=ties)]]
+
+        return DocumentIndex(head, len(docids) - len(head), get_tail)
+
     def get_candidate_weight(self, delta):
         u = self.sample(self.ranking_model.get_feature_count())
         return self.w + delta * u, u
 
+    def get_candidate_weights(self, delta, num_candidates):
+        """Returns the weights of num_candidates candidates as the rows of
+        a matrix, and the sampled directions u (see get_candidate_weight)."""
+        u = np.vstack([self.sample(self.ranking_model.get_feature_count())
+                       for _ in range(num_candidates)])
+        return self.w + delta * u, u
+
+    def cache_scores(self, query, scores):
+        """Use scores as the scores of the documents of query for the current
+        weights, e.g. when they were computed for several rankers at once
+        with score_batch. rank_query then only sorts them."""
+        self.ranking_cache.put((self.weight_version, query.get_qid()),
+                               (query, scores, None))
+
+    def get_candidate_ranker(self, w):
+        """Returns a ranking function like this one, but with weights w. The
+        candidate shares the ranking model and configuration with this
+        ranking function, and only has its own weights and per-query state,
+        so creating one costs no more than a shallow copy."""
+        candidate = copy.copy(self)
+        for name in self.QUERY_STATE:
+            candidate.__dict__.pop(name, None)
+        candidate.ranking_cache = RankingCache(self.CACHE_SIZE)
+        candidate.update_weights(w)
+        return candidate
+
     def init_ranking(self, query):
         self.dirty = False
         raise NotImplementedError("Derived class needs to implement "
             "init_ranking.")
 
+    def snapshot(self):
+        """Returns a checkpoint of the per-query state (the documents that
+        remain). restore puts back the documents removed since then, without
+        ranking them again. Checkpoints are O(1); restoring one invalidates
+        the checkpoints taken after it."""
+        raise NotImplementedError("Derived class needs to implement "
+            "snapshot.")
+
+    def restore(self, snapshot):
+        raise NotImplementedError("Derived class needs to implement "
+            "restore.")
+
+    def _save_initial_state(self, query):
+        """Keep the state after init_ranking, for reset_ranking."""
+        self.initial_state = (query, self.weight_version, self.snapshot())
+
+    def reset_ranking(self, query):
+        """Like init_ranking, but if the ranking function was last
+        initialized for the same query with its current weights, the state
+        it had right after that is restored instead. Comparison methods use
+        this to undo next and rm_document; the documents are not scored and
+        sorted again, and random ties stay broken as they were."""
+        state = getattr(self, "initial_state", None)
+        if state is not None and state[0] is query and \
+                state[1] == self.weight_version:
+            self.restore(state[2])
+            self.dirty = False
+        else:
+            self.init_ranking(query)
+
     def next(self):
         self.dirty = True
         raise NotImplementedError("Derived class needs to implement "
@@ -73,6 +229,12 @@ class AbstractRankingFunction:
             "get_document_probability.")
 
 
+    def get_document_rank(self, docid):
+        """Rank (from 1) of docid among the remaining documents, None if it
+        does not remain."""
+        raise NotImplementedError("Derived class needs to implement "
+            "get_document_rank.")
+
     def getDocs(self, numdocs=None):
         if not hasattr(self, "dirty"):
             raise NotImplementedError("Derived class should (re)set self.dirty")
@@ -99,8 +261,10 @@ class AbstractRankingFunction:
             "document_count.")
 
     def update_weights(self, w, alpha=None):
-        """update weight vector"""
+        """update weight vector, this invalidates cached rankings"""
         if alpha == None:
             self.w = w
         else:
             self.w = self.w + alpha * w
+        self.weight_version = next(_weight_versions)
+        self.ranking_cache.clear()
@@ -14,38 +14,46 @@
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
 from random import randint
+import numpy as np
 
 from .AbstractRankingFunction import AbstractRankingFunction
-from ..utils import rank
 
 
 class DeterministicRankingFunction(AbstractRankingFunction):
 
-    def init_ranking(self, query):
+    def init_ranking(self, query, depth=None):
         self.dirty = False
 
         self.qid = query.get_qid()
-        scores = self.ranking_model.score(query.get_feature_vectors(),
-                                          self.w.transpose())
-        ranks = rank(scores, reverse=False, ties=self.ties)
         # sort documents by ranks, ties are broken at random by default
-        ranked_docids = []
-        for pos, docid in enumerate(query.get_docids()):
-            ranked_docids.append((ranks[pos], docid))
-        ranked_docids.sort(reverse=True)
-        self.docids = [docid for (_, docid) in ranked_docids]
+        self.doc_index = self.index_documents(query, depth)
+        self._save_initial_state(query)
+
+    def snapshot(self):
+        return self.doc_index.checkpoint()
+
+    def restore(self, snapshot):
+        self.doc_index.rollback(snapshot)
+
+    @property
+    def docids(self):
+        """The remaining documents in rank order."""
+        return self.doc_index.remaining()
 
     def document_count(self):
-        return len(self.docids)
+        return len(self.doc_index)
+
+    def get_document_rank(self, docid):
+        return self.doc_index.get_rank(docid)
 
     def next(self):
         """produce the next document"""
 
         # if there are no more documents
-        if len(self.docids) < 1:
+        if len(self.doc_index) < 1:
             raise Exception("There are no more documents to be selected")
         # otherwise, return highest ranked document
-        return self.docids.pop(0)  # pop first element
+        return self.doc_index.remove(self.doc_index.first())
 
     def next_det(self):
         return self.next()
@@ -54,27 +62,21 @@ class DeterministicRankingFunction(AbstractRankingFunction):
         """produce a random next document"""
 
         # if there are no more documents
-        if len(self.docids) < 1:
+        if len(self.doc_index) < 1:
             raise Exception("There are no more documents to be selected")
         # otherwise, return a random document
-        rn = randint(0, len(self.docids) - 1)
-        return self.docids.pop(rn)
+        rn = randint(0, len(self.doc_index) - 1)
+        return self.doc_index.remove(self.doc_index.select(rn))
 
     def get_document_probability(self, docid):
         """get probability of producing doc as the next document drawn"""
-        pos = self.docids.index(docid)
-        return 1.0 if pos == 0 else 0.0
+        slot = self.doc_index.get_slot(docid)
+        return 1.0 if slot == self.doc_index.first() else 0.0
 
     def rm_document(self, docid):
         """remove doc from list of available docs and adjust probabilities"""
-        # find position of the document
-        pos = self.docids.index(docid)
-        # delete doc and renormalize
-        self.docids.pop(pos)
+        self.doc_index.remove(self.doc_index.get_slot(docid))
 
     def getDocs(self, numdocs=None):
         """ Copied from StatelessRankingFunction. """
-        if numdocs is None:
-            return self.docids
-        else:
-            return self.docids[:numdocs]
\ No newline at end of file
+        return self.doc_index.remaining(numdocs)
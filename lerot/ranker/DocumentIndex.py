@@ -0,0 +1,181 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+
+
+def build_fenwick_tree(values):
+    """Fenwick (binary indexed) tree of values as a 1-based list: element i
+    holds the sum of values (i - lowbit(i), i]."""
+    sums = np.zeros(len(values) + 1)
+    sums[1:] = np.cumsum(values)
+    index = np.arange(1, len(values) + 1)
+    return [0.0] + (sums[index] - sums[index - (index & -index)]).tolist()
+
+
+def descend_fenwick_tree(tree, target):
+    """Returns the largest pos such that the sum of the first pos values in
+    tree is at most target (values must be non-negative)."""
+    n = len(tree) - 1
+    pos = 0
+    step = 1 << (n.bit_length() - 1) if n else 0
+    while step:
+        next_pos = pos + step
+        if next_pos <= n and tree[next_pos] <= target:
+            target -= tree[next_pos]
+            pos = next_pos
+        step >>= 1
+    return pos
+
+
+class DocumentIndex:
+    """The documents of a ranking and which of them remain. Documents are
+    identified by their slot, their position in the initial ranking, and
+    are removed by marking the slot, not by shifting a list. Looking up the
+    slot of a document and removal are O(1), the position of a slot among
+    the remaining ones and the slot at a position are O(log n), using a
+    Fenwick tree of remaining slots.
+
+    Only the head of a ranking may be given, with the number of documents
+    that follow it (tail_size) and a function that returns those in rank
+    order (get_tail). The tail is then only ranked once one of its slots or
+    documents is needed."""
+
+    def __init__(self, docids, tail_size=0, get_tail=None):
+        self.ranked = list(docids)
+        self.slots = dict((docid, slot)
+                          for slot, docid in enumerate(self.ranked))
+        self.__size__ = len(self.ranked) + tail_size
+        self.__tail__ = get_tail if tail_size else None
+        self.removed = [False] * self.__size__
+        self.__count__ = self.__size__
+        self.__counts__ = build_fenwick_tree(np.ones(self.__size__))
+        self.__first__ = 0
+        self.__undo__ = []
+
+    def __load_tail__(self):
+        """Rank the tail, if that has not been done yet."""
+        if self.__tail__ is None:
+            return
+        tail = list(self.__tail__())
+        self.__tail__ = None
+        if len(self.ranked) + len(tail) != self.__size__:
+            raise ValueError("Expected %d documents in the tail, got %d" %
+                             (self.__size__ - len(self.ranked), len(tail)))
+        start = len(self.ranked)
+        self.ranked.extend(tail)
+        self.slots.update((docid, start + i) for i, docid in enumerate(tail))
+
+    def __len__(self):
+        return self.__count__
+
+    def checkpoint(self):
+        """Marks the documents that remain now, see rollback."""
+        return len(self.__undo__)
+
+    def rollback(self, checkpoint):
+        """Put back the documents removed since checkpoint, in reverse order
+        of removal. This takes O(log n) per document put back."""
+        undo = self.__undo__
+        if checkpoint > len(undo):
+            raise ValueError("Cannot roll back to a later checkpoint")
+        while len(undo) > checkpoint:
+            slot = undo.pop()
+            self.removed[slot] = False
+            self.__count__ += 1
+            self.__update_counts__(slot, 1)
+            if slot < self.__first__:
+                self.__first__ = slot
+
+    def __update_counts__(self, slot, delta):
+        counts = self.__counts__
+        i, n = slot + 1, self.__size__
+        while i <= n:
+            counts[i] += delta
+            i += i & -i
+
+    def get_slot(self, docid):
+        """Slot of a remaining document, raises ValueError otherwise."""
+        slot = self.slots.get(docid)
+        if slot is None and self.__tail__ is not None:
+            self.__load_tail__()
+            slot = self.slots.get(docid)
+        if slot is None or self.removed[slot]:
+            raise ValueError("%s is not in the remaining documents" %
+                             (docid,))
+        return slot
+
+    def get_rank(self, docid):
+        """Rank (from 1) of a document among the remaining ones, None if it
+        does not remain."""
+        slot = self.slots.get(docid)
+        if slot is None and self.__tail__ is not None:
+            self.__load_tail__()
+            slot = self.slots.get(docid)
+        if slot is None or self.removed[slot]:
+            return None
+        return self.position(slot) + 1
+
+    def remove(self, slot):
+        """Remove slot, returns its document."""
+        if not self.removed[slot]:
+            self.removed[slot] = True
+            self.__count__ -= 1
+            self.__update_counts__(slot, -1)
+            self.__undo__.append(slot)
+        if slot >= len(self.ranked):
+            self.__load_tail__()
+        return self.ranked[slot]
+
+    def first(self):
+        """Lowest remaining slot."""
+        if not self.__count__:
+            raise ValueError("There are no documents left")
+        while self.removed[self.__first__]:
+            self.__first__ += 1
+        return self.__first__
+
+    def position(self, slot):
+        """Number of remaining slots before slot."""
+        count = 0
+        counts = self.__counts__
+        while slot > 0:
+            count += counts[slot]
+            slot -= slot & -slot
+        return int(count)
+
+    def select(self, position):
+        """Slot of the remaining document at position."""
+        if not 0 <= position < self.__count__:
+            raise IndexError("No remaining document at position %d" %
+                             position)
+        return descend_fenwick_tree(self.__counts__, position)
+
+    def remaining(self, limit=None):
+        """The remaining documents in rank order, at most limit."""
+        if limit is None or limit >= self.__count__:
+            self.__load_tail__()
+            removed = self.removed
+            return [docid for slot, docid in enumerate(self.ranked)
+                    if not removed[slot]]
+        docids = []
+        slot = self.__first__
+        while len(docids) < limit:
+            if slot >= len(self.ranked):
+                self.__load_tail__()
+            if not self.removed[slot]:
+                docids.append(self.ranked[slot])
+            slot += 1
+        return docids
@@ -17,118 +17,110 @@ from random import random, randint
 import numpy as np
 
 from .AbstractRankingFunction import AbstractRankingFunction
-from ..utils import rank
+from .DocumentIndex import DocumentIndex
+from .RankSampler import RankSampler
 
 
 class ProbabilisticRankingFunction(AbstractRankingFunction):
+    """Draws documents with probability proportional to
+    1 / rank ** ranker_type (softmax-by-rank). Document lookups take O(1),
+    draws and removals O(log n), see DocumentIndex and RankSampler."""
 
-    def init_ranking(self, query):
+    def init_ranking(self, query, depth=None):
         self.dirty = False
         self.qid = query.get_qid()
-        scores = self.ranking_model.score(query.get_feature_vectors(),
-                                          self.w.transpose())
-        # rank scores
-        ranks = rank(scores, ties=self.ties, reverse=False)
-        # get docids for the ranked scores
-        ranked_docids = []
-        for pos, docid in enumerate(query.__docids__):
-            ranked_docids.append((ranks[pos], docid))
-        # sort docids by rank
-        ranked_docids.sort(reverse=True)
-        self.docids = [docid for (_, docid) in ranked_docids]
-        # break ties randomly and sort ranks to compute probabilities
-        ranks = np.asarray([i + 1.0 for i in
-            sorted(rank(scores, ties=self.ties, reverse=False))])
-        # determine probabilities based on (reverse) document ranks
-        max_rank = len(ranks)
-        tmp_val = max_rank / pow(ranks, self.ranker_type)
-        self.probs = tmp_val / sum(tmp_val)
+        # sort docids by rank, the weights only depend on the number of
+        # documents, so that the tail beyond depth need not be sorted yet
+        self.doc_index = self.index_documents(query, depth)
+        self.sampler = RankSampler(self._get_rank_weights(len(
+            self.doc_index)))
+        self._save_initial_state(query)
+
+    def _get_rank_weights(self, max_rank):
+        """Sampling weights of the documents at ranks 1..max_rank."""
+        key = (self.ranker_type, max_rank)
+        cached = getattr(self, "_rank_weights", None)
+        if cached is None or cached[0] != key:
+            # ranks are unique, so the sorted ranks are 1..n
+            ranks = np.arange(1.0, max_rank + 1)
+            # determine probabilities based on (reverse) document ranks
+            cached = (key, max_rank / pow(ranks, self.ranker_type))
+            self._rank_weights = cached
+        return cached[1]
+
+    def _init_sampler(self, docids, weights):
+        """Sample from docids (in rank order) proportional to weights."""
+        self.doc_index = DocumentIndex(docids)
+        self.sampler = RankSampler(weights)
+
+    def snapshot(self):
+        return self.doc_index.checkpoint(), self.sampler.checkpoint()
+
+    def restore(self, snapshot):
+        self.doc_index.rollback(snapshot[0])
+        self.sampler.rollback(snapshot[1])
+
+    @property
+    def docids(self):
+        """The remaining documents in rank order."""
+        return self.doc_index.remaining()
+
+    def _get_slot(self, docid):
+        """Slot of a remaining document, raises ValueError otherwise."""
+        return self.doc_index.get_slot(docid)
+
+    def _remove_slot(self, slot):
+        self.sampler.remove(slot)
+        return self.doc_index.remove(slot)
 
     def document_count(self):
-        return len(self.docids)
+        return len(self.doc_index)
+
+    def get_document_rank(self, docid):
+        return self.doc_index.get_rank(docid)
 
     def next(self):
         """produce the next document by random sampling, or
         deterministically"""
 
         # if there are no more documents
-        if len(self.docids) < 1:
+        if len(self.doc_index) < 1:
             raise Exception("There are no more documents to be selected")
-
-        # if there's only one document
-        if len(self.docids) == 1:
-            self.probs = np.delete(self.probs, 0)  # should be empty now
-            pick = self.docids.pop()  # pop, because it's a list
-            return pick
-
-        # sample if there are more documents
-        # how to do this efficiently?
-        # take cumulative probabilities, then do binary search?
-        # if we sort docs and probabilities, we can start search at the
-        # beginning. This will be efficient, because we'll look at the most
-        # likely docs first.
-        cumprobs = np.cumsum(self.probs)
-        pick = -1
-        rand = random()  # produces a float in range [0.0, 1.0)
-        for pos, cp in enumerate(cumprobs):
-            if rand < cp:
-                pick = self.docids.pop(pos)  # pop, because it's a list
-                break
-
-        if (pick == -1):
-            print "Cumprobs:", cumprobs
-            print "rand", rand
-            raise Exception("Could not select document!")
-        # renormalize
-        self.probs = np.delete(self.probs, pos)  # delete, it's a numpy array
-        self.probs = self.probs / sum(self.probs)
-        return pick
+        return self._remove_slot(self.sampler.sample(random()))
 
     def next_det(self):
-        pos = 0  # first is the most likely document
-        pick = self.docids.pop(pos)
-        # renormalize
-        self.probs = np.delete(self.probs, pos)  # delete, it's a numpy array
-        self.probs = self.probs / sum(self.probs)
-        return pick
+        # first is the most likely document
+        return self._remove_slot(self.doc_index.first())
 
     def next_random(self):
         """produce a random next document"""
 
         # if there are no more documents
-        if len(self.docids) < 1:
+        if len(self.doc_index) < 1:
             raise Exception("There are no more documents to be selected")
         # otherwise, return a random document
-        rn = randint(0, len(self.docids) - 1)
-        return self.docids.pop(rn)
+        rn = randint(0, len(self.doc_index) - 1)
+        return self._remove_slot(self.doc_index.select(rn))
 
     def get_ranking(self):
         return self.docids
 
     def get_document_probability(self, docid):
         """get probability of producing doc as the next document drawn"""
-        pos = self.docids.index(docid)
-        return self.probs[pos]
+        return self.sampler.get_probability(self._get_slot(docid))
 
     def rm_document(self, docid):
         """remove doc from list of available docs and adjust probabilities"""
-        # find position of the document
         try:
-            pos = self.docids.index(docid)
+            slot = self._get_slot(docid)
         except ValueError:
 #            raise Exception("Cannot remove %s. Current document list: %s "
 #                            "for qid: %s. \nProbably, you are trying to "
 #                            "interleave two identical rankers." %
 #                            (docid, self.docids, self.qid))
             return
-        # delete doc and renormalize
-        self.docids.pop(pos)
-        self.probs = np.delete(self.probs, pos)
-        self.probs = self.probs / sum(self.probs)
+        self._remove_slot(slot)
 
     def getDocs(self, numdocs=None):
         """ Copied from StatelessRankingFunction. """
-        if numdocs is None:
-            return self.docids
-        else:
-            return self.docids[:numdocs]
\ No newline at end of file
+        return self.doc_index.remaining(numdocs)
\ No newline at end of file
@@ -0,0 +1,116 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+
+from .DocumentIndex import build_fenwick_tree, descend_fenwick_tree
+
+
+class RankSampler:
+    """Draws slots 0..n-1 without replacement, with probability proportional
+    to their weights. The sum of the weights is kept in a Fenwick (binary
+    indexed) tree, so that drawing and removing a slot take O(log n).
+
+    Removing weights from the sums loses precision when the removed weights
+    are much larger than the remaining ones, so the sums are rebuilt from
+    the remaining weights once the weight removed since the last rebuild
+    exceeds REBUILD_RATIO times the remaining total. This keeps the
+    relative error of probabilities below about 1e-13."""
+
+    REBUILD_RATIO = 1000.0
+
+    def __init__(self, weights):
+        self.weights = np.array(weights, dtype=np.float64)
+        self.removed = np.zeros(len(self.weights), dtype=bool)
+        self.__count__ = len(self.weights)
+        self.__undo__ = []
+        self.__rebuild__()
+
+    def __rebuild__(self):
+        """Rebuild the weight tree from the weights of the remaining slots,
+        which drops rounding errors of earlier removals."""
+        weights = np.where(self.removed, 0.0, self.weights)
+        self.__tree__ = build_fenwick_tree(weights)
+        self.total = float(weights.sum())
+        self.__removed_weight__ = 0.0
+
+    def __len__(self):
+        return self.__count__
+
+    def sample(self, rand):
+        """Returns the remaining slot in which rand * total falls when the
+        remaining weights are laid out in slot order, for rand in [0, 1)."""
+        if not self.__count__:
+            raise ValueError("There are no slots left to sample")
+        n = len(self.weights)
+        slot = descend_fenwick_tree(self.__tree__, rand * self.total)
+        if slot >= n or self.removed[slot]:
+            # rounding errors of earlier removals, use exact weights
+            self.__rebuild__()
+            slot = descend_fenwick_tree(self.__tree__, rand * self.total)
+            if slot >= n or self.removed[slot]:
+                remaining = np.flatnonzero(~self.removed)
+                slot = remaining[min(np.searchsorted(remaining, slot),
+                                     len(remaining) - 1)]
+        return int(slot)
+
+    def checkpoint(self):
+        """Marks the slots that remain now, see rollback."""
+        return len(self.__undo__)
+
+    def rollback(self, checkpoint):
+        """Put back the slots removed since checkpoint, in reverse order of
+        removal. This takes O(log n) per slot put back."""
+        undo = self.__undo__
+        if checkpoint > len(undo):
+            raise ValueError("Cannot roll back to a later checkpoint")
+        while len(undo) > checkpoint:
+            slot = undo.pop()
+            self.removed[slot] = False
+            self.__count__ += 1
+            weight = float(self.weights[slot])
+            self.total += weight
+            self.__update_tree__(slot, weight)
+            # adding weights back rounds like removing them does
+            self.__removed_weight__ += weight
+
+    def __update_tree__(self, slot, weight):
+        i, n = slot + 1, len(self.weights)
+        tree = self.__tree__
+        while i <= n:
+            tree[i] += weight
+            i += i & -i
+
+    def remove(self, slot):
+        if self.removed[slot]:
+            return
+        self.removed[slot] = True
+        self.__count__ -= 1
+        self.__undo__.append(slot)
+        weight = float(self.weights[slot])
+        if not self.__count__:
+            self.total = 0.0
+        else:
+            self.total -= weight
+        self.__update_tree__(slot, -weight)
+        self.__removed_weight__ += weight
+        if self.__removed_weight__ > self.REBUILD_RATIO * self.total:
+            self.__rebuild__()
+
+    def get_probability(self, slot):
+        """Probability that slot is drawn next."""
+        if self.removed[slot]:
+            return 0.0
+        return self.weights[slot] / self.total
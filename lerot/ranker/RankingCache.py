@@ -0,0 +1,54 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+
+
+class RankingCache:
+    """Least recently used cache with at most max_size entries. Ranking
+    functions keep the scores and rankings of recent queries in one, under
+    (weight version, qid) keys."""
+
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.__entries__ = OrderedDict()
+
+    def __len__(self):
+        return len(self.__entries__)
+
+    def __contains__(self, key):
+        return key in self.__entries__
+
+    def get(self, key, default=None):
+        """Returns the value of key and marks it as most recently used."""
+        try:
+            value = self.__entries__.pop(key)
+        except KeyError:
+            return default
+        self.__entries__[key] = value
+        return value
+
+    def put(self, key, value):
+        """Adds or replaces key, evicting the least recently used entry when
+        the cache is full."""
+        self.__entries__.pop(key, None)
+        if self.max_size < 1:
+            return
+        while len(self.__entries__) >= self.max_size:
+            self.__entries__.popitem(last=False)
+        self.__entries__[key] = value
+
+    def clear(self):
+        self.__entries__.clear()
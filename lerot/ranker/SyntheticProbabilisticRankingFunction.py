@@ -13,7 +13,7 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
-from numpy import array, delete
+from numpy import array
 from ProbabilisticRankingFunction import ProbabilisticRankingFunction
 
 
@@ -28,38 +28,21 @@ class SyntheticProbabilisticRankingFunction(ProbabilisticRankingFunction):
         if not synthetic_docids:
             return
         # assume that synthetic_docids are in rank order
-        self.docids = synthetic_docids
-        ranks = array(range(1, len(self.docids) + 1))
+        ranks = array(range(1, len(synthetic_docids) + 1))
         # determine probabilities based on (reverse) document ranks
         tmp_val = 1. / pow(ranks, self.ranker_type)
-        self.probs = tmp_val / sum(tmp_val)
+        self._init_sampler(synthetic_docids, tmp_val)
 
-    def _get_doc_pos(self, docid):
+    def _get_slot(self, docid):
         try:
-            pos = self.docids.index(docid)
-        except:
-            pos = [i for i, d in
-                   enumerate(self.docids) if d[0] == docid][0]
-        return pos
-
-    def get_document_probability(self, docid):
-        """get probability of producing doc as the next document drawn"""
-        pos = self._get_doc_pos(docid)
-        return self.probs[pos]
-
-    def rm_document(self, docid):
-        """remove doc from list of available docs, adjust probabilities"""
-        # find position of the document
-        try:
-            pos = self._get_doc_pos(docid)
+            return ProbabilisticRankingFunction._get_slot(self, docid)
         except ValueError:
-            print "cannot remove", docid,
-            print "current document list:", self.docids
-            print "qid:", self.qid
-        # delete doc and renormalize
-        self.docids.pop(pos)
-        self.probs = delete(self.probs, pos)
-        self.probs = self.probs / sum(self.probs)
+            # documents may also be given as tuples that start with the docid
+            for slot, d in enumerate(self.doc_index.ranked):
+                if not self.doc_index.removed[slot] and \
+                        isinstance(d, tuple) and d[0] == docid:
+                    return slot
+            raise
 
     def update_weights(self, new_weights):
         """not required under synthetic data"""
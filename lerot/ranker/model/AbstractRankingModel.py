@@ -13,7 +13,8 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
-from numpy import array, zeros
+from numpy import (array, asarray, column_stack, float64, floating,
+                   issubdtype, zeros)
 from random import gauss
 
 from ...utils import sample_unit_sphere
@@ -54,6 +55,27 @@ class AbstractRankingModel(object):
                     "list of float values that indicate specific weight values"
                     ". Error: %s" % (method, ex))
 
+    def cast_weights(self, features, w):
+        """Return w in the floating point precision of features, so that
+        e.g. float32 features are scored in float32 rather than converted to
+        float64 first. Weights themselves are kept (and learned) in
+        float64."""
+        dtype = getattr(features, "dtype", None)
+        if dtype is None or dtype == float64 or not issubdtype(dtype,
+                                                               floating):
+            return w
+        return asarray(w, dtype=dtype)
+
+    def score_batch(self, features, weights):
+        """Score features for one weight vector, or for each row of a 2-d
+        weights array. Returns an array with one score per feature vector,
+        or one column of scores per weight vector. Models that can score
+        several weight vectors in one call override this."""
+        weights = asarray(weights)
+        if weights.ndim == 1:
+            return asarray(self.score(features, weights))
+        return column_stack([self.score(features, w) for w in weights])
+
     def score(self, features, w):
         raise NotImplementedError("Derived class needs to implement "
             "next.")
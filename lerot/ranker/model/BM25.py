@@ -19,6 +19,27 @@ from .AbstractRankingModel import AbstractRankingModel
 from ...utils import sample_unit_sphere
 
 
+def score_bm25(features, params):
+    """BM25 scores of documents whose features are groups of four values per
+    query term: idf, tf, qtf and document length (trailing features that do
+    not form a group are ignored, terms with document length 0 are
+    skipped). params is one (k1, k3, b) vector, or one per row of a 2-d
+    array, which gives a column of scores for each. The features are not
+    modified."""
+    features = np.asarray(features)
+    params = np.asarray(params, dtype=np.float64)
+    nr_terms = features.shape[1] // 4
+    terms = features[:, :nr_terms * 4].reshape(len(features), nr_terms, 4)
+    # (documents, terms, 1) against (parameter vectors,)
+    idf, tf, qtf, dl = [terms[:, :, i, np.newaxis] for i in range(4)]
+    k1, k3, b = np.atleast_2d(params).T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = ((idf * tf * (k1 + 1)) / (tf + k1 * (1 - b + b * dl))) * \
+            (((k3 + 1) * qtf) / (k3 + qtf))
+    scores = np.where(dl != 0, s, 0.0).sum(axis=1)
+    return scores if params.ndim > 1 else scores[:, 0]
+
+
 class BM25(AbstractRankingModel):
 
     def __init__(self, feature_count):
@@ -30,19 +51,7 @@ class BM25(AbstractRankingModel):
         return np.array([2.5, 0, 0.8])
 
     def score(self, features, w):
-        scores = []
-        for docfeatures in features:
-            k1, k3, b = w
-            s = 0.0
-            nr_terms = len(docfeatures) / 4
-            for i in range(nr_terms):
-                idf = docfeatures[i * 4]
-                tf = docfeatures[i * 4 + 1]
-                qtf = docfeatures[i * 4 + 2]
-                dl = docfeatures[i * 4 + 3]
-                if dl == 0:
-                    continue
-                s += ((idf * tf * (k1 + 1)) / (tf + k1 * (1-b+b*dl))) * (((k3+1)*qtf)/(k3+qtf))
-            scores.append(s)
-        return scores
-    
+        return score_bm25(features, w)
+
+    def score_batch(self, features, weights):
+        return score_bm25(features, weights)
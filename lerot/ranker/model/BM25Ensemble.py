@@ -16,10 +16,17 @@
 import numpy as np
 
 from .AbstractRankingModel import AbstractRankingModel
+from .BM25 import score_bm25
 from ...utils import sample_unit_sphere
 
 
 class BM25Ensemble(AbstractRankingModel):
+    """A linear model over the first feature_count features, in which
+    feature BM25_FEATURE is replaced by the BM25 score (see BM25) computed
+    from the remaining features. The last three weights are the BM25
+    parameters (k1, k3, b)."""
+
+    BM25_FEATURE = 24
 
     def __init__(self, feature_count):
         self.originalcount = feature_count
@@ -34,24 +41,26 @@ class BM25Ensemble(AbstractRankingModel):
         return np.dot(features, w)
 
     def scoreBM25(self, features, w):
-        k1, k3, b = w
-        s = 0.0
-        nr_terms = len(features) / 4
-        for i in range(nr_terms):
-            idf = features[i * 4]
-            tf = features[i * 4 + 1]
-            qtf = features[i * 4 + 2]
-            dl = features[i * 4 + 3]
-            if dl == 0: continue
-            s += ((idf * tf * (k1 + 1)) / (tf + k1 * (1-b+b*dl))) * (((k3+1)*qtf)/(k3+qtf))
-        return s
+        """BM25 score of one document, or of each row of features."""
+        features = np.asarray(features)
+        if features.ndim == 1:
+            return score_bm25(features[np.newaxis], w)[0]
+        return score_bm25(features, w)
 
     def score(self, features, w):
-        scores = []
-        for docfeatures in features:
-            bm25s = self.scoreBM25(docfeatures[self.originalcount:], w[-3:])
-            docfeatures[24] = bm25s
-            s = self.scoreLinear(docfeatures[:self.originalcount], w[:-3])
-            scores.append(s)
-        return scores
+        return self.score_batch(features, w)
 
+    def score_batch(self, features, weights):
+        features = np.asarray(features)
+        weights = np.asarray(weights, dtype=np.float64)
+        bm25 = score_bm25(features[:, self.originalcount:], weights[..., -3:])
+        linear_w = weights[..., :-3]
+        if self.BM25_FEATURE < self.originalcount:
+            # use the BM25 score instead of the feature, without writing it
+            # into the (caller's) feature matrix
+            bm25_w = linear_w[..., self.BM25_FEATURE].copy()
+            linear_w = linear_w.copy()
+            linear_w[..., self.BM25_FEATURE] = 0
+            return self.scoreLinear(features[:, :self.originalcount],
+                                    linear_w.T) + bm25 * bm25_w
+        return self.scoreLinear(features[:, :self.originalcount], linear_w.T)
@@ -20,4 +20,9 @@ from .AbstractRankingModel import AbstractRankingModel
 class Linear(AbstractRankingModel):
 
     def score(self, features, w):
-        return np.dot(features, w)
+        return np.dot(features, self.cast_weights(features, w))
+
+    def score_batch(self, features, weights):
+        # a single matrix product for all feature vectors and weights
+        return np.dot(features, self.cast_weights(features,
+                                                  np.asarray(weights)).T)
@@ -18,9 +18,13 @@ from .AbstractRankingModel import AbstractRankingModel
 
 
 class OneHiddenLayer(AbstractRankingModel):
+    """Network with one tanh hidden layer of hidden_size units. The weights
+    are the (feature_count + 1) x hidden_size input weights, row by row and
+    starting with the bias of each hidden unit, followed by the hidden_size
+    output weights."""
 
-    def __init__(self, feature_count):
-        self.hiddensize = 10
+    def __init__(self, feature_count, hidden_size=10):
+        self.hiddensize = int(hidden_size)
         self.inputsize = feature_count + 1
         self.feature_count = (self.inputsize * self.hiddensize) \
                                                             + self.hiddensize
@@ -29,11 +33,19 @@ class OneHiddenLayer(AbstractRankingModel):
         return AbstractRankingModel.initialize_weights(self, init_method)
 
     def score(self, features, w):
-        features = np.vstack((np.ones(len(features)),
-                              features.transpose())).transpose()
-        w1 = w[:-self.hiddensize]
-        w1 = w1.reshape((self.inputsize, self.hiddensize))
-        w2 = w[-self.hiddensize:]
-        s = np.tanh(np.dot(np.tanh(np.dot(features, w1)), w2))
-        return s
-    
+        return self.score_batch(features, w)
+
+    def score_batch(self, features, weights):
+        features = np.asarray(features)
+        weights = self.cast_weights(features, np.asarray(weights))
+        stacked = np.atleast_2d(weights)
+        w1 = stacked[:, :-self.hiddensize].reshape((len(stacked),
+            self.inputsize, self.hiddensize))
+        w2 = stacked[:, -self.hiddensize:]
+        # the bias is added to the hidden layer rather than as a column of
+        # ones to the features, so that no (augmented) copy of the feature
+        # matrix is made; hidden is documents x weight vectors x hidden units
+        hidden = np.tanh(np.tensordot(features, w1[:, 1:], axes=([1], [1]))
+                         + w1[:, 0])
+        s = np.tanh(np.einsum("nkh,kh->nk", hidden, w2))
+        return s if weights.ndim > 1 else s[:, 0]
@@ -23,6 +23,8 @@ sys.path.insert(0, os.path.abspath('..'))
 
 from OneHiddenLayer import OneHiddenLayer
 from Linear import Linear
+from BM25 import BM25
+from BM25Ensemble import BM25Ensemble
 
 
 class TestRankers(unittest.TestCase):
@@ -65,5 +67,97 @@ class TestRankers(unittest.TestCase):
             orderings.add(ordering)
         self.assertEqual(reps, len(orderings))
 
+    def testFloat32Scores(self):
+        features = self.features.astype(np.float32)
+        for model, w in [(self.linear_model, self.linear_w),
+                         (self.hidden_model, self.hidden_w)]:
+            scores = model.score(features, w)
+            self.assertEqual(np.float32, scores.dtype)
+            self.assertTrue(np.allclose(model.score(self.features, w),
+                                        scores, atol=1e-5))
+
+    def testScoreBatch(self):
+        weights = np.vstack([self.linear_w, self.linear_w * -2,
+                             np.zeros(self.feature_count)])
+        scores = self.linear_model.score_batch(self.features, weights)
+        self.assertEqual((self.number_docs, 3), scores.shape)
+        for i, w in enumerate(weights):
+            self.assertTrue(np.allclose(self.linear_model.score(
+                self.features, w), scores[:, i]))
+        self.assertTrue(np.array_equal(self.linear_model.score(self.features,
+            self.linear_w), self.linear_model.score_batch(self.features,
+                                                          self.linear_w)))
+        # models without a batch implementation score each weight vector
+        weights = np.vstack([self.hidden_w, self.hidden_w * 10])
+        scores = self.hidden_model.score_batch(self.features, weights)
+        for i, w in enumerate(weights):
+            self.assertTrue(np.allclose(self.hidden_model.score(
+                self.features, w), scores[:, i]))
+
+    def testOneHiddenLayerBatch(self):
+        model = OneHiddenLayer(self.feature_count, hidden_size=4)
+        self.assertEqual((self.feature_count + 1) * 4 + 4,
+                         model.get_feature_count())
+        weights = np.vstack([model.initialize_weights("fullyrandom")
+                             for _ in range(3)])
+        scores = model.score_batch(self.features, weights)
+        self.assertEqual((self.number_docs, 3), scores.shape)
+        augmented = np.hstack((np.ones((self.number_docs, 1)),
+                               self.features))
+        for i, w in enumerate(weights):
+            w1 = w[:-4].reshape((self.feature_count + 1, 4))
+            expected = np.tanh(np.dot(np.tanh(np.dot(augmented, w1)), w[-4:]))
+            self.assertTrue(np.allclose(expected, scores[:, i]))
+            self.assertTrue(np.allclose(expected,
+                                        model.score(self.features, w)))
+
+    def _bm25_reference(self, docfeatures, w):
+        k1, k3, b = w
+        s = 0.0
+        for i in range(len(docfeatures) / 4):
+            idf, tf, qtf, dl = docfeatures[i * 4:i * 4 + 4]
+            if dl == 0:
+                continue
+            s += ((idf * tf * (k1 + 1)) / (tf + k1 * (1 - b + b * dl))) * \
+                (((k3 + 1) * qtf) / (k3 + qtf))
+        return s
+
+    def testBM25(self):
+        model = BM25(self.feature_count)
+        features = self.features.copy()
+        # documents without some of the terms
+        features[::3, 3::8] = 0
+        original = features.copy()
+        w = model.initialize_weights("default")
+        scores = model.score(features, w)
+        self.assertTrue(np.array_equal(original, features))
+        self.assertEqual((self.number_docs,), scores.shape)
+        self.assertTrue(np.allclose([self._bm25_reference(f, w)
+                                     for f in features], scores))
+        params = np.array([[2.5, 0, 0.8], [1.2, 7, 0.75], [0.5, 0, 0]])
+        scores = model.score_batch(features, params)
+        self.assertEqual((self.number_docs, 3), scores.shape)
+        for i, w in enumerate(params):
+            self.assertTrue(np.allclose(model.score(features, w),
+                                        scores[:, i]))
+
+    def testBM25Ensemble(self):
+        model = BM25Ensemble(30)
+        features = self.features[:, :30 + 16].copy()
+        original = features.copy()
+        w = np.random.rand(model.feature_count)
+        scores = model.score(features, w)
+        self.assertTrue(np.array_equal(original, features))
+        for f, score in zip(features, scores):
+            linear = f[:30].copy()
+            linear[24] = self._bm25_reference(f[30:], w[-3:])
+            self.assertAlmostEqual(np.dot(linear, w[:-3]), score)
+        weights = np.vstack([w, np.random.rand(model.feature_count)])
+        scores = model.score_batch(features, weights)
+        self.assertTrue(np.array_equal(original, features))
+        for i, w in enumerate(weights):
+            self.assertTrue(np.allclose(model.score(features, w),
+                                        scores[:, i]))
+
 if __name__ == '__main__':
         unittest.main()
@@ -22,8 +22,14 @@ import numpy as np
 sys.path.insert(0, os.path.abspath('..'))
 
 from lerot import query
+from lerot.document import Document
 from DeterministicRankingFunction import DeterministicRankingFunction
 from ProbabilisticRankingFunction import ProbabilisticRankingFunction
+from DocumentIndex import DocumentIndex
+from RankSampler import RankSampler
+from RankingCache import RankingCache
+from SyntheticProbabilisticRankingFunction import \
+    SyntheticProbabilisticRankingFunction
 
 
 class TestRankers(unittest.TestCase):
@@ -114,5 +120,318 @@ class TestRankers(unittest.TestCase):
         self.assertAlmostEqual(0.0132678, rf.get_document_probability(0))
         self.assertAlmostEqual(0.8491400, rf.get_document_probability(1))
 
+
+class TestRankSampler(unittest.TestCase):
+
+    def testProbabilitiesAfterRemovals(self):
+        rnd = np.random.RandomState(11)
+        weights = 1.0 / np.arange(1, 50) ** 3
+        sampler = RankSampler(weights)
+        remaining = range(len(weights))
+        while remaining:
+            expected = weights[remaining] / weights[remaining].sum()
+            for slot, p in zip(remaining, expected):
+                self.assertAlmostEqual(p, sampler.get_probability(slot),
+                                       places=12)
+            slot = sampler.sample(rnd.rand()) if rnd.rand() < .5 else \
+                remaining[rnd.randint(len(remaining))]
+            self.assertIn(slot, remaining)
+            sampler.remove(slot)
+            remaining.remove(slot)
+            self.assertEqual(0.0, sampler.get_probability(slot))
+        self.assertEqual(0, len(sampler))
+        self.assertRaises(ValueError, sampler.sample, 0.5)
+
+    def testSampleMatchesCumulativeScan(self):
+        weights = np.array([0.5, 0.0, 2.0, 1.0, 0.25, 3.0])
+        sampler = RankSampler(weights)
+        sampler.remove(3)
+        w = weights.copy()
+        w[3] = 0
+        cumprobs = np.cumsum(w / w.sum())
+        for rand in np.linspace(0, 0.999, 200):
+            expected = [pos for pos, cp in enumerate(cumprobs)
+                        if rand < cp][0]
+            self.assertEqual(expected, sampler.sample(rand))
+
+    def testRollback(self):
+        rnd = np.random.RandomState(17)
+        weights = 1.0 / np.arange(1, 30) ** 3
+        sampler = RankSampler(weights)
+        sampler.remove(4)
+        checkpoint = sampler.checkpoint()
+        for _ in range(100):
+            for _ in range(10):
+                sampler.remove(sampler.sample(rnd.rand()))
+            sampler.rollback(checkpoint)
+            self.assertEqual(len(weights) - 1, len(sampler))
+        expected = weights / (weights.sum() - weights[4])
+        expected[4] = 0
+        for slot, p in enumerate(expected):
+            self.assertAlmostEqual(p, sampler.get_probability(slot),
+                                   places=12)
+        self.assertRaises(ValueError, sampler.rollback, checkpoint + 1)
+
+
+class TestDocumentIndex(unittest.TestCase):
+
+    def testRemovals(self):
+        rnd = np.random.RandomState(13)
+        docids = [Document(i) for i in rnd.permutation(40)]
+        index = DocumentIndex(docids)
+        remaining = list(docids)
+        while remaining:
+            self.assertEqual(remaining, index.remaining())
+            self.assertEqual(remaining[:3], index.remaining(3))
+            self.assertEqual(len(remaining), len(index))
+            self.assertEqual(docids.index(remaining[0]), index.first())
+            for pos, docid in enumerate(remaining):
+                slot = index.get_slot(docid)
+                self.assertEqual(pos, index.position(slot))
+                self.assertEqual(slot, index.select(pos))
+            docid = remaining.pop(rnd.randint(len(remaining)))
+            self.assertEqual(docid, index.remove(index.get_slot(docid)))
+            self.assertRaises(ValueError, index.get_slot, docid)
+        self.assertRaises(ValueError, index.first)
+        self.assertRaises(IndexError, index.select, 0)
+
+    def testRollback(self):
+        docids = [Document(i) for i in range(10)]
+        index = DocumentIndex(docids[:3], 7, lambda: docids[3:])
+        index.remove(5)
+        checkpoint = index.checkpoint()
+        for slot in [0, 9, 1, 5]:
+            index.remove(slot)
+        self.assertEqual(docids[2], index.remove(index.first()))
+        index.rollback(checkpoint)
+        self.assertEqual(docids[:5] + docids[6:], index.remaining())
+        self.assertEqual(0, index.first())
+        self.assertEqual(8, index.position(9))
+        self.assertRaises(ValueError, index.rollback, checkpoint + 1)
+
+    def testLazyTail(self):
+        docids = [Document(i) for i in range(10)]
+        loaded = []
+        index = DocumentIndex(docids[:3], 7,
+                              lambda: loaded.append(1) or docids[3:])
+        self.assertEqual(10, len(index))
+        self.assertEqual(docids[:3], index.remaining(3))
+        self.assertEqual(docids[0], index.remove(index.first()))
+        self.assertEqual(docids[4], index.remove(index.select(3)))
+        self.assertEqual(1, len(loaded))
+        index = DocumentIndex(docids[:3], 7, lambda: docids[3:])
+        self.assertEqual(8, index.get_slot(docids[8]))
+        self.assertEqual(docids, index.remaining())
+
+
+class TestRankingCache(unittest.TestCase):
+
+    def testEviction(self):
+        cache = RankingCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(1, cache.get("a"))
+        # b is the least recently used entry now
+        cache.put("c", 3)
+        self.assertNotIn("b", cache)
+        self.assertEqual([1, 3], [cache.get("a"), cache.get("c")])
+        self.assertIsNone(cache.get("b"))
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+
+class TestProbabilisticRanker(unittest.TestCase):
+
+    def setUp(self):
+        self.queries = query.Queries(cStringIO.StringIO("""
+        4 qid:1 1:2.6 2:1 3:2.1 4:0 5:2 6:1.4
+        1 qid:1 1:1.2 2:1 3:2.9 4:0 5:2 6:1.9
+        0 qid:1 1:0.5 2:1 3:2.3 4:0 5:2 6:5.6
+        0 qid:1 1:0.5 2:1 3:2.7 4:0 5:2 6:5.6
+        2 qid:1 1:0.5 2:1 3:2.2 4:0 5:2 6:5.6
+        """), 6)
+        self.query = self.queries['1']
+
+    def testProbabilities(self):
+        rf = ProbabilisticRankingFunction([3], "first", 6,
+                                          init="0,0,1,0,0,0")
+        rf.init_ranking(self.query)
+        self.assertEqual([1, 3, 2, 4, 0], [d.get_id() for d in rf.docids])
+        weights = 5 / np.arange(1.0, 6) ** 3
+        docids = list(rf.docids)
+        for removed in [None, docids[2], docids[0]]:
+            if removed is not None:
+                rf.rm_document(removed)
+                weights[docids.index(removed)] = 0
+            for docid, w in zip(docids, weights):
+                if w:
+                    self.assertAlmostEqual(w / weights.sum(),
+                        rf.get_document_probability(docid))
+                else:
+                    self.assertRaises(ValueError,
+                        rf.get_document_probability, docid)
+        # removing a document twice has no effect
+        rf.rm_document(docids[0])
+        self.assertEqual([docids[1], docids[3], docids[4]], rf.docids)
+        self.assertEqual(docids[1], rf.next_det())
+        drawn = [rf.next(), rf.next()]
+        self.assertEqual(set([docids[3], docids[4]]), set(drawn))
+        self.assertEqual([], rf.docids)
+        self.assertRaises(Exception, rf.next)
+
+    def testDeterministic(self):
+        rf = DeterministicRankingFunction([], "first", 6,
+                                          init="0,0,1,0,0,0")
+        rf.init_ranking(self.query)
+        docids = rf.docids
+        self.assertEqual([1, 3, 2, 4, 0], [d.get_id() for d in docids])
+        self.assertEqual(1.0, rf.get_document_probability(docids[0]))
+        self.assertEqual(0.0, rf.get_document_probability(docids[1]))
+        rf.rm_document(docids[0])
+        self.assertEqual(1.0, rf.get_document_probability(docids[1]))
+        self.assertRaises(ValueError, rf.rm_document, docids[0])
+        self.assertEqual(docids[1], rf.next())
+        self.assertEqual(docids[2:4], rf.getDocs(2))
+        self.assertIn(rf.next_random(), docids[2:])
+        self.assertEqual(2, rf.document_count())
+
+    def testDocumentRank(self):
+        full = ProbabilisticRankingFunction([3], "first", 6,
+                                            init="0,0,1,0,0,0")
+        full.init_ranking(self.query)
+        docids = full.getDocs()
+        for depth in [None, 2]:
+            rf = ProbabilisticRankingFunction([3], "first", 6,
+                                              init="0,0,1,0,0,0")
+            rf.init_ranking(self.query, depth)
+            self.assertEqual(5, rf.document_count())
+            # the last document is in the tail when depth is given
+            self.assertEqual(5, rf.get_document_rank(docids[4]))
+            rf.rm_document(docids[1])
+            self.assertEqual([1, None, 2, 3, 4],
+                             [rf.get_document_rank(d) for d in docids])
+            self.assertIsNone(rf.get_document_rank("unknown"))
+
+    def testCandidateRanker(self):
+        rf = ProbabilisticRankingFunction([3], "first", 6,
+                                          init="0,0,1,0,0,0")
+        rf.init_ranking(self.query)
+        rf.next()
+        w = np.array([0, 0, -1, 0, 0, 0.])
+        candidate = rf.get_candidate_ranker(w)
+        self.assertIs(rf.ranking_model, candidate.ranking_model)
+        self.assertEqual(rf.ranker_type, candidate.ranker_type)
+        self.assertTrue(np.array_equal(w, candidate.w))
+        self.assertFalse(hasattr(candidate, "doc_index"))
+        candidate.init_ranking(self.query)
+        self.assertEqual([0, 4, 2, 3, 1],
+                         [d.get_id() for d in candidate.docids])
+        # the original keeps its own weights and state
+        self.assertEqual([0, 0, 1, 0, 0, 0], rf.w.tolist())
+        self.assertEqual(4, rf.document_count())
+
+    def testRankingCache(self):
+        rf = ProbabilisticRankingFunction([3], "first", 6,
+                                          init="0,0,1,0,0,0")
+        calls = []
+        score = rf.ranking_model.score
+        rf.ranking_model.score = lambda f, w: calls.append(1) or score(f, w)
+        rf.init_ranking(self.query)
+        rf.next()
+        rf.init_ranking(self.query)
+        self.assertEqual(1, len(calls))
+        self.assertEqual([1, 3, 2, 4, 0], [d.get_id() for d in rf.docids])
+        # new weights invalidate the cached ranking
+        rf.update_weights(np.array([0, 0, -1, 0, 0, 0.]))
+        self.assertEqual(0, len(rf.ranking_cache))
+        rf.init_ranking(self.query)
+        self.assertEqual(2, len(calls))
+        self.assertEqual([0, 4, 2, 3, 1], [d.get_id() for d in rf.docids])
+        # candidates have their own cache
+        candidate = rf.get_candidate_ranker(np.array([0, 0, 1, 0, 0, 0.]))
+        candidate.init_ranking(self.query)
+        self.assertEqual([1, 3, 2, 4, 0],
+                         [d.get_id() for d in candidate.docids])
+        self.assertEqual([0, 4, 2, 3, 1], [d.get_id() for d in rf.docids])
+        self.assertEqual(1, len(rf.ranking_cache))
+
+    def testCandidateWeights(self):
+        rf = ProbabilisticRankingFunction([3], "first", 6,
+                                          init="0,0,1,0,0,0")
+        weights, us = rf.get_candidate_weights(0.5, 4)
+        self.assertEqual((4, 6), weights.shape)
+        self.assertTrue(np.allclose(rf.w + 0.5 * us, weights))
+        candidates = [rf.get_candidate_ranker(w) for w in weights]
+        scores = rf.score_batch(self.query.get_feature_vectors(), [0, 5],
+                                weights)[0]
+        for k, candidate in enumerate(candidates):
+            candidate.cache_scores(self.query, scores[:, k])
+            expected = rf.get_candidate_ranker(weights[k])
+            expected.init_ranking(self.query)
+            candidate.ranking_model = None
+            candidate.init_ranking(self.query)
+            self.assertEqual(expected.docids, candidate.docids)
+
+    def testDepth(self):
+        queries = query.Queries(cStringIO.StringIO("\n".join(
+            "0 qid:1 1:%d 2:%d" % (i % 7, i) for i in range(50))), 2)
+        full = DeterministicRankingFunction([], "first", 2, init="1,0")
+        full.init_ranking(queries['1'])
+        rf = DeterministicRankingFunction([], "first", 2, init="1,0",
+                                          depth=5)
+        rf.init_ranking(queries['1'])
+        self.assertEqual(full.getDocs(5), rf.getDocs(5))
+        self.assertEqual(5, len(rf.doc_index.ranked))
+        # the tail is sorted once it is needed
+        self.assertEqual(full.getDocs(10), rf.getDocs(10))
+        self.assertEqual(full.docids, rf.docids)
+        rf = ProbabilisticRankingFunction([3], "first", 2, init="1,0")
+        rf.init_ranking(queries['1'], depth=5)
+        full = ProbabilisticRankingFunction([3], "first", 2, init="1,0")
+        full.init_ranking(queries['1'])
+        for docid in full.docids:
+            self.assertAlmostEqual(full.get_document_probability(docid),
+                                   rf.get_document_probability(docid))
+
+    def testResetRanking(self):
+        for rf in [ProbabilisticRankingFunction([3], "random", 6),
+                   DeterministicRankingFunction([], "random", 6)]:
+            rf.init_ranking(self.query)
+            ranked = rf.docids
+            probabilities = [rf.get_document_probability(d) for d in ranked]
+            state = rf.snapshot()
+            rf.next()
+            rf.rm_document(ranked[-1])
+            rf.restore(state)
+            self.assertEqual(ranked, rf.docids)
+            rf.next()
+            model, rf.ranking_model = rf.ranking_model, None
+            rf.reset_ranking(self.query)
+            self.assertEqual(ranked, rf.docids)
+            self.assertEqual(probabilities,
+                [rf.get_document_probability(d) for d in ranked])
+            # with new weights, the documents are ranked again
+            rf.ranking_model = model
+            rf.update_weights(-rf.w)
+            rf.reset_ranking(self.query)
+            self.assertEqual(5, rf.document_count())
+            self.assertEqual(rf.weight_version, rf.initial_state[1])
+
+    def testModelArgs(self):
+        rf = DeterministicRankingFunction(["ranker.model.OneHiddenLayer",
+                                           "hidden_size=3"], "first", 6)
+        self.assertEqual(3, rf.ranking_model.hiddensize)
+        self.assertEqual(7 * 3 + 3, len(rf.w))
+        rf.init_ranking(self.query)
+        self.assertEqual(5, rf.document_count())
+
+    def testSyntheticTuples(self):
+        rf = SyntheticProbabilisticRankingFunction(3)
+        rf.init_ranking([(5, "a"), (7, "b"), (6, "c")])
+        self.assertAlmostEqual(1 / 8. / (1 + 1 / 8. + 1 / 27.),
+                               rf.get_document_probability(7))
+        rf.rm_document(5)
+        self.assertEqual([(7, "b"), (6, "c")], rf.docids)
+
 if __name__ == '__main__':
         unittest.main()
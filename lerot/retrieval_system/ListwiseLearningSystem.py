@@ -20,7 +20,6 @@ Retrieval system implementation for use in learning experiments.
 
 import argparse
 from numpy import array
-import copy
 
 from .AbstractLearningSystem import AbstractLearningSystem
 from ..utils import get_class, split_arg_str
@@ -45,6 +44,9 @@ class ListwiseLearningSystem(AbstractLearningSystem):
         parser.add_argument("-r", "--ranker", required=True)
         parser.add_argument("-s", "--ranker_args", nargs="*")
         parser.add_argument("-t", "--ranker_tie", default="random")
+        parser.add_argument("--ranker_depth", type=int, default=None,
+            help="Only sort this many of the highest ranked documents of a "
+            "query up front, the others when they are needed.")
         parser.add_argument("-d", "--delta", required=True, type=str)
         parser.add_argument("-a", "--alpha", required=True, type=str)
         parser.add_argument("--anneal", type=int, default=0)
@@ -61,7 +63,8 @@ class ListwiseLearningSystem(AbstractLearningSystem):
                                         self.ranker_tie,
                                         self.feature_count,
                                         sample=self.sample_weights,
-                                        init=self.init_weights)
+                                        init=self.init_weights,
+                                        depth=args["ranker_depth"])
 
         if "," in args["delta"]:
             self.delta = array([float(x) for x in args["delta"].split(",")])
@@ -85,9 +88,7 @@ class ListwiseLearningSystem(AbstractLearningSystem):
 
     def _get_new_candidate(self):
         w, u = self.ranker.get_candidate_weight(self.delta)
-        candidate_ranker = copy.deepcopy(self.ranker)
-        candidate_ranker.update_weights(w)
-        return candidate_ranker, u
+        return self.ranker.get_candidate_ranker(w), u
 
     def _get_candidate(self):
         return self._get_new_candidate()
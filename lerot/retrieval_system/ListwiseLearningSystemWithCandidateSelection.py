@@ -21,6 +21,7 @@ import numpy as np
 import random
 
 from .ListwiseLearningSystem import ListwiseLearningSystem
+from ..query import concatenate_features
 from ..utils import string_to_boolean, split_arg_str
 
 
@@ -61,18 +62,52 @@ class ListwiseLearningSystemWithCandidateSelection(ListwiseLearningSystem):
         logging.info("Initialized historical data usage to: %r" % self.biased)
         self.num_repetitions = args["num_repetitions"]
         self.history = []
+        # unbiased comparisons on historic data weight outcomes by the
+        # probability of the list, which only some comparison methods
+        # (e.g., ProbabilisticInterleave) can compute
+        self.importance_sampling = not self.biased and hasattr(
+            self.comparison, "get_probability_of_list")
+        if self.history_length > 0 and not self.biased and \
+                not self.importance_sampling and args["select_candidate"] == \
+                "select_candidate_repeated":
+            raise ValueError("select_candidate_repeated needs the "
+                "probability of lists, which %s does not provide; use "
+                "--biased true or a probabilistic comparison method." %
+                self.comparison.__class__.__name__)
 
     def _get_candidate(self):
-        # TODO: generate NUM_CANDIDATES candidate rankers
-        candidates = []
-        for _ in range(self.num_candidates):
-            candidate_ranker, candidate_u = self._get_new_candidate()
-            candidates.append(RankerWithU(candidate_ranker, candidate_u))
+        # generate NUM_CANDIDATES candidate rankers, from one weight matrix
+        weights, us = self.ranker.get_candidate_weights(self.delta,
+                                                        self.num_candidates)
+        candidates = [RankerWithU(self.ranker.get_candidate_ranker(w), u)
+                      for w, u in zip(weights, us)]
         # compare them using the HISTORY_LENGTH most recent data points
+        self._score_history(candidates, weights)
         # return the most promising one
         best_ranker = self.select_candidate(candidates)
         return best_ranker.ranker, best_ranker.u
 
+    def _score_history(self, candidates, weights):
+        """Score the documents of all historic queries for all candidates in
+        one call of the ranking model, and hand each candidate its scores, so
+        that comparisons on historic data only need to sort them."""
+        queries = []
+        qids = set()
+        for h_item in self.history:
+            if h_item.query.get_qid() not in qids:
+                qids.add(h_item.query.get_qid())
+                queries.append(h_item.query)
+        if not queries:
+            return
+        features, offsets = concatenate_features(queries)
+        scores = self.ranker.score_batch(features, offsets, weights)
+        for candidate in candidates:
+            cache = candidate.ranker.ranking_cache
+            cache.max_size = max(cache.max_size, len(queries))
+        for query, query_scores in zip(queries, scores):
+            for k, candidate in enumerate(candidates):
+                candidate.ranker.cache_scores(query, query_scores[:, k])
+
     def select_candidate_random(self, candidates):
         return random.sample(candidates, 1)[0]
 
@@ -91,8 +126,9 @@ class ListwiseLearningSystemWithCandidateSelection(ListwiseLearningSystem):
             candidate_context = ([], sampled_pair[0].ranker,
                 sampled_pair[1].ranker)
             # use the current context (rankers), but historical list and clicks
-            raw_outcome = self.comparison.infer_outcome(h_item.result_list,
-                candidate_context, h_item.clicks, h_item.query)
+            raw_outcome = get_outcome(self.comparison.infer_outcome(
+                h_item.result_list, candidate_context, h_item.clicks,
+                h_item.query))
             if raw_outcome < 0:
                 # first ranker won, remove the other from the candidate pool
                 candidates.remove(sampled_pair[1])
@@ -125,8 +161,9 @@ class ListwiseLearningSystemWithCandidateSelection(ListwiseLearningSystem):
             outcomes = []
             for _ in range(self.num_repetitions):
                 h_item = random.sample(self.history, 1)[0]
-                raw_outcome = self.comparison.infer_outcome(h_item.result_list,
-                    candidate_context, h_item.clicks, h_item.query)
+                raw_outcome = get_outcome(self.comparison.infer_outcome(
+                    h_item.result_list, candidate_context, h_item.clicks,
+                    h_item.query))
                 if self.biased:
                     outcomes.append(raw_outcome)
                 else:
@@ -146,7 +183,7 @@ class ListwiseLearningSystemWithCandidateSelection(ListwiseLearningSystem):
     def select_candidate_beat_the_mean(self, candidate_us):
         raise NotImplementedError()
 
-    def _update_solution(self, outcome, clicks):
+    def update_solution(self, clicks):
         # Keep track of history
         if self.history_length > 0:
             if len(self.history) == self.history_length:
@@ -155,11 +192,21 @@ class ListwiseLearningSystemWithCandidateSelection(ListwiseLearningSystem):
             # distribution so that it only has to be computed once
             new_h_item = HistoryItem(self.current_l, self.current_context,
                 clicks, self.current_query)
-            new_h_item.p_list_source = self.comparison.get_probability_of_list(
-                self.current_l, self.current_context, self.current_query)
+            if self.importance_sampling:
+                new_h_item.p_list_source = \
+                    self.comparison.get_probability_of_list(self.current_l,
+                    self.current_context, self.current_query)
             self.history.append(new_h_item)
         # use inherited method for the actual update
-        return ListwiseLearningSystem._update_solution(self, outcome, clicks)
+        return ListwiseLearningSystem.update_solution(self, clicks)
+
+
+def get_outcome(raw_outcome):
+    """Some comparison methods (e.g., ProbabilisticInterleave) infer the
+    outcome together with the probability of the list."""
+    if type(raw_outcome) is tuple:
+        return raw_outcome[0]
+    return raw_outcome
 
 
 class RankerWithU:
@@ -177,3 +224,5 @@ class HistoryItem:
         self.context = context
         self.clicks = clicks
         self.query = query
+        # probability of the list under the source rankers, if needed
+        self.p_list_source = None
@@ -44,6 +44,9 @@ class PrudentListwiseLearningSystem(AbstractLearningSystem):
         parser.add_argument("-r", "--ranker", required=True)
         parser.add_argument("-s", "--ranker_args", nargs="*")
         parser.add_argument("-t", "--ranker_tie", default="random")
+        parser.add_argument("--ranker_depth", type=int, default=None,
+            help="Only sort this many of the highest ranked documents of a "
+            "query up front, the others when they are needed.")
         parser.add_argument("-d", "--delta", required=True, type=str)
         parser.add_argument("-a", "--alpha", required=True, type=str)
         parser.add_argument("--anneal", type=int, default=0)
@@ -60,7 +63,8 @@ class PrudentListwiseLearningSystem(AbstractLearningSystem):
                                         self.ranker_tie,
                                         self.feature_count,
                                         sample=self.sample_weights,
-                                        init=self.init_weights)
+                                        init=self.init_weights,
+                                        depth=args["ranker_depth"])
 
         if "," in args["delta"]:
             self.delta = array([float(x) for x in args["delta"].split(",")])
@@ -83,15 +87,7 @@ class PrudentListwiseLearningSystem(AbstractLearningSystem):
 
     def _get_new_candidate(self):
         w, u = self.ranker.get_candidate_weight(self.delta)
-#        candidate_ranker1 = copy.deepcopy(self.ranker)
-#        candidate_ranker1.update_weights(w)
-        candidate_ranker2 = self.ranker_class(self.ranker_args,
-                                             self.ranker_tie,
-                                             self.feature_count,
-                                             sample=self.sample_weights,
-                                             init=self.init_weights)
-        candidate_ranker2.update_weights(w)
-        return candidate_ranker2, u
+        return self.ranker.get_candidate_ranker(w), u
 
     def _get_candidate(self):
         return self._get_new_candidate()
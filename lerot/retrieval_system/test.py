@@ -23,6 +23,8 @@ print sys.path
 from lerot import query
 from numpy import array
 from ListwiseLearningSystem import ListwiseLearningSystem
+from ListwiseLearningSystemWithCandidateSelection import \
+    ListwiseLearningSystemWithCandidateSelection
 from PairwiseLearningSystem import PairwiseLearningSystem
 
 
@@ -50,6 +52,43 @@ class TestListwiseLearning(unittest.TestCase):
         self.learner.get_ranked_list(self.query)
 
 
+class TestListwiseLearningWithCandidateSelection(unittest.TestCase):
+    def setUp(self):
+        self.test_num_features = 6
+        test_query = """
+        4 qid:1 1:2.6 2:1 3:2.1 4:0 5:2 6:1.4 # highly relevant
+        1 qid:1 1:1.2 2:1 3:2.9 4:0 5:2 6:1.9 # bad
+        0 qid:1 1:0.5 2:1 3:2.3 4:0 5:2 6:5.6 # not relevant
+        0 qid:1 1:0.5 2:1 3:2.3 4:0 5:2 6:5.6 # not relevant
+        """
+        self.queries = query.Queries(cStringIO.StringIO(test_query),
+                                     self.test_num_features)
+        self.query = self.queries['1']
+        self.arg_str = ("--init_weights 0,0,1,0,0,0 --delta 1.0 --alpha 0.01 "
+            "--ranker ranker.DeterministicRankingFunction --ranker_args "
+            "ranker.model.Linear --ranker_tie first "
+            "--comparison comparison.TeamDraft -e 4 -l 5 ")
+
+    def testNonProbabilisticComparison(self):
+        learner = ListwiseLearningSystemWithCandidateSelection(
+            self.test_num_features,
+            self.arg_str + "--select_candidate select_candidate_simple")
+        for _ in range(3):
+            l = learner.get_ranked_list(self.query)
+            learner.update_solution(array([1] + [0] * (len(l) - 1)))
+        self.assertEqual(3, len(learner.history))
+        self.assertIsNone(learner.history[0].p_list_source)
+
+    def testRepeatedNeedsListProbabilities(self):
+        self.assertRaises(ValueError,
+            ListwiseLearningSystemWithCandidateSelection,
+            self.test_num_features,
+            self.arg_str + "--select_candidate select_candidate_repeated")
+        ListwiseLearningSystemWithCandidateSelection(self.test_num_features,
+            self.arg_str + "--select_candidate select_candidate_repeated "
+            "--biased true")
+
+
 class TestPairwiseLearning(unittest.TestCase):
     def setUp(self):
         # initialize query
@@ -0,0 +1,154 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A local stand-in for the living-labs participant API, for tests. It serves
+the queries and doclists in its data (with ETags), accepts runs, returns
+feedback on them and records every request.
+"""
+
+import BaseHTTPServer
+import hashlib
+import json
+import threading
+import time
+import urllib
+from SocketServer import ThreadingMixIn
+
+
+class _Server(ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def __send__(self, code, body=None, headers=None):
+        data = json.dumps(body) if body is not None else ""
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def __handle__(self, method):
+        ll = self.server.living_labs
+        parts = [urllib.unquote(part) for part in self.path.split("/")]
+        # /api/participant/<endpoint>/<key>[/<qid>]
+        if len(parts) < 5 or parts[1:3] != ["api", "participant"]:
+            return self.__send__(404, {"message": "Not found"})
+        endpoint, key, args = parts[3], parts[4], parts[5:]
+        with ll.lock:
+            ll.requests.append((method, endpoint) + tuple(args))
+            if ll.failures.get(endpoint, 0) > 0:
+                ll.failures[endpoint] -= 1
+                return self.__send__(503, {"message": "Try again"})
+        if key != ll.key:
+            return self.__send__(403, {"message": "Invalid key"})
+        handler = getattr(ll, "%s_%s" % (method.lower(), endpoint), None)
+        if handler is None:
+            return self.__send__(404, {"message": "Not found"})
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        self.__send__(*handler(self.headers, body, *args))
+
+    def do_GET(self):
+        self.__handle__("GET")
+
+    def do_PUT(self):
+        self.__handle__("PUT")
+
+
+class LivingLabsServer:
+    """Serves the doclists (qid -> list of (docid, relevance signals)) on a
+    free local port, use host as the api host of a LivingLabsClient. Set
+    failures[endpoint] to the number of requests that should fail with 503
+    before the endpoint answers again. Uploaded runs get feedback (with
+    the clicks given for the query) after feedback_delay[qid] requests."""
+
+    def __init__(self, key, doclists, clicks=None):
+        self.key = key
+        self.doclists = doclists
+        # qid -> docids that users click in every uploaded run
+        self.clicks = clicks or {}
+        # qid -> number of feedback requests before feedback is available
+        self.feedback_delay = {}
+        self.runs = {}
+        self.requests = []
+        self.failures = {}
+        self.lock = threading.Lock()
+        self.server = _Server(("127.0.0.1", 0), _Handler)
+        self.server.living_labs = self
+        self.host = "http://127.0.0.1:%d/api" % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.05,))
+        self.thread.daemon = True
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, method, endpoint):
+        return sum(1 for request in self.requests
+                   if request[:2] == (method, endpoint))
+
+    def get_query(self, headers, body):
+        return 200, {"queries": [{"qid": qid, "qstr": "query %s" % qid}
+                                 for qid in sorted(self.doclists)]}
+
+    def get_doclist(self, headers, body, qid):
+        if qid not in self.doclists:
+            return 404, {"message": "Unknown qid"}
+        doclist = {"qid": qid, "doclist": [
+            {"docid": docid, "relevance_signals": [[i, value] for i, value
+                                                   in enumerate(signals)]}
+            for docid, signals in self.doclists[qid]]}
+        etag = '"%s"' % hashlib.md5(json.dumps(doclist)).hexdigest()
+        if headers.get("If-None-Match") == etag:
+            return 304, None, {"ETag": etag}
+        return 200, doclist, {"ETag": etag}
+
+    def put_run(self, headers, body, qid):
+        if qid not in self.doclists:
+            return 404, {"message": "Unknown qid"}
+        self.runs[qid] = body
+        return 200, body
+
+    def get_feedback(self, headers, body, qid, runid=None):
+        run = self.runs.get(qid)
+        with self.lock:
+            delay = self.feedback_delay.get(qid, 0)
+            self.feedback_delay[qid] = delay - 1
+        if run is None or delay > 0 or (runid is not None and
+                                        str(run["runid"]) != runid):
+            return 200, {"feedback": []}
+        clicks = self.clicks.get(qid, ())
+        doclist = [{"docid": doc["docid"], "team": "participant",
+                    "clicked": doc["docid"] in clicks}
+                   for doc in run["doclist"]]
+        modified = time.strftime("%a, %d %b %Y %H:%M:%S -0000",
+                                 time.localtime())
+        return 200, {"feedback": [{"qid": qid, "runid": run["runid"],
+                                   "modified_time": modified,
+                                   "doclist": doclist}]}
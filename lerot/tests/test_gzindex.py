@@ -0,0 +1,67 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+import cStringIO
+import gzip
+import random
+import unittest
+
+from lerot import gzindex
+
+
+@unittest.skipUnless(gzindex.is_available(), "libz is not available")
+class TestGzipIndex(unittest.TestCase):
+
+    def setUp(self):
+        rnd = random.Random(42)
+        lines = ["%d qid:%d %s\n" % (rnd.randint(0, 4), i // 20, " ".join(
+            "%d:%.4f" % (f + 1, rnd.random()) for f in range(10)))
+            for i in range(3000)]
+        self.data = "".join(lines)
+        # two gzip members, as produced by concatenating gzip files
+        self.compressed = self._gzip(self.data[:100000]) + \
+            self._gzip(self.data[100000:])
+
+    def _gzip(self, data):
+        out = cStringIO.StringIO()
+        fh = gzip.GzipFile(fileobj=out, mode="wb")
+        fh.write(data)
+        fh.close()
+        return out.getvalue()
+
+    def testBuild(self):
+        builder = gzindex.GzipIndexBuilder(
+            cStringIO.StringIO(self.compressed), span=8192)
+        self.assertRaises(ValueError, builder.get_index)
+        self.assertEqual(self.data, "".join(builder))
+        index = builder.get_index()
+        self.assertGreater(len(index), 2)
+        self.assertEqual(0, index.out_offsets[0])
+
+    def testRead(self):
+        fh = cStringIO.StringIO(self.compressed)
+        index = gzindex.build_gzip_index(fh, span=8192)
+        rnd = random.Random(7)
+        offsets = [0, 99990, 100000, len(self.data) - 5] + \
+            [rnd.randint(0, len(self.data)) for _ in range(50)]
+        for offset in offsets:
+            length = rnd.randint(1, 30000)
+            self.assertEqual(self.data[offset:offset + length],
+                             index.read(fh, offset, length))
+        self.assertEqual("", index.read(fh, 10, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
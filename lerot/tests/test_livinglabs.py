@@ -0,0 +1,186 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from lerot.environment import LivingLabsRealUser
+from lerot.livinglabs import LivingLabsClient, RateLimiter, RetriesExhausted
+from lerot.query import LivingLabsQueries
+from livinglabs_server import LivingLabsServer
+
+KEY = "KEY-123"
+
+
+def make_doclists():
+    return {"q1": [("d1", [0.5, 1.0, 2.0, 0.0]), ("d2", []),
+                   ("d3", [1.5, 0.0, 3.0, 0.0])],
+            "q2": [("d4", [1.0, 1.0, 1.0, 0.0])],
+            "q/3": [("d5", [0.0, 2.0, 0.0, 0.0]),
+                    ("d6", [1.0, 0.0, 1.0, 0.0])]}
+
+
+class TestLivingLabsQueries(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def load(self, server):
+        return LivingLabsQueries(KEY, cache_dir=self.cache_dir,
+                                 host=server.host, max_connections=4)
+
+    def test_load(self):
+        with LivingLabsServer(KEY, make_doclists()) as server:
+            queries = self.load(server)
+        self.assertEqual(3, len(queries))
+        q1 = queries["q1"]
+        self.assertEqual(2, q1.get_document_count())
+        # the last relevance signal is not used
+        np.testing.assert_array_equal([[0.5, 1.0, 2.0, 0.0],
+                                       [1.5, 0.0, 3.0, 0.0]],
+                                      q1.get_feature_vectors())
+        # rows without signals are skipped, also in the docid mapping
+        self.assertEqual({0: "d1", 1: "d3"}, queries.__doc_ids__["q1"])
+        self.assertEqual({0: "d5", 1: "d6"}, queries.__doc_ids__["q/3"])
+        self.assertEqual(1, server.count("GET", "query"))
+        self.assertEqual(3, server.count("GET", "doclist"))
+
+    def test_restart_fetches_changed(self):
+        doclists = make_doclists()
+        with LivingLabsServer(KEY, doclists) as server:
+            self.load(server)
+            doclists["q2"] = [("d4", [2.0, 2.0, 2.0, 0.0]),
+                              ("d7", [0.0, 0.0, 1.0, 0.0])]
+            del server.requests[:]
+            queries = self.load(server)
+            # all doclists are checked, but only q2 is sent again
+            self.assertEqual(3, server.count("GET", "doclist"))
+        np.testing.assert_array_equal([[2.0, 2.0, 2.0, 0.0],
+                                       [0.0, 0.0, 1.0, 0.0]],
+                                      queries["q2"].get_feature_vectors())
+        np.testing.assert_array_equal([[0.5, 1.0, 2.0, 0.0],
+                                       [1.5, 0.0, 3.0, 0.0]],
+                                      queries["q1"].get_feature_vectors())
+
+    def test_not_modified(self):
+        with LivingLabsServer(KEY, make_doclists()) as server:
+            client = LivingLabsClient(KEY, host=server.host)
+            etag, doclist = client.get_doclist("q1")
+            self.assertEqual(3, len(doclist["doclist"]))
+            self.assertEqual((etag, None), client.get_doclist("q1", etag))
+
+    def test_retry(self):
+        with LivingLabsServer(KEY, make_doclists()) as server:
+            server.failures["query"] = 2
+            client = LivingLabsClient(KEY, host=server.host, backoff=0.01)
+            self.assertEqual(3, len(client.get_queries()["queries"]))
+            self.assertEqual(3, server.count("GET", "query"))
+            server.failures["query"] = 3
+            client = LivingLabsClient(KEY, host=server.host, backoff=0.01,
+                                      max_retries=2)
+            self.assertRaises(RetriesExhausted, client.get_queries)
+
+    def test_invalid_key(self):
+        with LivingLabsServer(KEY, make_doclists()) as server:
+            client = LivingLabsClient("other", host=server.host)
+            self.assertRaises(Exception, client.get_queries)
+            # client errors are not retried
+            self.assertEqual(1, server.count("GET", "query"))
+
+
+class TestLivingLabsRealUser(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LivingLabsServer(KEY, make_doclists(),
+                                       clicks={"q1": set(["d3"]),
+                                               "q/3": set(["d5", "d6"])})
+        self.server.__enter__()
+        self.queries = LivingLabsQueries(KEY, host=self.server.host)
+        self.user = LivingLabsRealUser(KEY, self.queries.__doc_ids__,
+                                       host=self.server.host,
+                                       max_connections=4)
+
+    def tearDown(self):
+        self.server.__exit__()
+
+    def upload(self, runid):
+        qids = sorted(self.queries.keys())
+        lists = [list(reversed(self.queries[qid].get_docids()))
+                 for qid in qids]
+        uploaded = self.user.upload_runs(
+            [(self.queries[qid], l) for qid, l in zip(qids, lists)], runid)
+        return dict((qid, {"query": self.queries[qid], "ranker_list": payload,
+                           "upload_time": upload_time, "run_id": runid})
+                    for qid, (payload, upload_time) in zip(qids, uploaded))
+
+    def test_upload_and_poll(self):
+        uploads = self.upload("run1")
+        self.assertEqual(3, self.server.count("PUT", "run"))
+        self.assertEqual([{"docid": "d3"}, {"docid": "d1"}],
+                         self.server.runs["q1"]["doclist"])
+        results = self.user.wait_for_clicks(uploads, min_results=3)
+        self.assertEqual(["q/3", "q1", "q2"], sorted(results))
+        np.testing.assert_array_equal([1, 0], results["q1"][1])
+        np.testing.assert_array_equal([0], results["q2"][1])
+        np.testing.assert_array_equal([1, 1], results["q/3"][1])
+
+    def test_poll_backoff(self):
+        uploads = self.upload(7)
+        self.server.feedback_delay["q2"] = 2
+        results = self.user.poll_clicks(uploads)
+        self.assertEqual(["q/3", "q1"], sorted(results))
+        results = self.user.wait_for_clicks(uploads, min_results=3,
+                                            interval=0.01)
+        self.assertEqual(3, len(results))
+        # q1 and q/3 are only polled until they have feedback
+        self.assertEqual(3 + 3 + 1, self.server.count("GET", "feedback"))
+        self.assertEqual({}, self.user.wait_for_clicks(
+            {"q2": dict(uploads["q2"], run_id=8)}, interval=0.01,
+            timeout=0.05))
+
+    def test_feedback_to_clicks(self):
+        feedback = {"doclist": [
+            {"docid": "a", "team": "site", "clicked": True},
+            {"docid": "a", "team": "participant", "clicked": False},
+            {"docid": "b", "team": "participant", "clicked": True},
+            {"docid": "c", "team": "site", "clicked": True},
+            {"docid": "b", "team": "participant", "clicked": False}]}
+        uploaded = {"doclist": [{"docid": docid}
+                                for docid in ["d", "b", "a", "c"]]}
+        clicks = self.user.__LL2lerot_docids__(None, feedback,
+                                               uploaded["doclist"])
+        np.testing.assert_array_equal([0, 1, 0, 0], clicks)
+        self.assertEqual([1, 2], self.user.get_win(None, feedback, uploaded))
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_rate(self):
+        import time
+        limiter = RateLimiter(100)
+        start = time.time()
+        for _ in range(11):
+            limiter.wait()
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,14 +13,36 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
+import cPickle
 import cStringIO
+import gzip
 import os
+import random
+import shutil
 import sys
+import tempfile
 import unittest
 
+import numpy as np
+
 sys.path.insert(0, os.path.abspath('..'))
 
-import query as qu
+from lerot import query as qu
+
+
+def _random_queries(num_features, num_queries=20, max_docs=30):
+    lines = []
+    for qid in range(num_queries):
+        if qid % 3 == 0:
+            lines.append("# qid %d" % qid)
+        for doc in range(random.randint(1, max_docs)):
+            features = " ".join("%d:%r" % (f + 1, random.random())
+                for f in range(num_features))
+            line = "%d qid:%d %s" % (random.randint(0, 4), qid, features)
+            if doc % 2:
+                line += " # docid = %d-%d" % (qid, doc)
+            lines.append(line)
+    return "\n".join(lines) + "\n"
 
 
 class TestQuery(unittest.TestCase):
@@ -74,5 +96,427 @@ class TestQuery(unittest.TestCase):
             "# not relevant"], query.get_comments())
 #         self.assertEqual("# highly relevant", query.get_comment(0)) TODO: FIX
 
+    def test_normalize_features(self):
+        features = np.array([[1., 2., 5.], [3., 2., -1.], [2., 2., 2.]])
+        minmax = qu.normalize_features(features.copy(), "minmax")
+        self.assertEqual([[0., 0., 1.], [1., 0., 0.], [.5, 0., .5]],
+                         minmax.tolist())
+        zscore = qu.normalize_features(features.copy(), "zscore")
+        self.assertTrue(np.allclose([0., 0., 0.], zscore.mean(axis=0)))
+        self.assertTrue(np.allclose([1., 0., 1.], zscore.std(axis=0)))
+        none = qu.normalize_features(features.copy(), "none")
+        self.assertEqual(features.tolist(), none.tolist())
+
+    def test_feature_matrix(self):
+        queries = qu.Queries(cStringIO.StringIO(_random_queries(5)), 5)
+        features, offsets = queries.get_feature_matrix()
+        self.assertEqual(len(queries) + 1, len(offsets))
+        self.assertEqual(len(features), offsets[-1])
+        for i, query in enumerate(queries):
+            self.assertEqual(queries.get_qids()[i], query.get_qid())
+            rows = features[offsets[i]:offsets[i + 1]]
+            self.assertTrue(np.array_equal(rows, query.get_feature_vectors()))
+            # queries share the matrix instead of keeping a copy
+            self.assertTrue(np.shares_memory(features,
+                                             query.get_feature_vectors()))
+        self.assertIs(features, queries.get_feature_matrix()[0])
+        features, offsets = qu.concatenate_features([], 5)
+        self.assertEqual((0, 5), features.shape)
+        self.assertEqual([0], offsets.tolist())
+
+    def test_compact_docids(self):
+        query = qu.Query("1", np.zeros((3, 2)), np.array([2, 0, 1]))
+        self.assertEqual([0, 1, 2], query.get_docid_array().tolist())
+        self.assertEqual(1, query.get_label(2))
+        # Document objects are created on demand
+        docids = query.get_docids()
+        self.assertEqual([0, 1, 2], [d.get_id() for d in docids])
+        self.assertIs(docids[1], query.get_document(1))
+        self.assertEqual(1, query.get_label(docids[2]))
+        self.assertEqual(3, query.get_document_count())
+
+    def test_block_parser_parity(self):
+        data = _random_queries(self.test_num_features)
+        for preserve_comments in [False, True]:
+            expected = qu.QueryStream(cStringIO.StringIO(data),
+                self.test_num_features, preserve_comments).read_all()
+            # use a small block size to cross block boundaries within queries
+            observed = qu.BlockQueryStream(cStringIO.StringIO(data),
+                self.test_num_features, preserve_comments,
+                block_size=512).read_all()
+            self.assertEqual(sorted(expected.keys()), sorted(observed.keys()))
+            for qid in expected:
+                e, o = expected[qid], observed[qid]
+                self.assertEqual(e.get_qid(), o.get_qid())
+                self.assertEqual(e.get_labels().tolist(),
+                                 o.get_labels().tolist())
+                self.assertEqual(e.get_labels().dtype, o.get_labels().dtype)
+                self.assertEqual(e.get_comments(), o.get_comments())
+                self.assertEqual(e.get_document_count(),
+                                 o.get_document_count())
+                self.assertTrue(np.array_equal(e.get_feature_vectors(),
+                                               o.get_feature_vectors()))
+
+    def test_block_parser_sparse(self):
+        data = "1 qid:7 2:0.5 # a\n0 qid:7 1:1.5 3:2\n"
+        query = qu.BlockQueryStream(cStringIO.StringIO(data), 4).next()
+        self.assertEqual("7", query.get_qid())
+        self.assertEqual([[0, 0.5, 0, 0], [1.5, 0, 2, 0]],
+                         query.get_feature_vectors().tolist())
+        # feature indexes beyond num_features widen the matrix
+        data = "1 qid:7 6:1\n"
+        query = qu.BlockQueryStream(cStringIO.StringIO(data), 4).next()
+        self.assertEqual((1, 6), query.get_feature_vectors().shape)
+        for data in ["1 qid:7 1:x\n", "1 qid:7 1:\n"]:
+            stream = qu.BlockQueryStream(cStringIO.StringIO(data), 4)
+            self.assertRaises(ValueError, stream.next)
+
+
+class TestQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.test_num_features = 6
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, "train.txt")
+        with open(self.filename, "w") as fh:
+            fh.write("4 qid:1 1:2.6 2:1 3:2.1 4:0 5:2 6:1.4 # relevant\n"
+                     "0 qid:1 1:0.5 2:1 3:2.3 4:0 5:2 6:5.6\n"
+                     "1 qid:3 1:1.2 2:1 3:2.9 4:0 5:2 6:1.9 # bad\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cache_roundtrip(self):
+        expected = qu.load_queries(self.filename, self.test_num_features,
+                                   preserve_comments=True)
+        built = qu.load_queries(self.filename, self.test_num_features,
+                                preserve_comments=True, cache=True)
+        cache_dir = qu.get_query_cache_dir(self.filename,
+                                           self.test_num_features)
+        self.assertTrue(os.path.exists(os.path.join(cache_dir, "meta.json")))
+        cached = qu.load_queries(self.filename, self.test_num_features,
+                                 preserve_comments=True, cache=True)
+        for queries in [built, cached]:
+            self.assertIsInstance(queries, qu.CachedQueries)
+            self.assertEqual(["1", "3"], queries.keys())
+            for qid in expected.keys():
+                e, o = expected[qid], queries[qid]
+                self.assertEqual(e.get_labels().tolist(),
+                                 o.get_labels().tolist())
+                self.assertEqual(e.get_comments(), o.get_comments())
+                self.assertTrue(np.array_equal(e.get_feature_vectors(),
+                                               o.get_feature_vectors()))
+
+    def test_cache_feature_matrix(self):
+        qu.load_queries(self.filename, self.test_num_features, cache=True)
+        cached = qu.load_queries(self.filename, self.test_num_features,
+                                 cache=True)
+        lazy = qu.LazyQueries(self.filename, self.test_num_features)
+        for queries in [cached, lazy]:
+            features, offsets = queries.get_feature_matrix()
+            self.assertEqual([0, 2, 3], offsets.tolist())
+            self.assertTrue(np.array_equal(features[2:3],
+                queries["3"].get_feature_vectors()))
+
+    def test_cache_invalidation(self):
+        qu.load_queries(self.filename, self.test_num_features, cache=True)
+        cache_dir = qu.get_query_cache_dir(self.filename,
+                                           self.test_num_features)
+        self.assertTrue(qu.is_query_cache_valid(cache_dir, self.filename,
+                                                self.test_num_features))
+        # comments were not stored, so they require a rebuild
+        self.assertFalse(qu.is_query_cache_valid(cache_dir, self.filename,
+            self.test_num_features, preserve_comments=True))
+        self.assertFalse(qu.is_query_cache_valid(cache_dir, self.filename, 5))
+        stat = os.stat(self.filename)
+        os.utime(self.filename, (stat.st_atime, stat.st_mtime + 10))
+        self.assertFalse(qu.is_query_cache_valid(cache_dir, self.filename,
+                                                 self.test_num_features))
+        queries = qu.load_queries(self.filename, self.test_num_features,
+                                  cache=True)
+        self.assertEqual(2, len(queries))
+        self.assertTrue(qu.is_query_cache_valid(cache_dir, self.filename,
+                                                self.test_num_features))
+
+    def test_cache_mmap(self):
+        queries = qu.load_queries(self.filename, self.test_num_features,
+                                  mmap=True)
+        self.assertTrue(queries.is_mmap())
+        features = queries["1"].get_feature_vectors()
+        self.assertIsInstance(features, np.memmap)
+        self.assertEqual([2.6, 1, 2.1, 0, 2, 1.4], features[0].tolist())
+        # writes stay private to this process
+        features[0, 0] = 100.
+        reloaded = qu.load_queries(self.filename, self.test_num_features,
+                                   mmap=True)
+        self.assertEqual(2.6, reloaded["1"].get_feature_vectors()[0, 0])
+        # pickling only transfers the cache location
+        pickled = cPickle.dumps(reloaded, cPickle.HIGHEST_PROTOCOL)
+        self.assertLess(len(pickled), 200)
+        unpickled = cPickle.loads(pickled)
+        self.assertTrue(unpickled.is_mmap())
+        self.assertEqual(["1", "3"], unpickled.keys())
+        self.assertEqual([1], unpickled["3"].get_labels().tolist())
+        self.assertTrue(np.array_equal(
+            reloaded["3"].get_feature_vectors(),
+            unpickled["3"].get_feature_vectors()))
+
+    def test_cache_feature_mismatch(self):
+        # the cache needs a fixed feature count, fall back to parsed queries
+        queries = qu.load_queries(self.filename, 4, cache=True)
+        self.assertNotIsInstance(queries, qu.CachedQueries)
+        self.assertEqual(2, len(queries))
+
+
+    def test_cache_normalized(self):
+        raw = qu.load_queries(self.filename, self.test_num_features,
+                              cache=True)
+        for normalize in ["minmax", "zscore"]:
+            built = qu.load_queries(self.filename, self.test_num_features,
+                                    cache=True, normalize=normalize)
+            cache_dir = qu.get_query_cache_dir(self.filename,
+                self.test_num_features, normalize)
+            self.assertTrue(qu.is_query_cache_valid(cache_dir,
+                self.filename, self.test_num_features, normalize=normalize))
+            cached = qu.load_queries(self.filename, self.test_num_features,
+                                     cache=True, normalize=normalize)
+            lazy = qu.load_queries(self.filename, self.test_num_features,
+                                   lazy=True, normalize=normalize)
+            for qid in raw.keys():
+                expected = qu.normalize_features(
+                    np.array(raw[qid].get_feature_vectors()), normalize)
+                for queries in [built, cached, lazy]:
+                    self.assertTrue(np.allclose(expected,
+                        queries[qid].get_feature_vectors()))
+        # the raw cache is kept next to the normalized ones
+        raw = qu.load_queries(self.filename, self.test_num_features,
+                              cache=True)
+        self.assertEqual(2.6, raw["1"].get_feature_vectors()[0, 0])
+        self.assertRaises(ValueError, qu.load_queries, self.filename,
+                          self.test_num_features, normalize="max")
+
+    def test_cache_float32(self):
+        queries = qu.load_queries(self.filename, self.test_num_features,
+                                  mmap=True, dtype="float32")
+        self.assertEqual(np.float32, queries["1"].get_feature_vectors().dtype)
+        cache_dir = qu.get_query_cache_dir(self.filename,
+            self.test_num_features, dtype=np.float32)
+        self.assertEqual(cache_dir, queries.get_cache_dir())
+        self.assertFalse(qu.is_query_cache_valid(cache_dir, self.filename,
+                                                 self.test_num_features))
+        lazy = qu.load_queries(self.filename, self.test_num_features,
+                               lazy=True, dtype="float32")
+        self.assertEqual(np.float32, lazy["3"].get_feature_vectors().dtype)
+        # float32 values are written with the shortest repr that round-trips
+        out = cStringIO.StringIO()
+        queries["3"].write_to(out)
+        self.assertEqual("1 qid:3 1:1.2 2:1.0 3:2.9 4:0.0 5:2.0 6:1.9 \n",
+                         out.getvalue())
+        self.assertRaises(ValueError, qu.load_queries, self.filename,
+                          self.test_num_features, dtype=int)
+
+
+class TestLazyQueries(unittest.TestCase):
+
+    def setUp(self):
+        self.test_num_features = 6
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data = _random_queries(self.test_num_features, num_queries=12,
+                                    max_docs=8)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, name):
+        filename = os.path.join(self.tmp_dir, name)
+        if name.endswith(".gz"):
+            fh = gzip.open(filename, "wb")
+        else:
+            fh = open(filename, "w")
+        fh.write(self.data)
+        fh.close()
+        return filename
+
+    def _assert_same(self, expected, observed):
+        self.assertEqual(expected.keys(), observed.keys())
+        for qid in expected.keys():
+            e, o = expected[qid], observed[qid]
+            self.assertEqual(e.get_labels().tolist(), o.get_labels().tolist())
+            self.assertEqual(e.get_comments(), o.get_comments())
+            self.assertTrue(np.array_equal(e.get_feature_vectors(),
+                                           o.get_feature_vectors()))
+
+    def test_lazy_text(self):
+        for name in ["train.txt", "train.txt.gz"]:
+            filename = self._write(name)
+            expected = qu.load_queries(filename, self.test_num_features, True)
+            lazy = qu.LazyQueries(filename, self.test_num_features, True,
+                                  max_queries=3)
+            self.assertEqual(0, lazy.get_materialized_count())
+            self.assertEqual(len(expected), len(lazy))
+            self._assert_same(expected, lazy)
+            self.assertEqual(3, lazy.get_materialized_count())
+
+    def test_lazy_cache(self):
+        filename = self._write("train.txt")
+        expected = qu.load_queries(filename, self.test_num_features,
+                                   cache=True)
+        lazy = qu.load_queries(filename, self.test_num_features, lazy=True)
+        self._assert_same(expected, lazy)
+        self.assertTrue(lazy.keeps_feature_matrix())
+        self.assertFalse(qu.LazyQueries(self._write("uncached.txt"),
+            self.test_num_features).keeps_feature_matrix())
+        unpickled = cPickle.loads(cPickle.dumps(lazy))
+        self.assertEqual(0, unpickled.get_materialized_count())
+        self._assert_same(expected, unpickled)
+
+    @unittest.skipUnless(qu.gzindex.is_available(), "libz is not available")
+    def test_lazy_gzip_index(self):
+        self.data = _random_queries(self.test_num_features, num_queries=40,
+                                    max_docs=40)
+        filename = self._write("train.txt.gz")
+        expected = qu.load_queries(filename, self.test_num_features, True)
+        # small span for several access points
+        index, gzip_index = qu.build_query_index(filename, gzip_span=4096)
+        self.assertEqual(expected.keys(), index.keys())
+        self.assertGreater(len(gzip_index), 1)
+        qu.write_query_index(filename, index, gzip_index)
+        stored_index, stored_gzip_index = qu.read_query_index(filename)
+        self.assertEqual(index, stored_index)
+        self.assertEqual(len(gzip_index), len(stored_gzip_index))
+        lazy = qu.LazyQueries(filename, self.test_num_features, True)
+        self._assert_same(expected, lazy)
+        # the index is rebuilt when the file changes
+        stat = os.stat(filename)
+        os.utime(filename, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(None, qu.read_query_index(filename))
+        self._assert_same(expected, qu.LazyQueries(filename,
+            self.test_num_features, True))
+        # but only stored if caching is enabled
+        self.assertEqual(None, qu.read_query_index(filename))
+        self._assert_same(expected, qu.LazyQueries(filename,
+            self.test_num_features, True, cache=True))
+        self.assertNotEqual(None, qu.read_query_index(filename))
+
+    def test_lazy_index_opt_in(self):
+        filename = self._write("train.txt")
+        index_file = qu.get_query_index_file(filename)
+        qu.load_queries(filename, self.test_num_features, lazy=True)
+        self.assertFalse(os.path.exists(index_file))
+        qu.load_queries(filename, self.test_num_features, lazy=True,
+                        cache=True)
+        self.assertTrue(os.path.exists(index_file))
+
+    def test_lazy_lru(self):
+        filename = self._write("train.txt")
+        lazy = qu.LazyQueries(filename, self.test_num_features, max_queries=2)
+        qids = lazy.keys()
+        first = lazy[qids[0]]
+        lazy[qids[1]]
+        # recently used queries are kept, older ones are discarded
+        self.assertIs(first, lazy[qids[0]])
+        lazy[qids[2]]
+        self.assertIs(first, lazy[qids[0]])
+        self.assertEqual(2, lazy.get_materialized_count())
+        self.assertRaises(ValueError, qu.LazyQueries, filename,
+                          self.test_num_features, max_queries=0)
+
+
+class TestQueryWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.test_num_features = 6
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _assert_same_queries(self, expected, observed):
+        self.assertEqual(expected.keys(), observed.keys())
+        for qid in expected.keys():
+            e, o = expected[qid], observed[qid]
+            self.assertEqual(e.get_labels().tolist(), o.get_labels().tolist())
+            self.assertEqual(e.get_comments(), o.get_comments())
+            self.assertTrue(np.array_equal(e.get_feature_vectors(),
+                                           o.get_feature_vectors()))
+
+    def test_writer_roundtrip(self):
+        data = _random_queries(self.test_num_features)
+        expected = qu.BlockQueryStream(cStringIO.StringIO(data),
+            self.test_num_features, preserve_comments=True).read_all()
+        out = cStringIO.StringIO()
+        writer = qu.QueryWriter(out)
+        self.assertEqual(len(expected), writer.write_all(expected.values()))
+        observed = qu.BlockQueryStream(cStringIO.StringIO(out.getvalue()),
+            self.test_num_features, preserve_comments=True).read_all()
+        self._assert_same_queries(expected, observed)
+
+    def test_writer_sparse_gzip(self):
+        query = qu.Query("7", np.array([[0., 1.5, 0.], [2., 0., 0.25]]),
+                         labels=np.array([1, 0]))
+        filename = os.path.join(self.tmp_dir, "out.txt.gz")
+        with qu.QueryWriter(filename, sparse=True) as writer:
+            writer.write(query)
+        self.assertEqual("1 qid:7 2:1.5 \n0 qid:7 1:2.0 3:0.25 \n",
+                         gzip.open(filename).read())
+        self.assertRaises(ValueError, qu.QueryWriter, filename)
+        filename = os.path.join(self.tmp_dir, "dense.txt")
+        self.assertEqual(1, qu.write_queries(filename, [query]))
+        observed = qu.load_queries(filename, 3)
+        self.assertTrue(np.array_equal(query.get_feature_vectors(),
+                                       observed["7"].get_feature_vectors()))
+
+
+class TestParallelQueries(unittest.TestCase):
+
+    def setUp(self):
+        self.test_num_features = 6
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_parallel_parity(self):
+        data = _random_queries(self.test_num_features, num_queries=40,
+                               max_docs=10)
+        for name in ["train.txt", "train.txt.gz"]:
+            filename = os.path.join(self.tmp_dir, name)
+            fh = gzip.open(filename, "wb") if name.endswith(".gz") \
+                else open(filename, "w")
+            fh.write(data)
+            fh.close()
+            expected = qu.load_queries(filename, self.test_num_features, True)
+            observed = qu.load_queries(filename, self.test_num_features, True,
+                                       processes=3)
+            self.assertIsInstance(observed, qu.ParallelQueries)
+            self.assertEqual(expected.keys(), observed.keys())
+            for qid in expected.keys():
+                e, o = expected[qid], observed[qid]
+                self.assertEqual(e.get_labels().tolist(),
+                                 o.get_labels().tolist())
+                self.assertEqual(e.get_comments(), o.get_comments())
+                self.assertTrue(np.array_equal(e.get_feature_vectors(),
+                                               o.get_feature_vectors()))
+
+    def test_query_boundaries(self):
+        filename = os.path.join(self.tmp_dir, "train.txt")
+        with open(filename, "w") as fh:
+            fh.write(_random_queries(self.test_num_features, num_queries=30,
+                                     max_docs=10))
+        boundaries = qu._find_query_boundaries(filename, 8)
+        self.assertEqual(0, boundaries[0])
+        self.assertEqual(os.path.getsize(filename), boundaries[-1])
+        self.assertEqual(sorted(set(boundaries)), boundaries)
+        with open(filename) as fh:
+            data = fh.read()
+        for boundary in boundaries[1:-1]:
+            # each range starts at a new query
+            self.assertEqual("\n", data[boundary - 1])
+            previous = data[:boundary - 1].rsplit("\n", 1)[-1]
+            line = data[boundary:].split("\n", 1)[0]
+            self.assertTrue(line.startswith("# qid ") or
+                qu._get_line_qid(line) != qu._get_line_qid(previous))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -17,9 +17,11 @@ import unittest
 import sys
 import os
 
+import numpy as np
+
 sys.path.insert(0, os.path.abspath('..'))
 
-import utils
+from lerot import utils
 
 
 class TestUtils(unittest.TestCase):
@@ -65,6 +67,46 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(utils.rank(scores, reverse=True, ties="last"),
                          [5, 2, 4, 3, 0, 1])
 
+    def testRankMatchesTupleSort(self):
+        rnd = np.random.RandomState(3)
+        for _ in range(20):
+            scores = rnd.randint(0, 5, rnd.randint(1, 30)).astype(float)
+            n = len(scores)
+            for ties, keys in [("first", range(n - 1, -1, -1)),
+                               ("last", range(n))]:
+                for reverse in [False, True]:
+                    ix = sorted(zip(scores, keys, range(n)), reverse=reverse)
+                    expected = [0] * n
+                    for r, (_, _, i) in enumerate(ix):
+                        expected[i] = r
+                    self.assertEqual(expected,
+                                     utils.rank(scores, ties, reverse))
+        self.assertRaises(Exception, utils.rank, [1, 2], "middle")
+
+    def testRankOrder(self):
+        rnd = np.random.RandomState(5)
+        for _ in range(20):
+            scores = rnd.randint(0, 4, rnd.randint(1, 40))
+            for ties in ["first", "last"]:
+                ranks = utils.rank(scores, ties)
+                order = utils.rank_order(scores, ties)
+                self.assertEqual(np.argsort(ranks)[::-1].tolist(),
+                                 order.tolist())
+                for k in [0, 1, 3, len(scores), len(scores) + 2]:
+                    self.assertEqual(order[:k].tolist(),
+                        utils.rank_order(scores, ties, k).tolist())
+            for k in [1, 3, 10]:
+                top = utils.rank_order(scores, "random", k)
+                # the top k has the k highest scores, in descending order
+                self.assertEqual(sorted(scores, reverse=True)[:k],
+                                 scores[top].tolist())
+                self.assertEqual(len(set(top)), len(top))
+        # every order of tied elements is possible with random ties
+        orders = set(tuple(utils.rank_order([1, 2, 2, 2], "random", 2))
+                     for _ in range(200))
+        self.assertEqual(set([(1, 2), (1, 3), (2, 1), (2, 3), (3, 1),
+                              (3, 2)]), orders)
+
 
 if __name__ == '__main__':
     unittest.main()
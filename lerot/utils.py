@@ -22,7 +22,6 @@ from importlib import import_module
 from numpy import dot, sqrt
 import numpy as np
 from scipy.linalg import norm
-from random import sample
 
 
 def string_to_boolean(string):
@@ -74,19 +73,64 @@ def split_arg_str(arg_str):
     return s
 
 
-def rank(x, ties, reverse=False):
-    n = len(x)
+RANK_TIES = ("first", "last", "random")
+
+
+def _tie_keys(n, ties):
+    """Secondary sort keys that break ties between equal values: with
+    "first" earlier elements get the higher rank, with "last" later ones,
+    with "random" a random permutation decides."""
     if ties == "first":
-        ix = zip(x, reversed(range(n)), range(n))
+        return np.arange(n - 1, -1, -1)
     elif ties == "last":
-        ix = zip(x, range(n), range(n))
+        return np.arange(n)
     elif ties == "random":
-        ix = zip(x, sample(range(n), n), range(n))
+        return np.random.permutation(n)
+    raise Exception("Unknown method for breaking ties: \"%s\"" % ties)
+
+
+def rank(x, ties, reverse=False):
+    """Returns the rank of each element of x: its position when x is sorted
+    in ascending order (descending if reverse), with ties broken by ties
+    (see RANK_TIES)."""
+    x = np.asarray(x)
+    order = np.lexsort((_tie_keys(len(x), ties), x))
+    if reverse:
+        order = order[::-1]
+    ranks = np.empty(len(x), dtype=np.int64)
+    ranks[order] = np.arange(len(x))
+    return ranks.tolist()
+
+
+def rank_order(x, ties, k=None):
+    """Returns the indexes of x from the highest to the lowest rank (see
+    rank), i.e., sorted by descending value. If k is given, only the k
+    highest ranked indexes are returned; only the elements that can be among
+    those are sorted. For "first" and "last" ties the result is always the
+    first k elements of the full order."""
+    x = np.asarray(x)
+    n = len(x)
+    if k is None or k >= n:
+        return np.lexsort((_tie_keys(n, ties), x))[::-1]
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    # all elements with at least the k-th highest value, including all
+    # elements tied with it
+    threshold = np.partition(x, n - k)[n - k]
+    candidates = np.flatnonzero(x >= threshold)
+    if ties == "random":
+        keys = np.random.permutation(len(candidates))
     else:
-        raise Exception("Unknown method for breaking ties: \"%s\"" % ties)
-    ix.sort(reverse=reverse)
-    indexes = [i for _, _, i in ix]
-    return [i for _, i in sorted(zip(indexes, range(n)))]
+        keys = _tie_keys(n, ties)[candidates]
+    order = np.lexsort((keys, x[candidates]))[::-1][:k]
+    return candidates[order]
+
+
+def split_by_offsets(x, offsets):
+    """Split x (along its first axis) into the segments x[offsets[i]:
+    offsets[i + 1]], e.g. the scores of a concatenated feature matrix into
+    per-query scores. The segments are views of x."""
+    return np.split(x, np.asarray(offsets[1:-1], dtype=np.int64))
 
 
 def get_cosine_similarity(v1, v2):
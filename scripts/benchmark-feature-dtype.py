@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare scoring throughput and NDCG of float64 and float32 features.
+
+Uses the queries in input_file if given, otherwise random queries."""
+
+try:
+    from include import *
+except:
+    pass
+import argparse
+import time
+import numpy as np
+from lerot.query import Query, load_queries
+from lerot.evaluation.NdcgEval import NdcgEval
+from lerot.ranker.model.Linear import Linear
+from lerot.ranker.model.OneHiddenLayer import OneHiddenLayer
+
+
+class FixedWeights:
+    """Minimal solution for AbstractEval: a model with fixed weights."""
+
+    def __init__(self, model, w):
+        self.model = model
+        self.w = w
+
+    def score(self, features):
+        return self.model.score(features, self.w)
+
+
+def random_queries(num_queries, num_docs, feature_count, dtype):
+    rnd = np.random.RandomState(42)
+    queries = []
+    for qid in range(num_queries):
+        features = rnd.rand(num_docs, feature_count).astype(dtype)
+        labels = rnd.randint(0, 5, num_docs)
+        queries.append(Query(str(qid), features, labels))
+    return queries
+
+
+def benchmark(model, w, queries, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        for query in queries:
+            model.score(query.get_feature_vectors(), w)
+    elapsed = time.time() - start
+    num_docs = sum(query.get_document_count() for query in queries)
+    evaluation = NdcgEval()
+    ndcg = np.mean([evaluation.evaluate_one(FixedWeights(model, w), query,
+                                            ties="first")
+                    for query in queries])
+    return num_docs * repeat / elapsed, ndcg
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python benchmark-feature-dtype.py",
+        description=__doc__)
+    parser.add_argument("input_file", nargs="?")
+    parser.add_argument("-f", "--feature_count", type=int, default=136)
+    parser.add_argument("-q", "--num_queries", type=int, default=200)
+    parser.add_argument("-d", "--num_docs", type=int, default=1000,
+        help="Documents per random query.")
+    parser.add_argument("-r", "--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    results = {}
+    for dtype in ["float64", "float32"]:
+        if args.input_file:
+            queries = load_queries(args.input_file, args.feature_count,
+                                   dtype=dtype).values()
+        else:
+            queries = random_queries(args.num_queries, args.num_docs,
+                                     args.feature_count, dtype)
+        memory = sum(query.get_feature_vectors().nbytes for query in queries)
+        for model in [Linear(args.feature_count),
+                      OneHiddenLayer(args.feature_count)]:
+            w = np.random.RandomState(7).randn(model.get_feature_count())
+            docs_per_sec, ndcg = benchmark(model, w, queries, args.repeat)
+            name = model.__class__.__name__
+            results[name, dtype] = (docs_per_sec, ndcg)
+            print "%-15s %-8s %8.1f MB %12.0f docs/s  NDCG %.6f" % (name,
+                dtype, memory / 1e6, docs_per_sec, ndcg)
+    for name in ["Linear", "OneHiddenLayer"]:
+        (speed64, ndcg64) = results[name, "float64"]
+        (speed32, ndcg32) = results[name, "float32"]
+        print "%-15s float32 speedup %.2fx, NDCG difference %.2g" % (name,
+            speed32 / speed64, abs(ndcg32 - ndcg64))
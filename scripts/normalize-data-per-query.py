@@ -23,8 +23,8 @@ except:
     pass
 import argparse
 import gzip
-import numpy as np
-from query import QueryStream
+from lerot.query import (BlockQueryStream, QueryWriter, normalize_queries,
+    QUERY_NORMALIZATIONS)
 
 
 if __name__ == "__main__":
@@ -35,6 +35,10 @@ if __name__ == "__main__":
     parser.add_argument("output_file")
     parser.add_argument("feature_count", type=int,
         help="The number of features per document.")
+    parser.add_argument("-m", "--method", default="minmax",
+        choices=QUERY_NORMALIZATIONS,
+        help="How to normalize the features of each query (default: "
+        "minmax).")
     args = parser.parse_args()
     print "Reading data from %s, writing normalized data to %s." % (
         args.input_file, args.output_file)
@@ -44,37 +48,17 @@ if __name__ == "__main__":
         input_fh = gzip.open(args.input_file)
     else:
         input_fh = open(args.input_file) 
-    qs = QueryStream(input_fh, args.feature_count, preserve_comments=True)
+    qs = BlockQueryStream(input_fh, args.feature_count,
+                          preserve_comments=True)
 
     # open output file
-    if os.path.exists(args.output_file):
-        raise ValueError("Target file already exists: %s" % args.output_file)
-    if args.output_file.endswith(".gz"):
-        output_fh = gzip.open(args.output_file, "w")
-    else:
-        output_fh = open(args.output_file, "w")
+    writer = QueryWriter(args.output_file)
 
-    # process queries (only keeps one query in memory at a time, safes memory,
-    # but not time)
+    # process queries (only keeps one query in memory at a time)
     query_count = 0
-    for query in qs:
-        # find min and max values per feature
-        feature_vectors = query.get_feature_vectors()
-        min_per_feature = np.zeros(args.feature_count)
-        max_per_feature = np.zeros(args.feature_count)
-        for feature in range(args.feature_count):
-            min_per_feature[feature] = np.min(feature_vectors[:,feature])
-            max_per_feature[feature] = np.max(feature_vectors[:,feature])
-        for document in range(query.get_document_count()):
-            for feature in range(args.feature_count):
-                if min_per_feature[feature] == max_per_feature[feature]:
-                    feature_vectors[document][feature] = .0
-                else:
-                    feature_vectors[document][feature] = ((
-                        feature_vectors[document][feature] -
-                        min_per_feature[feature]) /
-                        (max_per_feature[feature] - min_per_feature[feature]))
-        query.write_to(output_fh)
+    for query in normalize_queries(qs, args.method):
+        writer.write(query)
         query_count += 1
+    writer.close()
 
     print "Finished processing %d queries." % query_count
\ No newline at end of file
@@ -51,19 +51,18 @@ if __name__ == "__main__":
         input_fh = gzip.open(args.input_file)
     else:
         input_fh = open(args.input_file) 
-    qs = QueryStream(input_fh, args.feature_count, preserve_comments=True)
+    qs = BlockQueryStream(input_fh, args.feature_count,
+                          preserve_comments=True)
 
-    # process queries (only keeps one query in memory at a time, safes memory,
-    # but not time)
+    # process queries (only keeps one query in memory at a time)
     query_count = 0
     for query in qs:
         # open output file
         output_file = os.path.join(args.output_path,
             "query-%s.txt.gz" % query.get_qid())
-        if os.path.exists(output_file):
-            raise ValueError("File already exists: %s" % output_file)
-        output_fh = gzip.open(output_file, "w")
-        query.write_to(output_fh)
+        writer = QueryWriter(output_file)
+        writer.write(query)
+        writer.close()
         query_count += 1
 
     print "Finished processing %d queries." % query_count
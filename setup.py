@@ -33,8 +33,8 @@ setup(
     packages=(['lerot']
               + [('lerot.%s' % sub)
                  for sub in ('analysis', 'comparison', 'environment',
-                             'evaluation', 'experiment', 'ranker',
-                             'ranker.model', 'retrieval_system')]),
+                             'evaluation', 'experiment', 'querysampler',
+                             'ranker', 'ranker.model', 'retrieval_system')]),
     long_description=open('README.rst', 'r').read(),
     license = "GNU Lesser General Public License",
     scripts=['scripts/learning-experiment.py',